@@ -1,8 +1,29 @@
+from django import forms
 from django.contrib import admin
+from .disponibilidad import ESTADOS_OCUPAN
 from .models import Cita, ConfiguracionChatbotCitas
+from .transiciones import cambiar_estado_citas
 
 # Register your models here.
 
+class CitaListadoForm(forms.ModelForm):
+    """
+    Fila del listado (solo 'estado'). Django no valida cita_hueco_unico sin 'fecha' en el
+    formulario, así que se comprueba aquí: reactivar una cita cuyo hueco ya tiene otra
+    activa es un error de la fila y no se guarda ni se registra nada.
+    """
+
+    def clean(self):
+        cleaned_data = super().clean()
+        estado = cleaned_data.get('estado')
+        cita = self.instance
+        if estado in ESTADOS_OCUPAN and cita.fecha and (
+            Cita.objects.filter(fecha=cita.fecha, estado__in=ESTADOS_OCUPAN).exclude(pk=cita.pk).exists()
+        ):
+            self.add_error('estado', "Ya hay otra cita activa en ese hueco.")
+        return cleaned_data
+
+
 @admin.register(Cita)
 class CitaAdmin(admin.ModelAdmin):
     list_display= ('usuario', 'fecha', 'estado', 'observaciones')
@@ -27,6 +48,21 @@ class CitaAdmin(admin.ModelAdmin):
         ('Horario y Estado', {'fields': ('fecha', 'estado')}),
     )
 
+    def get_queryset(self, request):
+        # El usuario en la misma consulta del listado (sin N+1)
+        return super().get_queryset(request).select_related('usuario')
+
+    def get_changelist_form(self, request, **kwargs):
+        return super().get_changelist_form(request, form=CitaListadoForm, **kwargs)
+
+    def save_model(self, request, obj, form, change):
+        # Si solo cambia el estado (la columna editable del listado) basta un UPDATE:
+        # el servicio de transiciones actualiza la agenda y programa los correos igual que save()
+        if change and form.changed_data == ['estado']:
+            cambiar_estado_citas([obj.pk], obj.estado)
+        else:
+            super().save_model(request, obj, form, change)
+
 @admin.register(ConfiguracionChatbotCitas)
 class ConfiguracionCitasAdmin(admin.ModelAdmin):
     list_display = ('titulo',)
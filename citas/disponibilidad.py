@@ -0,0 +1,235 @@
+import uuid
+from bisect import bisect_left, insort
+from datetime import datetime, time, timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from .models import Cita
+
+# Horario comercial: de lunes a viernes, franjas [inicio, fin) con citas de una hora en punto
+FRANJAS = [(10, 14), (17, 21)]
+HORAS_CITA = [hora for inicio, fin in FRANJAS for hora in range(inicio, fin)]
+
+# Estados que ocupan el hueco en la agenda
+ESTADOS_OCUPAN = ['PENDIENTE', 'CONFIRMADA']
+
+# Hasta dónde se buscan huecos libres como máximo (y se cargan citas para ello)
+DIAS_BUSQUEDA = 30
+# Hasta cuántos días vista se puede consultar la agenda (la API no acepta un 'desde' posterior)
+DIAS_ANTELACION = 365
+
+# Ocupación de cada día en la caché: un entero con un bit por hueco de HORAS_CITA
+CLAVE_MAPA = 'citas:ocupacion:{dia}'
+# Versión de la agenda: cambia con cada cita guardada (ETag y Last-Modified de la API)
+CLAVE_VERSION = 'citas:agenda:version'
+
+
+def en_horario(fecha, hora, minutos):
+    return fecha.weekday() < 5 and minutos == 0 and any(inicio <= hora < fin for inicio, fin in FRANJAS)
+
+
+def es_hora_de_cita(momento):
+    """True si el momento (aware) es el inicio de un hueco del horario comercial."""
+    local = timezone.localtime(momento)
+    return local.second == 0 and local.microsecond == 0 and en_horario(local.date(), local.hour, local.minute)
+
+
+def huecos_del_dia(dia):
+    """Inicios (aware) de todos los huecos de un día; ninguno en fin de semana."""
+    if dia.weekday() >= 5:
+        return []
+    zona = timezone.get_current_timezone()
+    return [timezone.make_aware(datetime.combine(dia, time(hora)), zona) for hora in HORAS_CITA]
+
+
+def primer_hueco_desde(momento):
+    """Redondea hacia arriba a la siguiente hora en punto (las citas empiezan a en punto)."""
+    local = timezone.localtime(momento)
+    redondeado = local.replace(minute=0, second=0, microsecond=0)
+    return redondeado if redondeado == local else redondeado + timedelta(hours=1)
+
+
+def bit_del_hueco(momento):
+    """Bit del hueco en el mapa de su día (None si no es un hueco del horario)."""
+    hora = timezone.localtime(momento).hour
+    return 1 << HORAS_CITA.index(hora) if hora in HORAS_CITA else None
+
+
+def _inicio_del_dia(dia):
+    return timezone.make_aware(datetime.combine(dia, time.min), timezone.get_current_timezone())
+
+
+def calcular_mapas(dias):
+    """Mapas de ocupación de los días indicados leídos de la base de datos, en una sola consulta."""
+    mapas = {dia: 0 for dia in dias}
+    if not mapas:
+        return mapas
+    fechas = Cita.objects.filter(
+        estado__in=ESTADOS_OCUPAN,
+        fecha__gte=_inicio_del_dia(min(mapas)),
+        fecha__lt=_inicio_del_dia(max(mapas) + timedelta(days=1)),
+    ).values_list('fecha', flat=True)
+    for fecha in fechas:
+        dia = timezone.localtime(fecha).date()
+        # Solo cuentan las citas que empiezan en un hueco del horario
+        if dia in mapas and es_hora_de_cita(fecha):
+            mapas[dia] |= bit_del_hueco(fecha)
+    return mapas
+
+
+def mapas_ocupacion(dias):
+    """
+    Mapas de ocupación de varios días: los que están en la caché se leen de ahí y los
+    que faltan se calculan juntos y se guardan para las siguientes consultas.
+    """
+    dias = list(dias)
+    claves = {CLAVE_MAPA.format(dia=dia.isoformat()): dia for dia in dias}
+    en_cache = cache.get_many(list(claves))
+    mapas = {claves[clave]: mapa for clave, mapa in en_cache.items()}
+    faltan = [dia for dia in dias if dia not in mapas]
+    if faltan:
+        nuevos = calcular_mapas(faltan)
+        cache.set_many(
+            {CLAVE_MAPA.format(dia=dia.isoformat()): mapa for dia, mapa in nuevos.items()},
+            getattr(settings, 'CITAS_OCUPACION_CACHE_TIMEOUT', 60 * 60 * 24),
+        )
+        mapas.update(nuevos)
+    return mapas
+
+
+def version_agenda():
+    """
+    {'version': ..., 'modificada': timestamp} de la agenda. Si la caché no tiene
+    ninguna (arranque en frío o expulsión), se genera una nueva.
+    """
+    version = cache.get(CLAVE_VERSION)
+    if version is None:
+        version = {'version': uuid.uuid4().hex, 'modificada': timezone.now().timestamp()}
+        # add() evita pisar la versión que otro worker haya creado a la vez
+        if not cache.add(CLAVE_VERSION, version, None):
+            version = cache.get(CLAVE_VERSION, version)
+    return version
+
+
+def marcar_agenda_modificada():
+    cache.set(CLAVE_VERSION, {'version': uuid.uuid4().hex, 'modificada': timezone.now().timestamp()}, None)
+
+
+def invalidar_dias(dias):
+    """Descarta los mapas guardados de esos días (se recalculan en la siguiente lectura)."""
+    cache.delete_many([CLAVE_MAPA.format(dia=dia.isoformat()) for dia in dias])
+    marcar_agenda_modificada()
+
+
+def refrescar_dias(dias):
+    """Vuelve a calcular los mapas de esos días y los deja en la caché."""
+    invalidar_dias(dias)
+    mapas_ocupacion(dias)
+
+
+def horas_ocupadas(dia, mapa):
+    """Inicios (aware) de los huecos marcados en el mapa de un día."""
+    return [momento for momento in huecos_del_dia(dia) if mapa & bit_del_hueco(momento)]
+
+
+def esta_libre(momento):
+    """True si el momento es un hueco del horario comercial y nadie lo tiene reservado."""
+    if not es_hora_de_cita(momento):
+        return False
+    dia = timezone.localtime(momento).date()
+    return not mapas_ocupacion([dia])[dia] & bit_del_hueco(momento)
+
+
+class Agenda:
+    """
+    Huecos ocupados de un intervalo [desde, hasta), sacados de los mapas de ocupación
+    de cada día y guardados ordenados: cada comprobación es una búsqueda binaria, así
+    que no crece con el tamaño de la agenda. Lo libre es el horario comercial menos lo ocupado.
+    """
+
+    def __init__(self, desde, hasta, ocupadas=()):
+        self.desde = desde
+        self.hasta = hasta
+        self.ocupadas = sorted(ocupadas)
+
+    @classmethod
+    def cargar(cls, desde=None, dias=DIAS_BUSQUEDA, hasta=None):
+        desde = desde or timezone.now()
+        hasta = hasta or desde + timedelta(days=dias)
+        primero = timezone.localtime(desde).date()
+        ultimo = timezone.localtime(hasta).date()
+        mapas = mapas_ocupacion(primero + timedelta(days=i) for i in range((ultimo - primero).days + 1))
+        ocupadas = [
+            momento
+            for dia, mapa in sorted(mapas.items()) if mapa
+            for momento in horas_ocupadas(dia, mapa) if desde <= momento < hasta
+        ]
+        return cls(desde, hasta, ocupadas)
+
+    def __contains__(self, momento):
+        return self.desde <= momento < self.hasta
+
+    def ocupada(self, momento):
+        i = bisect_left(self.ocupadas, momento)
+        return i < len(self.ocupadas) and self.ocupadas[i] == momento
+
+    def esta_libre(self, momento):
+        if momento not in self:
+            return esta_libre(momento)
+        return es_hora_de_cita(momento) and not self.ocupada(momento)
+
+    def ocupar(self, momento):
+        if momento in self and not self.ocupada(momento):
+            insort(self.ocupadas, momento)
+
+    def libres_del_dia(self, dia):
+        return [momento for momento in huecos_del_dia(dia) if momento in self and not self.ocupada(momento)]
+
+    def proximos_libres(self, momento=None, n=3):
+        """Los n primeros huecos libres a partir de 'momento' (incluido) dentro de la agenda."""
+        inicio = primer_hueco_desde(max(momento or self.desde, self.desde))
+        libres = []
+        dia = timezone.localtime(inicio).date()
+        while len(libres) < n:
+            huecos = huecos_del_dia(dia)
+            if huecos and huecos[0] >= self.hasta:
+                break
+            libres += [h for h in huecos if h >= inicio and h in self and not self.ocupada(h)][:n - len(libres)]
+            dia += timedelta(days=1)
+        return libres
+
+
+def reservar_cita(usuario, momento, observaciones=''):
+    """
+    Crea la cita PENDIENTE si el hueco sigue libre; devuelve None si otra reserva se
+    adelantó. Quien decide es la restricción única de la base de datos, no una
+    comprobación previa, así que dos peticiones simultáneas nunca obtienen el mismo hueco.
+    """
+    try:
+        with transaction.atomic():
+            return Cita.objects.create(usuario=usuario, fecha=momento, observaciones=observaciones, estado='PENDIENTE')
+    except IntegrityError:
+        return None
+
+
+def proximos_libres(momento=None, n=3, dias=DIAS_BUSQUEDA):
+    """Los n siguientes huecos libres desde 'momento' (nunca en el pasado)."""
+    ahora = timezone.now()
+    desde = max(momento or ahora, ahora)
+    return Agenda.cargar(desde, dias).proximos_libres(desde, n)
+
+
+def huecos_libres_por_dia(primero, ultimo):
+    """[(día, [huecos libres]), ...] de primero a ultimo (incluidos), sin huecos ya pasados."""
+    desde = max(_inicio_del_dia(primero), timezone.now())
+    hasta = _inicio_del_dia(ultimo + timedelta(days=1))
+    agenda = Agenda.cargar(desde, hasta=hasta)
+    return [
+        (primero + timedelta(days=i), agenda.libres_del_dia(primero + timedelta(days=i)))
+        for i in range((ultimo - primero).days + 1)
+    ]
+
+
+def formatear_hueco(momento):
+    return timezone.localtime(momento).strftime("%d/%m/%Y a las %H:%M")
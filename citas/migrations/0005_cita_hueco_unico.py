@@ -0,0 +1,43 @@
+# Generated by Django 5.2.7 on 2026-10-18 11:00
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def comprobar_huecos_duplicados(apps, schema_editor):
+    """
+    Si ya hay dos citas activas en el mismo hueco la restricción no se puede crear. No se
+    decide aquí cuál anular: la migración se detiene y lista los conflictos para que se
+    resuelvan a mano (cancelando o moviendo citas desde el admin) antes de volver a migrar.
+    """
+    Cita = apps.get_model('citas', 'Cita')
+    por_hueco = {}
+    for cita_id, fecha in (
+        Cita.objects.filter(estado__in=['PENDIENTE', 'CONFIRMADA'], fecha__isnull=False)
+        .order_by('fecha', 'id').values_list('id', 'fecha')
+    ):
+        por_hueco.setdefault(fecha, []).append(cita_id)
+    conflictos = {fecha: ids for fecha, ids in por_hueco.items() if len(ids) > 1}
+    if conflictos:
+        lineas = "\n".join(f"- {timezone.localtime(fecha):%Y-%m-%d %H:%M}: citas {', '.join(map(str, ids))}" for fecha, ids in conflictos.items())
+        raise RuntimeError(
+            "Hay citas pendientes o confirmadas que comparten hueco. Deja una sola activa "
+            f"en cada uno y vuelve a ejecutar migrate:\n{lineas}"
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citas', '0004_cita_estado_fecha_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(comprobar_huecos_duplicados, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='cita',
+            constraint=models.UniqueConstraint(condition=models.Q(('estado__in', ['PENDIENTE', 'CONFIRMADA'])), fields=('fecha',), name='cita_hueco_unico', violation_error_message='Ya hay una cita pendiente o confirmada en esa fecha y hora.'),
+        ),
+    ]
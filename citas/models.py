@@ -1,9 +1,14 @@
 from django.db import models
 from django.conf import settings
+from django.dispatch import Signal
+from nutrisur.seguimiento import CamposSeguidosMixin
+
+# Se envía al guardar una cita existente cuyo estado ha cambiado: (sender, instance, anterior, nuevo)
+cita_estado_cambiado = Signal()
 
 # Create your models here.
 
-class Cita(models.Model):
+class Cita(CamposSeguidosMixin, models.Model):
     
     usuario = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -26,6 +31,26 @@ class Cita(models.Model):
     )
 
     observaciones = models.TextField(blank=True, null=True)
+
+    # Fecha y estado con los que se cargó: transiciones de estado y mapas de ocupación sin otra consulta
+    CAMPOS_SEGUIDOS = ('fecha', 'estado')
+    SENALES_CAMBIO = {'estado': cita_estado_cambiado}
+
+    class Meta:
+        indexes = [
+            # Huecos ocupados de un intervalo: estado__in=[PENDIENTE, CONFIRMADA] + rango de fechas
+            models.Index(fields=['estado', 'fecha'], name='cita_estado_fecha_idx'),
+        ]
+        constraints = [
+            # Un hueco solo puede tener una cita activa: la base de datos rechaza la segunda
+            # reserva aunque lleguen a la vez (las canceladas no cuentan)
+            models.UniqueConstraint(
+                fields=['fecha'],
+                condition=models.Q(estado__in=['PENDIENTE', 'CONFIRMADA']),
+                name='cita_hueco_unico',
+                violation_error_message="Ya hay una cita pendiente o confirmada en esa fecha y hora.",
+            ),
+        ]
     
     @property
     def cliente_nombre(self):
@@ -1,17 +1,32 @@
-from django.db.models.signals import post_save, pre_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
-from django.core.mail import send_mail
 from django.conf import settings
 from django.utils import timezone 
-from .models import Cita
-import threading
+from .models import Cita, cita_estado_cambiado
+from .disponibilidad import ESTADOS_OCUPAN, invalidar_dias, refrescar_dias
+from notificaciones.cola import encolar_correos
+from notificaciones.eventos import al_confirmar_en_lote
+
+
+def citas_para_aviso(ids):
+    """Las citas tal y como quedaron al confirmar la transacción, con su cliente (una consulta)."""
+    return Cita.objects.filter(pk__in=ids).select_related('usuario').order_by('id')
+
 
 @receiver(post_save, sender=Cita)
 def avisar_nueva_cita(sender, instance, created, **kwargs):
     # Verificamos si la cita está en un estado que requiera aviso (Pendiente o Confirmada)
     # y evitamos enviar correo si está en borrador o cancelada.
+    # El aviso se prepara al confirmar la transacción, una vez por cita
     if instance.estado in ['PENDIENTE']:
-        
+        al_confirmar_en_lote(notificar_nuevas_citas, [instance.id])
+
+
+def notificar_nuevas_citas(cita_ids):
+    """Avisos al administrador de varias citas nuevas a la vez."""
+    correos = []
+    for instance in citas_para_aviso(cita_ids).filter(estado__in=['PENDIENTE']):
+
         # Formateamos la fecha para que sea legible (Día/Mes/Año Hora:Minuto)
         fecha_legible = "Fecha por confirmar"
         if instance.fecha:
@@ -39,35 +54,26 @@ def avisar_nueva_cita(sender, instance, created, **kwargs):
         Gestionar cita aquí:
         https://nutrisur.onrender.com/admin/citas/cita/{instance.id}/change/
         """
-        
-        def enviar_al_admin():
-            try:
-                print(f"📩 Hilo Citas: Avisando al admin de nueva cita de {instance.cliente_nombre}...")
-                send_mail(asunto, mensaje, settings.DEFAULT_FROM_EMAIL, [settings.EMAIL_HOST_USER])
-                print("✅ Hilo Citas: Correo al admin enviado.")
-            except Exception as e:
-                print(f"Error enviando correo cita: {e}")
-                
-        threading.Thread(target=enviar_al_admin).start()
-
-            
-            
-@receiver(pre_save, sender=Cita)
-def detectar_confirmacion_cita(sender, instance, **kwargs):
-    if instance.pk: # Solo si es una edición (la cita ya existía)
-        try:
-            cita_antigua = Cita.objects.get(pk=instance.pk)
-            # Si ANTES no estaba confirmada Y AHORA sí lo está
-            if cita_antigua.estado != 'CONFIRMADA' and instance.estado == 'CONFIRMADA':
-                instance._enviar_confirmacion = True # Ponemos la bandera
-        except Cita.DoesNotExist:
-            pass
 
-@receiver(post_save, sender=Cita)
-def enviar_email_confirmacion(sender, instance, **kwargs):
-    # Verificamos la bandera
-    if getattr(instance, '_enviar_confirmacion', False):
-        
+        # Un aviso por cita y fecha: guardarla otra vez sin cambios no lo repite
+        correos.append({'asunto': asunto, 'cuerpo': mensaje, 'destinatarios': [settings.EMAIL_HOST_USER],
+                        'clave': f"cita:{instance.id}:nueva:{instance.fecha.isoformat() if instance.fecha else ''}"})
+
+    encolar_correos(correos)
+
+
+@receiver(cita_estado_cambiado, sender=Cita)
+def avisar_confirmacion_cita(sender, instance, anterior, nuevo, **kwargs):
+    # Antes NO estaba confirmada y ahora SÍ (el estado anterior lo recuerda el modelo, sin consultas)
+    if nuevo == 'CONFIRMADA':
+        al_confirmar_en_lote(notificar_citas_confirmadas, [instance.id])
+
+
+def notificar_citas_confirmadas(cita_ids):
+    """Avisos al cliente de cita confirmada de varias citas a la vez."""
+    correos = []
+    for instance in citas_para_aviso(cita_ids).filter(estado='CONFIRMADA'):
+
         fecha_str = "Fecha por definir"
         if instance.fecha:
             fecha_local = timezone.localtime(instance.fecha)
@@ -88,13 +94,42 @@ def enviar_email_confirmacion(sender, instance, **kwargs):
         
         ¡Te esperamos!
         """
-        
-        def enviar_al_cliente():
-            try:
-                print(f"📩 Hilo Citas: Confirmando cita a {instance.cliente_email}...")
-                send_mail(asunto, mensaje, settings.DEFAULT_FROM_EMAIL, [instance.cliente_email])
-                print("✅ Hilo Citas: Confirmación enviada al cliente.")
-            except Exception as e:
-                print(f"❌ Error Hilo Citas Cliente: {e}")
-        
-        threading.Thread(target=enviar_al_cliente).start()
\ No newline at end of file
+
+        correos.append({'asunto': asunto, 'cuerpo': mensaje, 'destinatarios': [instance.cliente_email],
+                        'clave': f"cita:{instance.id}:confirmada:{instance.fecha.isoformat() if instance.fecha else ''}"})
+
+    encolar_correos(correos)
+
+
+# --- Mapas de ocupación por día (ver disponibilidad.py) ---
+
+def _dia_ocupado(fecha, estado):
+    """Día cuyo mapa ocupa una cita con esa fecha y estado (None si no ocupa ninguno)."""
+    if fecha and estado in ESTADOS_OCUPAN:
+        return timezone.localtime(fecha).date()
+    return None
+
+
+def actualizar_mapas(dias):
+    dias = {dia for dia in dias if dia}
+    if not dias:
+        return
+    # Se descartan ya (lecturas dentro de esta transacción) y se recalculan al confirmarla
+    # (lo que otro proceso hubiera leído antes del commit no se queda en la caché);
+    # los días de todas las citas guardadas en la transacción se recalculan juntos, una vez
+    invalidar_dias(dias)
+    al_confirmar_en_lote(refrescar_dias, dias)
+
+
+@receiver(post_save, sender=Cita)
+def actualizar_ocupacion(sender, instance, created, **kwargs):
+    # Lo guardado antes lo recuerda el modelo (CamposSeguidosMixin): sin consultas
+    anterior = (instance.valor_guardado('fecha'), instance.valor_guardado('estado'))
+    actual = (instance.fecha, instance.estado)
+    if created or anterior != actual:
+        actualizar_mapas([_dia_ocupado(*anterior), _dia_ocupado(*actual)])
+
+
+@receiver(post_delete, sender=Cita)
+def liberar_ocupacion(sender, instance, **kwargs):
+    actualizar_mapas([_dia_ocupado(instance.fecha, instance.estado)])
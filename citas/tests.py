@@ -1,12 +1,20 @@
 import json
-from django.test import TestCase, Client
+from django.test import TestCase, Client, override_settings
+from django.core.cache import cache
+from django.contrib.admin.models import LogEntry
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 from django.utils import timezone
-from datetime import timedelta
-from .models import Cita
+from datetime import date, datetime, time, timedelta
+from .models import Cita, cita_estado_cambiado
+from .disponibilidad import Agenda, esta_libre, reservar_cita
+from .transiciones import cambiar_estado_citas
+from .views import obtener_horarios_ocupados
 from .utils.dates import parse_user_date
+from .utils.intenciones import interpretar_mensaje_cita
 from unittest.mock import patch
+from notificaciones.models import CorreoSaliente
+from django.db import IntegrityError, transaction
 
 User = get_user_model()
 
@@ -36,6 +44,46 @@ class DateUtilsTests(TestCase):
         self.assertEqual(res.hour, 17)
         self.assertEqual(res.minute, 30)
 
+    def test_formas_habituales_sin_dateparser(self):
+        """Caso Rendimiento: Las formas habituales se resuelven con el atajo, sin cargar dateparser."""
+        hoy = timezone.localdate()
+        lunes = hoy + timedelta(days=(0 - hoy.weekday()) % 7 or 7)
+        casos = {
+            "el lunes": (lunes, 10, 0),
+            "el próximo lunes a las 5 de la tarde": (lunes, 17, 0),
+            "pasado mañana a las 18": (hoy + timedelta(days=2), 18, 0),
+            f"{(hoy + timedelta(days=3)).strftime('%d/%m')}, 12:30": (hoy + timedelta(days=3), 12, 30),
+            f"{hoy.year + 1}-03-02": (date(hoy.year + 1, 3, 2), 10, 0),
+            f"3 de marzo de {hoy.year + 1} a las 11": (date(hoy.year + 1, 3, 3), 11, 0),
+        }
+        with patch('citas.utils.dates._dateparser') as dateparser:
+            for texto, (dia, hora, minutos) in casos.items():
+                res = timezone.localtime(parse_user_date(texto))
+                self.assertEqual((res.date(), res.hour, res.minute), (dia, hora, minutos), texto)
+            self.assertIsNone(parse_user_date("31/02/2030"))
+        dateparser.assert_not_called()
+
+    def test_memoria_por_texto_y_dia(self):
+        """Caso Lógica: El mismo texto no se vuelve a interpretar, pero lo pasado se comprueba siempre."""
+        from .utils import dates
+        dates._memo.clear()
+        with patch('citas.utils.dates._interpretar_con_dateparser', wraps=dates._interpretar_con_dateparser) as lento:
+            primera = parse_user_date("el día de navidad de 2030")
+            self.assertEqual(parse_user_date("El día de Navidad de 2030 "), primera)
+        lento.assert_called_once()
+
+        # Lo que trae hora depende del momento en que se pide: "dentro de 2 horas" no se memoriza
+        with patch('citas.utils.dates._dateparser') as dateparser:
+            dateparser.return_value.parse.side_effect = lambda texto, **kw: kw['settings']['RELATIVE_BASE'] + timedelta(hours=2)
+            parse_user_date("dentro de 2 horas")
+            parse_user_date("dentro de 2 horas")
+        self.assertEqual(dateparser.return_value.parse.call_count, 2)
+
+        # Un resultado memorizado que ya ha pasado se rechaza igualmente
+        ayer = timezone.localtime() - timedelta(days=1)
+        dates._memo.set(("ayer", timezone.localdate(), 10, 0), ayer.replace(tzinfo=None))
+        self.assertIsNone(parse_user_date("ayer"))
+
 
 class ChatbotFlowTest(TestCase):
     '''
@@ -245,4 +293,398 @@ class CitaAdminTest(TestCase):
         self.cita.refresh_from_db()
         
         self.assertEqual(self.cita.estado, 'CONFIRMADA')
-        self.assertEqual(self.cita.observaciones, 'Validado por admin')
\ No newline at end of file
+        self.assertEqual(self.cita.observaciones, 'Validado por admin')
+
+class IntencionesCitaTests(TestCase):
+    '''
+    Pruebas del atajo local que evita llamar a Gemini en mensajes sin ambigüedad.
+    '''
+    def setUp(self):
+        # Los mapas de ocupación viven en la caché, que no se deshace con cada test
+        cache.clear()
+        self.user = User.objects.create_user(email='atajo@test.com', nombre='Atajo', telefono='123456780', password='pass')
+        # Un martes dentro de dos semanas como mínimo: siempre futuro y laborable
+        dia = timezone.localdate() + timedelta(days=14)
+        self.dia = dia + timedelta(days=(1 - dia.weekday()) % 7)
+        self.texto_dia = self.dia.strftime("%d/%m/%Y")
+
+    def test_fecha_y_hora_libres(self):
+        res = interpretar_mensaje_cita(f"el {self.texto_dia} a las 10", {})
+        self.assertEqual(res['datos_extraidos']['fecha'], self.dia.isoformat())
+        self.assertEqual(res['datos_extraidos']['hora'], "10:00")
+        self.assertEqual(res['intencion'], 'continuar')
+
+    def test_solo_hora_usa_la_fecha_elegida(self):
+        res = interpretar_mensaje_cita("a las 18:00", {'fecha': self.dia.isoformat()})
+        self.assertEqual(res['datos_extraidos']['hora'], "18:00")
+
+    def test_mismas_formas_que_parse_user_date(self):
+        """Caso Positivo: Lo que parse_user_date entiende sin dateparser tampoco va a Gemini."""
+        hoy = timezone.localdate()
+        lunes = hoy + timedelta(days=(0 - hoy.weekday()) % 7 or 7)
+        with patch('citas.utils.dates._dateparser') as dateparser:
+            res = interpretar_mensaje_cita("el próximo lunes a las 5 de la tarde", {})
+            self.assertEqual((res['datos_extraidos']['fecha'], res['datos_extraidos']['hora']), (lunes.isoformat(), "17:00"))
+            res = interpretar_mensaje_cita(self.dia.isoformat(), {})
+            self.assertEqual(res['datos_extraidos']['fecha'], self.dia.isoformat())
+        dateparser.assert_not_called()
+
+    def test_casos_que_van_a_gemini(self):
+        sabado = self.dia + timedelta(days=4)
+        for mensaje in [f"{self.texto_dia} a las 15", f"{self.texto_dia} a las 12:30",
+                        f"{sabado.strftime('%d/%m/%Y')} a las 10", "quiero cita con la nutricionista", "confirmar"]:
+            self.assertIsNone(interpretar_mensaje_cita(mensaje, {}), mensaje)
+
+    def test_hora_ocupada_va_a_gemini(self):
+        momento = timezone.make_aware(datetime.combine(self.dia, time(11, 0)))
+        Cita.objects.create(usuario=self.user, fecha=momento, estado='PENDIENTE')
+        self.assertIsNone(interpretar_mensaje_cita(f"{self.texto_dia} a las 11", {}))
+
+    def test_cancelar_y_confirmar(self):
+        self.assertTrue(interpretar_mensaje_cita("Cancelar la cita", {})['resetear'])
+        res = interpretar_mensaje_cita("confirmo", {'fecha': self.dia.isoformat(), 'hora': '10:00'})
+        self.assertEqual(res['intencion'], 'confirmar')
+
+    @patch('citas.views.obtener_horarios_ocupados')
+    @patch('citas.utils.gemini_utils.obtener_cliente')
+    def test_atajo_no_llama_al_modelo(self, mock_cliente, mock_agenda):
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('procesar_mensaje_cita'), {'mensaje': f"{self.texto_dia} a las 17:00"},
+                                    content_type='application/json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['datos_cita']['hora'], "17:00")
+        mock_cliente.assert_not_called()
+        # Sin modelo tampoco hace falta leer la agenda para el prompt
+        mock_agenda.assert_not_called()
+
+    @patch('citas.views.obtener_horarios_ocupados', return_value="- 2030-01-07 10:00")
+    @patch('citas.utils.gemini_utils.obtener_cliente')
+    def test_agenda_solo_para_el_modelo(self, mock_cliente, mock_agenda):
+        mock_cliente.return_value.generar_json.return_value = {
+            'texto_respuesta': '¿Qué día te viene bien?', 'intencion': 'continuar', 'resetear': False,
+            'datos_extraidos': {'fecha': None, 'hora': None, 'observaciones': None},
+        }
+        self.client.force_login(self.user)
+        self.client.post(reverse('procesar_mensaje_cita'), {'mensaje': 'quiero cita con la nutricionista'},
+                         content_type='application/json')
+
+        mock_agenda.assert_called_once()
+        self.assertIn("- 2030-01-07 10:00", mock_cliente.return_value.generar_json.call_args[0][0])
+
+
+class DisponibilidadTests(TestCase):
+    '''
+    Pruebas del motor de huecos libres (horario comercial menos citas activas).
+    '''
+    def setUp(self):
+        # Los mapas de ocupación viven en la caché, que no se deshace con cada test
+        cache.clear()
+        self.user = User.objects.create_user(email='agenda@test.com', nombre='Agenda', telefono='123456781', password='pass')
+        # Un viernes dentro de dos semanas como mínimo: siempre futuro y con el fin de semana detrás
+        dia = timezone.localdate() + timedelta(days=14)
+        self.viernes = dia + timedelta(days=(4 - dia.weekday()) % 7)
+
+    def momento(self, dia, hora, minutos=0):
+        return timezone.make_aware(datetime.combine(dia, time(hora, minutos)))
+
+    def test_horario_comercial(self):
+        """Caso Lógica: Solo son huecos las horas en punto de las franjas, de lunes a viernes."""
+        self.assertTrue(esta_libre(self.momento(self.viernes, 10)))
+        self.assertTrue(esta_libre(self.momento(self.viernes, 20)))
+        for hora, minutos in [(9, 0), (14, 0), (15, 0), (21, 0), (10, 30)]:
+            self.assertFalse(esta_libre(self.momento(self.viernes, hora, minutos)), (hora, minutos))
+        self.assertFalse(esta_libre(self.momento(self.viernes + timedelta(days=1), 10)))
+
+    def test_proximos_libres_saltan_ocupadas_y_fin_de_semana(self):
+        """Caso Positivo: Tras la última hora libre del viernes se pasa al lunes."""
+        Cita.objects.create(usuario=self.user, fecha=self.momento(self.viernes, 19), estado='CONFIRMADA')
+        Cita.objects.create(usuario=self.user, fecha=self.momento(self.viernes, 20), estado='PENDIENTE')
+        # Una cita cancelada no ocupa su hueco
+        Cita.objects.create(usuario=self.user, fecha=self.momento(self.viernes, 18), estado='CANCELADA')
+
+        agenda = Agenda.cargar(self.momento(self.viernes, 0), dias=7)
+        with self.assertNumQueries(0):
+            libres = agenda.proximos_libres(self.momento(self.viernes, 17, 30), n=3)
+            self.assertFalse(agenda.esta_libre(self.momento(self.viernes, 19)))
+        lunes = self.viernes + timedelta(days=3)
+        self.assertEqual(libres, [self.momento(self.viernes, 18), self.momento(lunes, 10), self.momento(lunes, 11)])
+        self.assertEqual(len(agenda.libres_del_dia(self.viernes)), 6)
+
+    def test_confirmar_hora_ya_ocupada(self):
+        """Caso Negativo: Si la hora se ocupa mientras se conversa, no se reserva y se ofrecen otras."""
+        Cita.objects.create(usuario=self.user, fecha=self.momento(self.viernes, 10), estado='PENDIENTE')
+        otro = User.objects.create_user(email='tarde@test.com', nombre='Tarde', telefono='123456782', password='pass')
+        self.client.force_login(otro)
+        session = self.client.session
+        session['cita_temporal'] = {'fecha': self.viernes.isoformat(), 'hora': '10:00', 'observaciones': None}
+        session.save()
+
+        response = self.client.post(reverse('procesar_mensaje_cita'), {'mensaje': 'confirmo'}, content_type='application/json')
+
+        self.assertEqual(response.json()['status'], 'ok')
+        self.assertIn(f"{self.viernes.strftime('%d/%m/%Y')} a las 11:00", response.json()['respuesta_bot'])
+        self.assertFalse(Cita.objects.filter(usuario=otro).exists())
+        self.assertIsNone(self.client.session['cita_temporal']['hora'])
+
+
+class ReservaUnicaTests(TestCase):
+    '''
+    Pruebas de la restricción que impide dos citas activas en el mismo hueco.
+    '''
+    def setUp(self):
+        # Los mapas de ocupación viven en la caché, que no se deshace con cada test
+        cache.clear()
+        self.user = User.objects.create_user(email='hueco@test.com', nombre='Hueco', telefono='123456783', password='pass')
+        self.otro = User.objects.create_user(email='hueco2@test.com', nombre='Hueco Dos', telefono='123456784', password='pass')
+        dia = timezone.localdate() + timedelta(days=14)
+        dia += timedelta(days=(2 - dia.weekday()) % 7)
+        self.momento = timezone.make_aware(datetime.combine(dia, time(12, 0)))
+
+    def test_base_de_datos_rechaza_reserva_doble(self):
+        """Caso Negativo: Una segunda cita activa en el mismo hueco no llega a guardarse."""
+        Cita.objects.create(usuario=self.user, fecha=self.momento, estado='CONFIRMADA')
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Cita.objects.create(usuario=self.otro, fecha=self.momento, estado='PENDIENTE')
+        # Las canceladas y los borradores no ocupan el hueco
+        Cita.objects.create(usuario=self.otro, fecha=self.momento, estado='CANCELADA')
+        Cita.objects.create(usuario=self.otro, fecha=self.momento, estado='BORRADOR')
+
+    def test_reservar_cita(self):
+        """Caso Positivo: Gana la primera reserva; la segunda recibe None sin romper la transacción."""
+        self.assertIsNotNone(reservar_cita(self.user, self.momento, 'Primera'))
+        self.assertIsNone(reservar_cita(self.otro, self.momento))
+        self.assertEqual(Cita.objects.filter(fecha=self.momento).count(), 1)
+
+        # Tras cancelar la primera el hueco vuelve a estar disponible
+        Cita.objects.filter(usuario=self.user).update(estado='CANCELADA')
+        self.assertIsNotNone(reservar_cita(self.otro, self.momento))
+
+    def test_admin_muestra_el_conflicto(self):
+        """Caso Negativo: Reactivar en el admin una cita sobre un hueco ocupado da un error de formulario."""
+        admin = User.objects.create_superuser(email='admin_hueco@test.com', nombre='Admin', telefono='123456785', password='pass')
+        Cita.objects.create(usuario=self.user, fecha=self.momento, estado='PENDIENTE')
+        cancelada = Cita.objects.create(usuario=self.otro, fecha=self.momento, estado='CANCELADA')
+        self.client.force_login(admin)
+
+        local = timezone.localtime(self.momento)
+        response = self.client.post(reverse('admin:citas_cita_change', args=[cancelada.id]), {
+            'usuario': self.otro.id, 'observaciones': '', 'estado': 'PENDIENTE',
+            'fecha_0': local.strftime('%d/%m/%Y'), 'fecha_1': local.strftime('%H:%M:%S'),
+        })
+
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Ya hay una cita pendiente o confirmada en esa fecha y hora.")
+        cancelada.refresh_from_db()
+        self.assertEqual(cancelada.estado, 'CANCELADA')
+
+
+class MapaOcupacionTests(TestCase):
+    '''
+    Pruebas de los mapas de ocupación por día guardados en la caché.
+    '''
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email='mapa@test.com', nombre='Mapa', telefono='123456786', password='pass')
+        dia = timezone.localdate() + timedelta(days=14)
+        self.lunes = dia + timedelta(days=(0 - dia.weekday()) % 7)
+
+    def momento(self, dia, hora):
+        return timezone.make_aware(datetime.combine(dia, time(hora, 0)))
+
+    def test_lecturas_sin_consultas(self):
+        """Caso Rendimiento: Con los mapas en la caché, la agenda y el prompt no consultan la base de datos."""
+        Cita.objects.create(usuario=self.user, fecha=self.momento(self.lunes, 17), estado='PENDIENTE')
+        Agenda.cargar()
+        with self.assertNumQueries(0):
+            agenda = Agenda.cargar()
+            self.assertFalse(esta_libre(self.momento(self.lunes, 17)))
+            self.assertIn(timezone.localtime(self.momento(self.lunes, 17)).strftime('%Y-%m-%d %H:%M'), obtener_horarios_ocupados())
+        self.assertIn(self.momento(self.lunes, 17), agenda.ocupadas)
+
+    def test_cambios_de_estado_y_fecha(self):
+        """Caso Lógica: Cancelar, mover o borrar una cita actualiza el mapa de su día."""
+        cita = Cita.objects.create(usuario=self.user, fecha=self.momento(self.lunes, 10), estado='PENDIENTE')
+        self.assertFalse(esta_libre(self.momento(self.lunes, 10)))
+
+        cita.estado = 'CANCELADA'
+        cita.save()
+        self.assertTrue(esta_libre(self.momento(self.lunes, 10)))
+
+        cita = Cita.objects.get(pk=cita.pk)
+        cita.estado = 'CONFIRMADA'
+        cita.fecha = self.momento(self.lunes + timedelta(days=1), 11)
+        cita.save()
+        self.assertTrue(esta_libre(self.momento(self.lunes, 10)))
+        self.assertFalse(esta_libre(cita.fecha))
+
+        cita.delete()
+        self.assertTrue(esta_libre(self.momento(self.lunes + timedelta(days=1), 11)))
+
+    # Sin trabajadores de correo en segundo plano: el aviso de la cita solo se encola
+    @override_settings(NOTIFICACIONES={'MODO': 'comando'})
+    def test_se_recalcula_al_confirmar_la_transaccion(self):
+        """Caso Positivo: Al confirmar la transacción el mapa nuevo ya está guardado en la caché."""
+        with self.captureOnCommitCallbacks(execute=True):
+            Cita.objects.create(usuario=self.user, fecha=self.momento(self.lunes, 12), estado='PENDIENTE')
+        with self.assertNumQueries(0):
+            self.assertFalse(esta_libre(self.momento(self.lunes, 12)))
+
+
+class DisponibilidadAPITests(TestCase):
+    '''
+    Pruebas de la API JSON de huecos libres que usa el calendario de la página de reserva.
+    '''
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email='api@test.com', nombre='API', telefono='123456787', password='pass')
+        dia = timezone.localdate() + timedelta(days=14)
+        self.lunes = dia + timedelta(days=(0 - dia.weekday()) % 7)
+        self.url = reverse('disponibilidad_citas')
+        self.rango = {'desde': self.lunes.isoformat(), 'hasta': (self.lunes + timedelta(days=6)).isoformat()}
+
+    def test_huecos_libres_por_dia(self):
+        """Caso Positivo: Devuelve los huecos libres de cada día, sin las horas ocupadas ni los fines de semana."""
+        Cita.objects.create(usuario=self.user, fecha=timezone.make_aware(datetime.combine(self.lunes, time(10, 0))), estado='PENDIENTE')
+
+        response = self.client.get(self.url, self.rango)
+
+        self.assertEqual(response.status_code, 200)
+        dias = response.json()['dias']
+        self.assertEqual(len(dias), 7)
+        self.assertEqual(dias[0]['fecha'], self.lunes.isoformat())
+        self.assertEqual(dias[0]['huecos'], ['11:00', '12:00', '13:00', '17:00', '18:00', '19:00', '20:00'])
+        self.assertEqual(len(dias[1]['huecos']), 8)
+        self.assertEqual(dias[5]['huecos'], [])
+        self.assertTrue(response.has_header('ETag'))
+        self.assertTrue(response.has_header('Last-Modified'))
+
+    def test_rango_invalido(self):
+        """Caso Negativo: Fechas mal escritas, rangos invertidos o demasiado largos se rechazan."""
+        for parametros in [{'desde': 'mañana'}, {'desde': '2030-01-10', 'hasta': '2030-01-01'},
+                           {'desde': '2030-01-01', 'hasta': '2030-03-01'},
+                           # Fechas extremas: sumar la semana por defecto desbordaría
+                           {'desde': '9999-12-31'}, {'desde': '9999-12-28', 'hasta': '9999-12-31'}]:
+            self.assertEqual(self.client.get(self.url, parametros).status_code, 400, parametros)
+
+    def test_revalidacion_con_etag(self):
+        """Caso Rendimiento: Sin cambios en la agenda se contesta 304 sin consultas; tras reservar, datos nuevos."""
+        primera = self.client.get(self.url, self.rango)
+        with self.assertNumQueries(0):
+            repetida = self.client.get(self.url, self.rango, HTTP_IF_NONE_MATCH=primera['ETag'])
+        self.assertEqual(repetida.status_code, 304)
+
+        Cita.objects.create(usuario=self.user, fecha=timezone.make_aware(datetime.combine(self.lunes, time(17, 0))), estado='PENDIENTE')
+        nueva = self.client.get(self.url, self.rango, HTTP_IF_NONE_MATCH=primera['ETag'])
+        self.assertEqual(nueva.status_code, 200)
+        self.assertNotIn('17:00', nueva.json()['dias'][0]['huecos'])
+
+    def test_pagina_de_reserva_incluye_el_calendario(self):
+        """Caso Positivo: La página del chatbot carga el calendario desde la API."""
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('nueva_cita'))
+        self.assertContains(response, 'id="calendario"')
+        self.assertContains(response, self.url)
+
+
+class TransicionesCitaTests(TestCase):
+    '''
+    Pruebas de la detección de la confirmación de una cita sin releerla.
+    '''
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email='trans@test.com', nombre='Trans', telefono='123456786', password='pass')
+        self.cambios = []
+        cita_estado_cambiado.connect(self.registrar, sender=Cita)
+        self.addCleanup(cita_estado_cambiado.disconnect, self.registrar, sender=Cita)
+
+    def registrar(self, sender, instance, anterior, nuevo, **kwargs):
+        self.cambios.append((anterior, nuevo))
+
+    def test_confirmar_sin_consulta_extra(self):
+        """Caso Rendimiento: Confirmar una cita cargada es un solo UPDATE y avisa del cambio de estado."""
+        lunes = timezone.localdate() + timedelta(days=7 - timezone.localdate().weekday())
+        fecha = timezone.make_aware(datetime.combine(lunes, time(10)))
+        cita = Cita.objects.get(pk=Cita.objects.create(usuario=self.user, fecha=fecha, estado='PENDIENTE').pk)
+
+        cita.estado = 'CONFIRMADA'
+        with self.assertNumQueries(1):
+            cita.save()
+        self.assertEqual(self.cambios, [('PENDIENTE', 'CONFIRMADA')])
+
+
+@override_settings(NOTIFICACIONES={'MODO': 'comando'})
+class TransicionesMasivasCitaTests(TestCase):
+    '''
+    Pruebas del cambio de estado en bloque de las citas.
+    '''
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_superuser(email='admin@test.com', nombre='Admin', telefono='987654320', password='pass')
+        lunes = timezone.localdate() + timedelta(days=7 - timezone.localdate().weekday())
+        self.fechas = [timezone.make_aware(datetime.combine(lunes, time(hora))) for hora in (10, 11, 12)]
+        self.citas = [Cita.objects.create(usuario=self.admin, fecha=fecha, estado='PENDIENTE') for fecha in self.fechas]
+
+    def test_confirmar_en_bloque(self):
+        """Caso Positivo: Confirmar varias citas es un UPDATE y encola un correo por cada una."""
+        ids = [cita.id for cita in self.citas[:2]]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(sorted(cambiar_estado_citas(ids, 'CONFIRMADA')), ids)
+            # Repetirlo no cambia nada más
+            self.assertEqual(cambiar_estado_citas(ids, 'CONFIRMADA'), [])
+
+        self.assertEqual(CorreoSaliente.objects.filter(clave__contains=':confirmada:').count(), 2)
+        self.assertFalse(esta_libre(self.fechas[0]))
+
+    def test_columna_editable_libera_el_hueco(self):
+        """Caso Lógica: Cancelar una cita desde el listado del admin deja su hueco libre en la agenda."""
+        self.assertFalse(esta_libre(self.fechas[2]))
+        self.client.force_login(self.admin)
+        cita = self.citas[2]
+        datos = {
+            'form-TOTAL_FORMS': '1', 'form-INITIAL_FORMS': '1',
+            'form-MIN_NUM_FORMS': '0', 'form-MAX_NUM_FORMS': '1000',
+            'form-0-id': str(cita.id), 'form-0-estado': 'CANCELADA', '_save': 'Guardar',
+        }
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('admin:citas_cita_changelist'), datos)
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Cita.objects.get(id=cita.id).estado, 'CANCELADA')
+        self.assertTrue(esta_libre(self.fechas[2]))
+
+    def test_columna_editable_hueco_ocupado(self):
+        """Caso Negativo: Reactivar desde el listado una cita cuyo hueco ya está cogido es un error de la fila: no se guarda ni se registra."""
+        cancelada = self.citas[0]
+        Cita.objects.filter(id=cancelada.id).update(estado='CANCELADA')
+        Cita.objects.create(usuario=self.admin, fecha=self.fechas[0], estado='PENDIENTE')
+        self.client.force_login(self.admin)
+        datos = {
+            'form-TOTAL_FORMS': '1', 'form-INITIAL_FORMS': '1',
+            'form-MIN_NUM_FORMS': '0', 'form-MAX_NUM_FORMS': '1000',
+            'form-0-id': str(cancelada.id), 'form-0-estado': 'PENDIENTE', '_save': 'Guardar',
+        }
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('admin:citas_cita_changelist'), datos)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Cita.objects.get(id=cancelada.id).estado, 'CANCELADA')
+        self.assertEqual(response.context['cl'].formset.errors[0]['estado'], ["Ya hay otra cita activa en ese hueco."])
+        self.assertEqual(list(response.context['messages']), [])
+        self.assertFalse(LogEntry.objects.exists())
+        self.assertContains(response, 'Ya hay otra cita activa en ese hueco.')
+
+    def test_ficha_hueco_ocupado(self):
+        """Caso Negativo: Mover una cita desde su ficha a un hueco ya cogido muestra el error del formulario sin guardar."""
+        cita = self.citas[1]
+        self.client.force_login(self.admin)
+        destino = timezone.localtime(self.fechas[0])
+        response = self.client.post(reverse('admin:citas_cita_change', args=[cita.id]), {
+            'usuario': str(self.admin.id), 'observaciones': '', 'estado': 'PENDIENTE',
+            'fecha_0': destino.strftime('%d/%m/%Y'), 'fecha_1': destino.strftime('%H:%M:%S'),
+        })
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Cita.objects.get(id=cita.id).fecha, self.fechas[1])
+        self.assertEqual(response.context['adminform'].form.non_field_errors(), ['Ya hay una cita pendiente o confirmada en esa fecha y hora.'])
+        self.assertFalse(LogEntry.objects.exists())
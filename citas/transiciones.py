@@ -0,0 +1,29 @@
+from django.utils import timezone
+from nutrisur.transiciones import actualizar_estado
+from notificaciones.eventos import al_confirmar_en_lote
+from .models import Cita
+from .signals import actualizar_mapas, notificar_citas_confirmadas, notificar_nuevas_citas
+
+# Avisos que lleva cada estado de destino (los mismos que al guardar una cita una a una)
+AVISOS_POR_ESTADO = {
+    'PENDIENTE': notificar_nuevas_citas,
+    'CONFIRMADA': notificar_citas_confirmadas,
+}
+
+
+def cambiar_estado_citas(citas, estado):
+    """
+    Pasa a 'estado' las citas (queryset o lista de ids) que no lo tengan ya, con un solo
+    UPDATE, actualiza los mapas de ocupación de sus días y programa sus avisos en un lote
+    para cuando se confirme la transacción. Devuelve los ids cambiados.
+    Si dos citas activas acabaran en el mismo hueco la base de datos rechaza el UPDATE entero.
+    """
+    if not hasattr(citas, 'query'):
+        citas = Cita.objects.filter(pk__in=list(citas))
+    ids = actualizar_estado(citas, estado)
+    if ids:
+        fechas = Cita.objects.filter(pk__in=ids, fecha__isnull=False).values_list('fecha', flat=True)
+        actualizar_mapas({timezone.localtime(fecha).date() for fecha in fechas})
+        if estado in AVISOS_POR_ESTADO:
+            al_confirmar_en_lote(AVISOS_POR_ESTADO[estado], ids)
+    return ids
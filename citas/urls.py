@@ -6,6 +6,8 @@ urlpatterns = [
     path('mis-citas', CitaListView.as_view(), name='mis_citas'),
     path('nueva-cita', views.chatbot_view, name='nueva_cita'),
     path('procesar-mensaje', views.procesar_mensaje_view, name='procesar_mensaje_cita'),
+    path('procesar-mensaje/stream', views.procesar_mensaje_stream_view, name='procesar_mensaje_cita_stream'),
+    path('disponibilidad', views.disponibilidad_view, name='disponibilidad_citas'),
     path('cancelar/<int:cita_id>/', views.cancelar_cita_view, name='cancelar_cita'),
     path('modificar/<int:cita_id>/', views.modificar_cita_view, name='modificar_cita'),
 ]
\ No newline at end of file
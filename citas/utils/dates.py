@@ -1,62 +1,151 @@
-import dateparser
-from datetime import datetime
+import re
+from datetime import date, datetime, time, timedelta
 from django.utils import timezone
+from nutrisur.lru import LRUConTTL
 
-def parse_user_date(texto, default_hour=10, default_minute=0):
+MESES = {
+    'enero': 1, 'febrero': 2, 'marzo': 3, 'abril': 4, 'mayo': 5, 'junio': 6, 'julio': 7,
+    'agosto': 8, 'septiembre': 9, 'setiembre': 9, 'octubre': 10, 'noviembre': 11, 'diciembre': 12,
+}
+DIAS_SEMANA = {
+    'lunes': 0, 'martes': 1, 'miercoles': 2, 'miércoles': 2, 'jueves': 3,
+    'viernes': 4, 'sabado': 5, 'sábado': 5, 'domingo': 6,
+}
+RELATIVOS = {'hoy': 0, 'mañana': 1, 'manana': 1, 'pasado mañana': 2, 'pasado manana': 2}
+
+DIA = (
+    r'(?:(?P<relativo>pasado ma[ñn]ana|ma[ñn]ana|hoy)'
+    r'|(?:(?:este|pr[óo]ximo|el pr[óo]ximo) )?(?P<semana>lunes|martes|mi[ée]rcoles|jueves|viernes|s[áa]bado|domingo)'
+    r'|(?P<anio_iso>\d{4})-(?P<mes_iso>\d{1,2})-(?P<dia_iso>\d{1,2})'
+    r'|(?P<dia_num>\d{1,2})[/-](?P<mes_num>\d{1,2})(?:[/-](?P<anio_num>\d{4}|\d{2}))?'
+    r'|(?P<dia_txt>\d{1,2}) de (?P<mes_txt>' + '|'.join(MESES) + r')(?: de (?P<anio_txt>\d{4}))?)'
+)
+HORA = (
+    r'(?:(?:a las|a la|sobre las|las) (?P<hora>\d{1,2})(?::(?P<minutos>\d{2}))?'
+    r'|(?P<hora_hhmm>\d{1,2}):(?P<minutos_hhmm>\d{2}))'
+    r'(?: ?h| horas)?(?: de la (?P<parte>ma[ñn]ana|tarde|noche))?'
+)
+# Lo que escribe casi todo el mundo: "mañana", "el lunes a las 17", "25/12", "3 de marzo a las 10:30"...
+PATRON_RAPIDO = re.compile(r'^(?:para el |para |el )?(?:' + DIA + r')?(?:,? ?(?:' + HORA + r'))?$')
+
+# Resultados ya interpretados, por (texto, día de hoy, hora por defecto): el mismo texto el
+# mismo día da la misma fecha. Lo pasado se descarta fuera, con la hora actual
+_memo = LRUConTTL(1024)
+_SIN_MEMO = object()
+
+
+def _entero(valor):
+    return int(valor) if valor else None
+
+
+def leer_fecha_hora(texto, hoy):
     """
-    Convierte texto en datetime (timezone aware) y valida que no sea pasado.
-    Devuelve None si no puede interpretarse o si la fecha es anterior a ahora.
+    Día y hora de un texto con las formas habituales (PATRON_RAPIDO), sin dateparser:
+    (date o None, time o None), None en lo que no se menciona. Devuelve None si el texto
+    no encaja y lanza ValueError si la fecha u hora no existen (31/02, 25:00...).
     """
-    if not texto or not texto.strip():
+    encontrado = PATRON_RAPIDO.match(texto)
+    if not encontrado or not any(encontrado.group(g) for g in ('relativo', 'semana', 'anio_iso', 'dia_num', 'dia_txt', 'hora', 'hora_hhmm')):
         return None
+    g = encontrado.groupdict()
 
-    texto = texto.lower().strip()
-    now = timezone.now()
+    dia = None
+    if g['relativo']:
+        dia = hoy + timedelta(days=RELATIVOS[g['relativo']])
+    elif g['semana']:
+        # Como dateparser: si hoy es ese día, se entiende el de la semana que viene
+        dia = hoy + timedelta(days=(DIAS_SEMANA[g['semana']] - hoy.weekday()) % 7 or 7)
+    elif g['anio_iso']:
+        dia = date(int(g['anio_iso']), int(g['mes_iso']), int(g['dia_iso']))
+    elif g['dia_num'] or g['dia_txt']:
+        numero = int(g['dia_num'] or g['dia_txt'])
+        mes = int(g['mes_num']) if g['dia_num'] else MESES[g['mes_txt']]
+        anio = _entero(g['anio_num'] or g['anio_txt'])
+        if anio is None:
+            # Sin año, la próxima vez que llegue esa fecha
+            dia = date(hoy.year, mes, numero)
+            if dia < hoy:
+                dia = date(hoy.year + 1, mes, numero)
+        else:
+            dia = date(anio + 2000 if anio < 100 else anio, mes, numero)
+
+    hora = _entero(g['hora'] or g['hora_hhmm'])
+    if hora is None:
+        return dia, None
+    minutos = _entero(g['minutos'] or g['minutos_hhmm']) or 0
+    if g['parte'] in ('tarde', 'noche') and hora < 12:
+        hora += 12
+    return dia, time(hora, minutos)
+
+
+def _interpretar_rapido(texto, hoy, default_hour, default_minute):
+    """
+    Fecha (naive, hora local) de las formas habituales. Devuelve None si el texto
+    encaja pero la fecha no existe y _SIN_MEMO si no encaja (toca dateparser).
+    """
+    try:
+        partes = leer_fecha_hora(texto, hoy)
+    except ValueError:
+        # 31/02, 25:00...
+        return None
+    if partes is None:
+        return _SIN_MEMO
+    dia, hora = partes
+    return datetime.combine(dia or hoy, hora or time(default_hour, default_minute))
 
-    fecha_dp = dateparser.parse(
+
+def _dateparser():
+    # Cargar dateparser (y sus datos de idioma) cuesta: solo se hace si llega algo raro
+    import dateparser
+    return dateparser
+
+
+def _interpretar_con_dateparser(texto, ahora_local, default_hour, default_minute):
+    """Devuelve (fecha naive o None, si se puede memorizar)."""
+    base = ahora_local.replace(tzinfo=None)
+    fecha = _dateparser().parse(
         texto,
         languages=['es'],
         settings={
             'PREFER_DATES_FROM': 'future',
-            'RELATIVE_BASE': now.replace(tzinfo=None),
+            'RELATIVE_BASE': base,
             'RETURN_AS_TIMEZONE_AWARE': False
         }
     )
+    if fecha is None:
+        return None, True
+    if fecha.hour == 0 and fecha.minute == 0 and ":" not in texto:
+        return fecha.replace(hour=default_hour, minute=default_minute), True
+    # Con hora no se memoriza: "dentro de 2 horas" o "en 90 minutos" dependen de la
+    # hora actual, no solo del día, y no hay forma fiable de distinguirlos
+    return fecha, False
+
+
+def parse_user_date(texto, default_hour=10, default_minute=0):
+    """
+    Convierte texto en datetime (timezone aware) y valida que no sea pasado.
+    Devuelve None si no puede interpretarse o si la fecha es anterior a ahora.
+    """
+    if not texto or not texto.strip():
+        return None
 
-    if fecha_dp:
-        if fecha_dp.hour == 0 and fecha_dp.minute == 0 and ":" not in texto:
-            fecha_dp = fecha_dp.replace(hour=default_hour, minute=default_minute)
-
-        fecha_dp = timezone.make_aware(fecha_dp, timezone.get_current_timezone())
-
-        if fecha_dp < now:
-            return None
-
-        return fecha_dp
-
-    formatos = [
-        "%d/%m/%Y",
-        "%d-%m-%Y",
-        "%Y-%m-%d",
-        "%d/%m/%y",
-        "%d-%m-%y",
-        "%d/%m/%Y %H:%M",
-        "%d-%m-%Y %H:%M",
-        "%Y-%m-%d %H:%M",
-        "%d/%m/%y %H:%M",
-        "%d-%m-%y %H:%M",
-    ]
-
-    for f in formatos:
-        try:
-            fecha_manual = datetime.strptime(texto, f)
-            if 'H' not in f and '%H' not in f:
-                fecha_manual = fecha_manual.replace(hour=default_hour, minute=default_minute)
-            fecha_manual = timezone.make_aware(fecha_manual, timezone.get_current_timezone())
-            if fecha_manual < now:
-                return None
-            return fecha_manual
-        except Exception:
-            continue
-
-    return None
+    texto = texto.lower().strip()
+    now = timezone.now()
+    ahora_local = timezone.localtime(now)
+    clave = (texto, ahora_local.date(), default_hour, default_minute)
+
+    fecha = _memo.get(clave, _SIN_MEMO)
+    if fecha is _SIN_MEMO:
+        fecha = _interpretar_rapido(texto, ahora_local.date(), default_hour, default_minute)
+        memorizable = True
+        if fecha is _SIN_MEMO:
+            fecha, memorizable = _interpretar_con_dateparser(texto, ahora_local, default_hour, default_minute)
+        if memorizable:
+            _memo.set(clave, fecha)
+
+    if fecha is None:
+        return None
+    fecha = timezone.make_aware(fecha, timezone.get_current_timezone())
+    if fecha < now:
+        return None
+    return fecha
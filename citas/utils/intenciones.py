@@ -0,0 +1,78 @@
+import re
+from datetime import datetime
+from django.utils import timezone
+from citas.disponibilidad import en_horario, esta_libre
+from citas.utils.dates import leer_fecha_hora
+
+PATRON_CANCELAR = re.compile(r'^(?:quiero )?(?:cancelar|cancela|anular|anula)(?: la)?(?: cita| reserva)?$')
+PATRON_CONFIRMAR = re.compile(r'^(?:confirmar|confirmo|confirma)(?: la)?(?: cita| reserva)?$')
+
+
+def _limpiar(mensaje):
+    return re.sub(r'[.!¡?¿]+', '', str(mensaje or '')).lower().strip()
+
+
+def _respuesta(texto, fecha=None, hora=None, intencion='continuar', resetear=False):
+    # Mismo esquema que devuelve Gemini, para que procesar_mensaje_view no distinga el origen
+    return {
+        "texto_respuesta": texto,
+        "datos_extraidos": {"fecha": fecha, "hora": hora, "observaciones": None},
+        "intencion": intencion,
+        "resetear": resetear,
+    }
+
+
+def interpretar_mensaje_cita(mensaje, datos_actuales):
+    """
+    Atajo local para mensajes sin ambigüedad: cancelar, confirmar con fecha y hora ya
+    elegidas, o una fecha/hora libre dentro del horario. Devuelve None si hace falta el
+    modelo (fechas fuera de horario u ocupadas incluidas: Gemini explica y sugiere otra).
+    """
+    texto = _limpiar(mensaje)
+    if not texto:
+        return None
+
+    if PATRON_CANCELAR.match(texto):
+        return _respuesta("De acuerdo, he cancelado la reserva. ¿En qué más puedo ayudarte?", intencion='cancelar', resetear=True)
+
+    if PATRON_CONFIRMAR.match(texto):
+        if datos_actuales.get('fecha') and datos_actuales.get('hora'):
+            return _respuesta("¡Perfecto! Tu cita queda reservada.", intencion='confirmar')
+        return None
+
+    # Las mismas formas de fecha y hora que interpreta parse_user_date sin dateparser
+    try:
+        partes = leer_fecha_hora(texto, timezone.localdate())
+    except ValueError:
+        return None
+    if partes is None:
+        return None
+
+    fecha, hora = partes
+    if fecha is None:
+        if not datos_actuales.get('fecha'):
+            return None
+        fecha = datetime.strptime(datos_actuales['fecha'], "%Y-%m-%d").date()
+    if fecha < timezone.localdate():
+        return None
+
+    if hora is None:
+        if fecha.weekday() >= 5:
+            return None
+        return _respuesta(
+            f"Muy bien, el {fecha.strftime('%d/%m/%Y')}. ¿A qué hora te viene bien? "
+            "Atendemos de 10:00 a 14:00 y de 17:00 a 21:00.",
+            fecha=fecha.isoformat(),
+        )
+
+    if not en_horario(fecha, hora.hour, hora.minute):
+        return None
+    momento = timezone.make_aware(datetime.combine(fecha, hora), timezone.get_current_timezone())
+    if momento <= timezone.now() or not esta_libre(momento):
+        return None
+
+    return _respuesta(
+        f"Perfecto, tengo libre el {fecha.strftime('%d/%m/%Y')} a las {hora:%H}:00. "
+        "¿Quieres añadir alguna observación antes de confirmar la cita?",
+        fecha=fecha.isoformat(), hora=f"{hora:%H}:00",
+    )
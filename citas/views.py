@@ -5,39 +5,39 @@ from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.decorators import login_required
 from django.shortcuts import render, get_object_or_404, redirect # <--- AÑADIDO
 from django.contrib import messages
-from django.views.decorators.http import require_POST
+from django.views.decorators.http import require_GET, require_POST, condition
 from django.http import JsonResponse
+from django.utils.cache import patch_cache_control
 from django.utils import timezone
 from datetime import datetime, timedelta
 from .models import Cita
+from .disponibilidad import (
+    DIAS_ANTELACION, DIAS_BUSQUEDA, Agenda, es_hora_de_cita, formatear_hueco, huecos_libres_por_dia, proximos_libres,
+    reservar_cita, version_agenda,
+)
 
 # Importamos el nuevo cerebro IA
-from .utils.gemini_utils import consultar_gemini_citas
+from .utils.gemini_utils import consultar_gemini_citas, construir_prompt_citas, RESPUESTA_ERROR, ESQUEMA_RESPUESTA
+from .utils.intenciones import interpretar_mensaje_cita
+from nutrisur.llm import obtener_cliente, ExtractorTexto, evento_sse, respuesta_sse
+from asgiref.sync import sync_to_async
 
 
 def obtener_horarios_ocupados():
     """
-    Devuelve un string con las fechas y horas de citas futuras que ya están ocupadas.
+    Devuelve un string con las fechas y horas de citas futuras que ya están ocupadas
+    (los próximos 30 días, para no saturar el prompt) y los primeros huecos libres,
+    para que la IA sugiera horas que existen de verdad.
     """
-    ahora = timezone.now()
-    # Buscamos citas desde ahora hasta dentro de 30 días (para no saturar el prompt)
-    limite = ahora + timedelta(days=30)
-    
-    citas_ocupadas = Cita.objects.filter(
-        fecha__range=(ahora, limite),
-        estado__in=['PENDIENTE', 'CONFIRMADA']
-    ).order_by('fecha')
-    
-    if not citas_ocupadas.exists():
-        return "No hay citas ocupadas. Todo el horario está libre."
-    
-    lista_txt = []
-    for c in citas_ocupadas:
-        # Formato legible para la IA: "YYYY-MM-DD HH:MM"
-        fecha_str = c.fecha.astimezone(timezone.get_current_timezone()).strftime("%Y-%m-%d %H:%M")
-        lista_txt.append(f"- {fecha_str}")
-        
-    return "\n".join(lista_txt)
+    agenda = Agenda.cargar()
+    libres = "\n".join(f"- {formatear_hueco(m)}" for m in agenda.proximos_libres(n=5))
+
+    if not agenda.ocupadas:
+        return f"No hay citas ocupadas. Todo el horario está libre.\n\nPRÓXIMOS HUECOS LIBRES:\n{libres}"
+
+    # Formato legible para la IA: "YYYY-MM-DD HH:MM"
+    lista_txt = [f"- {timezone.localtime(fecha).strftime('%Y-%m-%d %H:%M')}" for fecha in agenda.ocupadas]
+    return "\n".join(lista_txt) + f"\n\nPRÓXIMOS HUECOS LIBRES (sugiere uno de estos):\n{libres}"
 
 class CitaListView(LoginRequiredMixin, ListView):
     model = Cita
@@ -64,6 +64,101 @@ def chatbot_view(request):
     }
     return render(request, 'citas/chatbot.html', context)
 
+def leer_cita_temporal(request):
+    return request.session.get('cita_temporal', {
+        'fecha': None,        # Guardaremos string 'YYYY-MM-DD'
+        'hora': None,         # Guardaremos string 'HH:MM'
+        'observaciones': None
+    })
+
+
+def aplicar_respuesta_cita(request, datos_temp, respuesta_ai):
+    """
+    Aplica la respuesta del chatbot (Gemini o atajo local) a la reserva en curso.
+    Devuelve (datos para la página, código HTTP).
+    """
+    # Validación básica por si falla la API
+    if not respuesta_ai or respuesta_ai.get('intencion') == 'error':
+        return {'status': 'error', 'respuesta_bot': 'Error de conexión con la IA.'}, 500
+
+    # 3. Procesar la respuesta de la IA
+    datos_nuevos = respuesta_ai.get('datos_extraidos', {})
+    intencion = respuesta_ai.get('intencion')
+    resetear = respuesta_ai.get('resetear', False)
+    texto_bot = respuesta_ai.get('texto_respuesta')
+
+    # CASO A: Usuario quiere cancelar/reiniciar
+    if resetear or intencion == 'cancelar':
+        if 'cita_temporal' in request.session:
+            del request.session['cita_temporal']
+        return {
+            'status': 'reset',
+            'respuesta_bot': texto_bot or "Reserva cancelada. ¿En qué más puedo ayudarte?",
+            'datos_cita': None
+        }, 200
+
+    # CASO B: Actualizar datos en sesión (IA detectó fecha/hora nuevas)
+    if datos_nuevos.get('fecha'): datos_temp['fecha'] = datos_nuevos['fecha']
+    if datos_nuevos.get('hora'): datos_temp['hora'] = datos_nuevos['hora']
+    if datos_nuevos.get('observaciones'): datos_temp['observaciones'] = datos_nuevos['observaciones']
+    
+    request.session['cita_temporal'] = datos_temp
+
+    # CASO C: Confirmación y Guardado en BD
+    status_respuesta = 'ok'
+    
+    # Si la IA dice que está confirmado y tenemos los datos mínimos
+    if intencion == 'confirmar' and datos_temp['fecha'] and datos_temp['hora']:
+        try:
+            # Combinar fecha y hora para crear el objeto datetime
+            fecha_str = f"{datos_temp['fecha']} {datos_temp['hora']}"
+            fecha_dt = datetime.strptime(fecha_str, "%Y-%m-%d %H:%M")
+            # Hacerla consciente de la zona horaria (settings.TIME_ZONE)
+            fecha_aware = timezone.make_aware(fecha_dt, timezone.get_current_timezone())
+
+            # Crear la cita real en base de datos (la restricción única evita reservas dobles)
+            cita = None
+            if es_hora_de_cita(fecha_aware):
+                cita = reservar_cita(request.user, fecha_aware, datos_temp.get('observaciones', ''))
+
+            if cita is None:
+                # La hora se ha ocupado (o no es de horario) desde que se eligió: se ofrecen otras
+                alternativas = ", ".join(formatear_hueco(m) for m in proximos_libres(fecha_aware))
+                datos_temp['hora'] = None
+                request.session['cita_temporal'] = datos_temp
+                texto_bot = f"Lo siento, esa hora ya no está disponible. Te puedo ofrecer: {alternativas}."
+            else:
+                # Limpiar sesión tras éxito
+                del request.session['cita_temporal']
+                status_respuesta = 'finalizado'
+
+        except ValueError as e:
+            print(f"Error formato fecha: {e}")
+            texto_bot = "Hubo un error técnico al guardar la fecha. Por favor, inténtalo de nuevo."
+
+    # 4. Preparar datos para actualizar la tabla visual (Frontend)
+    # Formateamos la fecha para que se vea bonita (DD/MM/YYYY)
+    fecha_visual = datos_temp['fecha']
+    if fecha_visual:
+        try:
+            f_obj = datetime.strptime(fecha_visual, "%Y-%m-%d")
+            fecha_visual = f_obj.strftime("%d/%m/%Y")
+        except: pass
+
+    datos_frontend = {
+        'fecha': fecha_visual,
+        'hora': datos_temp['hora'] or 'Pendiente', # Si es None, mostramos texto
+        'observaciones': datos_temp['observaciones'] or '-',
+        'estado': 'BORRADOR'
+    }
+
+    return {
+        'status': status_respuesta,
+        'respuesta_bot': texto_bot,
+        'datos_cita': datos_frontend
+    }, 200
+
+
 @login_required
 @require_POST
 def procesar_mensaje_view(request):
@@ -72,99 +167,69 @@ def procesar_mensaje_view(request):
         mensaje_usuario = data.get('mensaje', '')
 
         # 1. Recuperar estado de la sesión (Memoria a corto plazo)
-        datos_temp = request.session.get('cita_temporal', {
-            'fecha': None,        # Guardaremos string 'YYYY-MM-DD'
-            'hora': None,         # Guardaremos string 'HH:MM'
-            'observaciones': None
-        })
-        
-        string_ocupados = obtener_horarios_ocupados()
+        datos_temp = leer_cita_temporal(request)
 
         # 2. SE LA PASAMOS A LA FUNCIÓN DE GEMINI
-        # (Tendremos que modificar consultar_gemini_citas para que acepte este argumento)
-        respuesta_ai = consultar_gemini_citas(mensaje_usuario, datos_temp, string_ocupados)
-        
-        # Validación básica por si falla la API
-        if not respuesta_ai or respuesta_ai.get('intencion') == 'error':
-            return JsonResponse({'status': 'error', 'respuesta_bot': 'Error de conexión con la IA.'}, status=500)
-
-        # 3. Procesar la respuesta de la IA
-        datos_nuevos = respuesta_ai.get('datos_extraidos', {})
-        intencion = respuesta_ai.get('intencion')
-        resetear = respuesta_ai.get('resetear', False)
-        texto_bot = respuesta_ai.get('texto_respuesta')
-
-        # CASO A: Usuario quiere cancelar/reiniciar
-        if resetear or intencion == 'cancelar':
-            if 'cita_temporal' in request.session:
-                del request.session['cita_temporal']
-            return JsonResponse({
-                'status': 'reset',
-                'respuesta_bot': texto_bot or "Reserva cancelada. ¿En qué más puedo ayudarte?",
-                'datos_cita': None
-            })
-
-        # CASO B: Actualizar datos en sesión (IA detectó fecha/hora nuevas)
-        if datos_nuevos.get('fecha'): datos_temp['fecha'] = datos_nuevos['fecha']
-        if datos_nuevos.get('hora'): datos_temp['hora'] = datos_nuevos['hora']
-        if datos_nuevos.get('observaciones'): datos_temp['observaciones'] = datos_nuevos['observaciones']
+        # La agenda ocupada va como función: solo se lee si el mensaje llega al modelo
+        # (los que resuelve el atajo local no la necesitan)
+        respuesta_ai = consultar_gemini_citas(mensaje_usuario, datos_temp, obtener_horarios_ocupados)
         
-        request.session['cita_temporal'] = datos_temp
-
-        # CASO C: Confirmación y Guardado en BD
-        status_respuesta = 'ok'
-        
-        # Si la IA dice que está confirmado y tenemos los datos mínimos
-        if intencion == 'confirmar' and datos_temp['fecha'] and datos_temp['hora']:
-            try:
-                # Combinar fecha y hora para crear el objeto datetime
-                fecha_str = f"{datos_temp['fecha']} {datos_temp['hora']}"
-                fecha_dt = datetime.strptime(fecha_str, "%Y-%m-%d %H:%M")
-                # Hacerla consciente de la zona horaria (settings.TIME_ZONE)
-                fecha_aware = timezone.make_aware(fecha_dt, timezone.get_current_timezone())
-
-                # Crear la cita real en base de datos
-                Cita.objects.create(
-                    usuario=request.user,
-                    fecha=fecha_aware,
-                    observaciones=datos_temp.get('observaciones', ''),
-                    estado='PENDIENTE'
-                )
-                
-                # Limpiar sesión tras éxito
-                del request.session['cita_temporal']
-                status_respuesta = 'finalizado'
-                
-            except ValueError as e:
-                print(f"Error formato fecha: {e}")
-                texto_bot = "Hubo un error técnico al guardar la fecha. Por favor, inténtalo de nuevo."
-
-        # 4. Preparar datos para actualizar la tabla visual (Frontend)
-        # Formateamos la fecha para que se vea bonita (DD/MM/YYYY)
-        fecha_visual = datos_temp['fecha']
-        if fecha_visual:
-            try:
-                f_obj = datetime.strptime(fecha_visual, "%Y-%m-%d")
-                fecha_visual = f_obj.strftime("%d/%m/%Y")
-            except: pass
-
-        datos_frontend = {
-            'fecha': fecha_visual,
-            'hora': datos_temp['hora'] or 'Pendiente', # Si es None, mostramos texto
-            'observaciones': datos_temp['observaciones'] or '-',
-            'estado': 'BORRADOR'
-        }
-
-        return JsonResponse({
-            'status': status_respuesta,
-            'respuesta_bot': texto_bot,
-            'datos_cita': datos_frontend
-        })
+        datos, status = aplicar_respuesta_cita(request, datos_temp, respuesta_ai)
+        return JsonResponse(datos, status=status)
 
     except Exception as e:
         print(f"Error Vista Citas: {e}")
         return JsonResponse({'status': 'error', 'respuesta_bot': 'Ocurrió un error interno.'}, status=500)
 
+
+@login_required
+@require_POST
+async def procesar_mensaje_stream_view(request):
+    """
+    Igual que procesar_mensaje_view pero con Server-Sent Events: el texto del bot llega
+    a trozos (eventos 'texto') y al final el estado de la reserva (evento 'fin').
+    """
+    try:
+        mensaje_usuario = json.loads(request.body).get('mensaje', '')
+    except ValueError:
+        mensaje_usuario = ''
+
+    async def eventos():
+        try:
+            datos_temp = await sync_to_async(leer_cita_temporal)(request)
+            respuesta_ai = await sync_to_async(interpretar_mensaje_cita)(mensaje_usuario, datos_temp)
+
+            if respuesta_ai:
+                yield evento_sse('texto', {'texto': respuesta_ai['texto_respuesta']})
+            elif obtener_cliente().disponible:
+                string_ocupados = await sync_to_async(obtener_horarios_ocupados)()
+                prompt = await sync_to_async(construir_prompt_citas)(mensaje_usuario, datos_temp, string_ocupados)
+                extractor = ExtractorTexto()
+                trozos = []
+                try:
+                    async for trozo in obtener_cliente().agenerar_stream(prompt, esquema=ESQUEMA_RESPUESTA):
+                        trozos.append(trozo)
+                        texto = extractor.alimentar(trozo)
+                        if texto:
+                            yield evento_sse('texto', {'texto': texto})
+                    respuesta_ai = await obtener_cliente().avalidar_o_repreguntar(
+                        ''.join(trozos), prompt, ESQUEMA_RESPUESTA
+                    )
+                except Exception as e:
+                    print(f"Error Gemini Citas: {e}")
+                    respuesta_ai = dict(RESPUESTA_ERROR)
+
+            datos, _ = await sync_to_async(aplicar_respuesta_cita)(request, datos_temp, respuesta_ai)
+            # La respuesta ya salió por el middleware de sesión: se guarda aquí
+            await sync_to_async(request.session.save)()
+            yield evento_sse('fin', datos)
+
+        except Exception as e:
+            print(f"Error Vista Citas: {e}")
+            yield evento_sse('fin', {'status': 'error', 'respuesta_bot': 'Ocurrió un error interno.'})
+
+    return respuesta_sse(eventos())
+
 @login_required
 def cancelar_cita_view(request, cita_id):
     cita = get_object_or_404(Cita, id=cita_id, usuario=request.user)
@@ -210,4 +275,54 @@ def modificar_cita_view(request, cita_id):
     cita.save()
     
     messages.info(request, "Vamos a reprogramar tu cita. He guardado tus datos, solo dime la nueva fecha.")
-    return redirect('nueva_cita')
\ No newline at end of file
+    return redirect('nueva_cita')
+
+
+# --- API de disponibilidad (calendario de la página de reserva) ---
+
+def _rango_disponibilidad(request):
+    """(primer día, último día) pedidos en ?desde=&hasta= (YYYY-MM-DD); por defecto, una semana."""
+    hoy = timezone.localdate()
+    primero = datetime.strptime(request.GET['desde'], "%Y-%m-%d").date() if request.GET.get('desde') else hoy
+    if (primero - hoy).days > DIAS_ANTELACION:
+        # Además, cerca de 9999-12-31 sumar días desborda la fecha (OverflowError)
+        raise ValueError(f"'desde' no puede estar a más de {DIAS_ANTELACION} días vista")
+    ultimo = datetime.strptime(request.GET['hasta'], "%Y-%m-%d").date() if request.GET.get('hasta') else primero + timedelta(days=6)
+    if ultimo < primero or (ultimo - primero).days >= DIAS_BUSQUEDA:
+        raise ValueError(f"El rango debe ir de 'desde' a 'hasta' y no pasar de {DIAS_BUSQUEDA} días")
+    return primero, ultimo
+
+
+def etag_disponibilidad(request):
+    # Los huecos de hoy van pasando: la hora actual también forma parte de la versión
+    return f"{version_agenda()['version']}-{timezone.localtime().strftime('%Y%m%d%H')}"
+
+
+def ultima_modificacion_disponibilidad(request):
+    inicio_hora = timezone.localtime().replace(minute=0, second=0, microsecond=0)
+    return max(datetime.fromtimestamp(version_agenda()['modificada'], tz=timezone.get_current_timezone()), inicio_hora)
+
+
+@require_GET
+@condition(etag_func=etag_disponibilidad, last_modified_func=ultima_modificacion_disponibilidad)
+def disponibilidad_view(request):
+    """
+    Huecos libres por día en formato JSON, sin necesidad de iniciar sesión.
+    Se calcula con los mapas de ocupación de la caché y el navegador revalida con
+    ETag/Last-Modified, que solo cambian cuando cambia la agenda.
+    """
+    try:
+        primero, ultimo = _rango_disponibilidad(request)
+    except (ValueError, OverflowError) as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    dias = [
+        {
+            'fecha': dia.isoformat(),
+            'huecos': [timezone.localtime(hueco).strftime("%H:%M") for hueco in huecos],
+        }
+        for dia, huecos in huecos_libres_por_dia(primero, ultimo)
+    ]
+    response = JsonResponse({'desde': primero.isoformat(), 'hasta': ultimo.isoformat(), 'dias': dias})
+    patch_cache_control(response, public=True, no_cache=True)
+    return response
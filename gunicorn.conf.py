@@ -0,0 +1,8 @@
+# Configuración de gunicorn (se carga sola al arrancar desde la raíz del proyecto)
+
+
+def post_worker_init(worker):
+    # Cada worker se calienta al arrancar, antes de aceptar peticiones:
+    # así la primera petición tras un despliegue no paga las importaciones pesadas
+    from nutrisur.arranque import calentar
+    calentar()
@@ -0,0 +1,21 @@
+from django.contrib import admin
+from django.utils import timezone
+from .models import CorreoSaliente
+
+
+@admin.register(CorreoSaliente)
+class CorreoSalienteAdmin(admin.ModelAdmin):
+    list_display = ('id', 'asunto', 'destinatarios', 'estado', 'intentos', 'creado', 'enviado')
+    list_filter = ('estado',)
+    search_fields = ('asunto', 'clave')
+    readonly_fields = ('clave', 'intentos', 'lote', 'reclamado', 'creado', 'enviado', 'ultimo_error')
+    actions = ['reintentar']
+
+    @admin.action(description='Volver a intentar el envío de los fallidos')
+    def reintentar(self, request, queryset):
+        # Solo los FALLIDOS: los PENDIENTES ya están en la cola y los ENVIANDO los tiene
+        # un trabajador ahora mismo (si su proceso murió, vuelven solos al caducar el reclamo)
+        total = queryset.filter(estado='FALLIDO').update(
+            estado='PENDIENTE', intentos=0, proximo_intento=timezone.now(), lote=''
+        )
+        self.message_user(request, f"{total} correos vuelven a la cola.")
@@ -0,0 +1,242 @@
+import threading
+import uuid
+from datetime import timedelta
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from .models import CorreoSaliente
+
+CONFIG_POR_DEFECTO = {
+    # 'hilos': trabajadores en segundo plano dentro de cada proceso web
+    # 'comando': solo encola; envía `python manage.py procesar_correos`
+    # 'sincrono': se envía al confirmar la transacción, en el mismo hilo (tests)
+    'MODO': 'hilos',
+    'HILOS': 2,
+    'LOTE': 50,
+    'MAX_INTENTOS': 5,
+    # Espera antes del reintento n: ESPERA_BASE * 2^(n-1) segundos, como mucho ESPERA_MAXIMA
+    'ESPERA_BASE': 30,
+    'ESPERA_MAXIMA': 60 * 60,
+    # Cada cuánto revisan la cola los trabajadores aunque nadie los despierte (reintentos)
+    'INTERVALO': 60,
+    # Un correo reclamado hace más de esto sin terminar (el proceso murió) vuelve a la cola
+    'RECLAMO_CADUCA': 10 * 60,
+}
+
+
+def obtener_config():
+    config = dict(CONFIG_POR_DEFECTO)
+    config.update(getattr(settings, 'NOTIFICACIONES', {}))
+    return config
+
+
+def _datos_correo(asunto, cuerpo, destinatarios, remitente=None, cuerpo_html=''):
+    return {
+        'asunto': asunto,
+        'cuerpo': cuerpo,
+        'cuerpo_html': cuerpo_html,
+        'destinatarios': list(destinatarios),
+        'remitente': remitente or settings.DEFAULT_FROM_EMAIL,
+    }
+
+
+def encolar_correo(asunto, cuerpo, destinatarios, clave=None, remitente=None, cuerpo_html=''):
+    """
+    Guarda el correo en la bandeja de salida y avisa a los trabajadores cuando la
+    transacción se confirme. Si ya hay un correo con la misma clave no se duplica.
+    Devuelve el CorreoSaliente.
+    """
+    datos = _datos_correo(asunto, cuerpo, destinatarios, remitente, cuerpo_html)
+    if clave:
+        correo, creado = CorreoSaliente.objects.get_or_create(clave=clave, defaults=datos)
+    else:
+        correo, creado = CorreoSaliente.objects.create(**datos), True
+
+    if creado:
+        transaction.on_commit(despertar)
+    return correo
+
+
+def encolar_correos(correos):
+    """
+    Varios correos con un solo INSERT: 'correos' es una lista de dicts con los mismos
+    argumentos que encolar_correo. Los que ya estaban en la bandeja (misma clave) se
+    ignoran. Los trabajadores se despiertan una vez para todo el lote.
+    """
+    filas = [
+        CorreoSaliente(clave=correo.pop('clave', None), **_datos_correo(**correo))
+        for correo in map(dict, correos)
+    ]
+    if not filas:
+        return
+    CorreoSaliente.objects.bulk_create(filas, ignore_conflicts=True)
+    transaction.on_commit(despertar)
+
+
+def _espera(intentos, config):
+    return timedelta(seconds=min(config['ESPERA_BASE'] * 2 ** (intentos - 1), config['ESPERA_MAXIMA']))
+
+
+def _reclamar(limite, config):
+    """Marca como ENVIANDO un lote de correos listos y devuelve los que ha conseguido este trabajador."""
+    ahora = timezone.now()
+    # Los que se quedaron a medias (proceso reiniciado) vuelven a estar disponibles
+    CorreoSaliente.objects.filter(
+        estado='ENVIANDO', reclamado__lt=ahora - timedelta(seconds=config['RECLAMO_CADUCA'])
+    ).update(estado='PENDIENTE')
+
+    ids = list(
+        CorreoSaliente.objects.filter(estado='PENDIENTE', proximo_intento__lte=ahora)
+        .order_by('proximo_intento', 'id').values_list('id', flat=True)[:limite]
+    )
+    if not ids:
+        return []
+    lote = uuid.uuid4().hex
+    # El filtro por estado hace que, si otro trabajador se adelanta, el UPDATE no los toque
+    CorreoSaliente.objects.filter(id__in=ids, estado='PENDIENTE').update(estado='ENVIANDO', lote=lote, reclamado=ahora)
+    return list(CorreoSaliente.objects.filter(lote=lote, estado='ENVIANDO').order_by('id'))
+
+
+def _mensaje(correo, conexion):
+    mensaje = EmailMultiAlternatives(
+        correo.asunto, correo.cuerpo, correo.remitente, correo.destinatarios, connection=conexion
+    )
+    if correo.cuerpo_html:
+        mensaje.attach_alternative(correo.cuerpo_html, 'text/html')
+    return mensaje
+
+
+def procesar_pendientes(limite=None):
+    """
+    Envía un lote de correos pendientes por una sola conexión SMTP. Los que fallan se
+    reintentan más tarde (espera exponencial) hasta MAX_INTENTOS. Devuelve cuántos ha tratado.
+    """
+    config = obtener_config()
+    correos = _reclamar(limite or config['LOTE'], config)
+    if not correos:
+        return 0
+
+    try:
+        conexion = get_connection()
+        conexion.open()
+    except Exception as e:
+        print(f"Error abriendo la conexión de correo: {e}")
+        conexion = None
+
+    try:
+        for correo in correos:
+            try:
+                if conexion is None:
+                    raise ConnectionError("Sin conexión con el servidor de correo")
+                conexion.send_messages([_mensaje(correo, conexion)])
+            except Exception as e:
+                correo.intentos += 1
+                correo.ultimo_error = str(e)
+                correo.lote = ''
+                if correo.intentos >= config['MAX_INTENTOS']:
+                    correo.estado = 'FALLIDO'
+                    print(f"Error enviando correo '{correo.asunto}' (abandonado tras {correo.intentos} intentos): {e}")
+                else:
+                    correo.estado = 'PENDIENTE'
+                    correo.proximo_intento = timezone.now() + _espera(correo.intentos, config)
+                correo.save(update_fields=['intentos', 'ultimo_error', 'lote', 'estado', 'proximo_intento'])
+            else:
+                correo.intentos += 1
+                correo.estado = 'ENVIADO'
+                correo.enviado = timezone.now()
+                correo.save(update_fields=['intentos', 'estado', 'enviado'])
+    finally:
+        if conexion is not None:
+            conexion.close()
+    return len(correos)
+
+
+def procesar_todo():
+    """Procesa lotes hasta vaciar lo que está listo para enviarse."""
+    total = 0
+    while True:
+        tratados = procesar_pendientes()
+        if not tratados:
+            return total
+        total += tratados
+
+
+class Trabajadores:
+    """
+    Unos pocos hilos (config['HILOS']) que vacían la cola: por muchos correos que se
+    encolen a la vez, nunca hay más hilos ni más conexiones SMTP que estos.
+    """
+
+    def __init__(self, hilos, intervalo, procesar=procesar_todo):
+        self.hilos = hilos
+        self.intervalo = intervalo
+        self.procesar = procesar
+        self._evento = threading.Event()
+        self._parar = threading.Event()
+        self._lock = threading.Lock()
+        self._arrancados = []
+
+    def _bucle(self):
+        while not self._parar.is_set():
+            self._evento.wait(self.intervalo)
+            if self._parar.is_set():
+                # Sin borrar el evento: así también se despiertan los demás hilos
+                break
+            self._evento.clear()
+            try:
+                self.procesar()
+            except Exception as e:
+                print(f"Error en el trabajador de correos: {e}")
+            finally:
+                close_old_connections()
+
+    def despertar(self):
+        with self._lock:
+            if not self._arrancados:
+                for i in range(self.hilos):
+                    hilo = threading.Thread(target=self._bucle, name=f'correos-{i}', daemon=True)
+                    hilo.start()
+                    self._arrancados.append(hilo)
+        self._evento.set()
+
+    def detener(self, espera=None):
+        """Para los hilos (terminan el lote en curso) y espera a que acaben."""
+        self._parar.set()
+        self._evento.set()
+        with self._lock:
+            for hilo in self._arrancados:
+                hilo.join(espera)
+
+
+_trabajadores = None
+_trabajadores_lock = threading.Lock()
+
+
+def obtener_trabajadores():
+    global _trabajadores
+    if _trabajadores is None:
+        with _trabajadores_lock:
+            if _trabajadores is None:
+                config = obtener_config()
+                _trabajadores = Trabajadores(config['HILOS'], config['INTERVALO'])
+    return _trabajadores
+
+
+def despertar():
+    """Hay correos nuevos: según el modo, se envían ya o se avisa a los trabajadores."""
+    modo = obtener_config()['MODO']
+    if modo == 'sincrono':
+        procesar_todo()
+    elif modo == 'hilos':
+        obtener_trabajadores().despertar()
+
+
+def arrancar_trabajadores():
+    """
+    Al arrancar el proceso (modo 'hilos'): pone en marcha los trabajadores y revisan la
+    cola en el acto, así lo que quedó pendiente o a la espera de reintento antes de un
+    reinicio se envía sin esperar a que este proceso encole otro correo.
+    """
+    if obtener_config()['MODO'] == 'hilos':
+        obtener_trabajadores().despertar()
@@ -0,0 +1,71 @@
+import threading
+from django.db import transaction
+
+# Avisos anotados en la transacción en curso de cada hilo, por conexión:
+# {alias: (lista de callbacks, {(funcion, args), ...}, {funcion: {ids}})}
+_local = threading.local()
+
+
+def _pendientes(conexion):
+    """
+    (anotados, lotes) de la transacción en curso. Django estrena la lista run_on_commit
+    de la conexión en cada commit o rollback, así que mientras sea la misma lista es la
+    misma transacción; lo de una transacción deshecha se queda con su lista y se descarta.
+    """
+    if not hasattr(_local, 'por_conexion'):
+        _local.por_conexion = {}
+    lista, anotados, lotes = _local.por_conexion.get(conexion.alias, (None, None, None))
+    if lista is not conexion.run_on_commit:
+        anotados, lotes = set(), {}
+        _local.por_conexion[conexion.alias] = (conexion.run_on_commit, anotados, lotes)
+    return anotados, lotes
+
+
+def _ejecutar(funcion, args):
+    try:
+        funcion(*args)
+    except Exception as e:
+        # Lo guardado ya está confirmado: un aviso que falla no debe romper la petición
+        print(f"Error despachando aviso {funcion.__name__}{args}: {e}")
+
+
+def _despachar(anotados, clave):
+    if clave not in anotados:
+        # Ya se despachó por un aviso igual de la misma transacción
+        return
+    anotados.discard(clave)
+    _ejecutar(*clave)
+
+
+def _despachar_lote(lotes, funcion):
+    ids = lotes.pop(funcion, None)
+    if ids:
+        _ejecutar(funcion, (sorted(ids),))
+
+
+def al_confirmar(funcion, *args, using=None):
+    """
+    Programa funcion(*args) para cuando se confirme la transacción en curso (o ya, si
+    no hay ninguna). Los avisos iguales de una misma transacción (misma funcion y args,
+    p. ej. guardar dos veces el mismo pedido) se despachan una sola vez, y si la
+    transacción se deshace no se despacha ninguno. Los args deben poder compararse
+    (ids, no instancias): el aviso vuelve a leer lo confirmado.
+    """
+    clave = (funcion, args)
+    anotados, _ = _pendientes(transaction.get_connection(using))
+    anotados.add(clave)
+    # Un callback por aviso: si se deshace el savepoint del primero, el siguiente sigue valiendo
+    transaction.on_commit(lambda: _despachar(anotados, clave), using=using)
+
+
+def al_confirmar_en_lote(funcion, ids, using=None):
+    """
+    Como al_confirmar, pero junta todos los ids anotados para la misma funcion en la
+    transacción y la llama una sola vez con la lista (sin repetidos): guardar 500
+    pedidos programa un único funcion([...]) que puede leerlos todos en una consulta.
+    """
+    _, lotes = _pendientes(transaction.get_connection(using))
+    pendiente = funcion in lotes
+    lotes.setdefault(funcion, set()).update(ids)
+    if not pendiente:
+        transaction.on_commit(lambda: _despachar_lote(lotes, funcion), using=using)
@@ -0,0 +1,27 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from notificaciones.cola import obtener_config, procesar_todo
+
+
+class Command(BaseCommand):
+    help = 'Envía los correos de la bandeja de salida (con --una-vez, lo pendiente y termina)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--una-vez', action='store_true', help='Vaciar la cola una vez y salir')
+
+    def handle(self, *args, **options):
+        intervalo = obtener_config()['INTERVALO']
+        while True:
+            try:
+                enviados = procesar_todo()
+                if enviados:
+                    self.stdout.write(self.style.SUCCESS(f"Procesados {enviados} correos."))
+            except Exception as e:
+                self.stdout.write(self.style.ERROR(f"Ha ocurrido un error: {e}"))
+            finally:
+                close_old_connections()
+
+            if options['una_vez']:
+                return
+            time.sleep(intervalo)
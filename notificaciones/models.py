@@ -0,0 +1,47 @@
+from django.db import models
+from django.utils import timezone
+
+
+class CorreoSaliente(models.Model):
+    """
+    Correo pendiente de enviar (bandeja de salida). Se guarda en la misma transacción
+    que el cambio que lo provoca, así que no se pierde si el proceso se reinicia, y lo
+    envían los trabajadores de notificaciones/cola.py.
+    """
+
+    ESTADOS = [
+        ('PENDIENTE', 'Pendiente'),
+        ('ENVIANDO', 'Enviando'),
+        ('ENVIADO', 'Enviado'),
+        ('FALLIDO', 'Fallido'),
+    ]
+
+    # Identifica el aviso (p. ej. 'pedido:12:nuevo:admin'): el mismo aviso no se encola dos veces
+    clave = models.CharField(max_length=200, unique=True, null=True, blank=True)
+    asunto = models.CharField(max_length=255)
+    cuerpo = models.TextField()
+    cuerpo_html = models.TextField(blank=True, default='')
+    remitente = models.CharField(max_length=255, blank=True, default='')
+    destinatarios = models.JSONField(default=list)
+
+    estado = models.CharField(max_length=10, choices=ESTADOS, default='PENDIENTE')
+    intentos = models.PositiveIntegerField(default=0)
+    proximo_intento = models.DateTimeField(default=timezone.now)
+    ultimo_error = models.TextField(blank=True, default='')
+    # Lote del trabajador que lo ha reclamado (para que dos trabajadores no envíen el mismo)
+    lote = models.CharField(max_length=32, blank=True, default='')
+    reclamado = models.DateTimeField(null=True, blank=True)
+
+    creado = models.DateTimeField(auto_now_add=True)
+    enviado = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Correo saliente"
+        verbose_name_plural = "Correos salientes"
+        indexes = [
+            # Lo que busca el trabajador: pendientes cuyo próximo intento ya ha llegado
+            models.Index(fields=['estado', 'proximo_intento'], name='correo_estado_intento_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.asunto} -> {', '.join(self.destinatarios)}"
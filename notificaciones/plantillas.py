@@ -0,0 +1,29 @@
+from functools import lru_cache
+from django.template.loader import get_template
+
+
+@lru_cache(maxsize=None)
+def plantilla(nombre):
+    """La plantilla ya compilada: se busca y se compila una sola vez por proceso."""
+    return get_template(nombre)
+
+
+def precompilar(nombres):
+    """Compila de antemano los correos indicados (texto y HTML), p. ej. al arrancar el worker."""
+    for nombre in nombres:
+        plantilla(f'{nombre}.txt')
+        plantilla(f'{nombre}.html')
+
+
+def renderizar_correo(nombre, contexto):
+    """(texto, html) del correo 'nombre', a partir de '<nombre>.txt' y '<nombre>.html'."""
+    return plantilla(f'{nombre}.txt').render(contexto), plantilla(f'{nombre}.html').render(contexto)
+
+
+def correo(nombre, contexto, asunto, destinatarios, clave=None, remitente=None):
+    """El correo renderizado, como dict listo para encolar_correos."""
+    texto, html = renderizar_correo(nombre, contexto)
+    return {
+        'asunto': asunto, 'cuerpo': texto, 'cuerpo_html': html,
+        'destinatarios': destinatarios, 'clave': clave, 'remitente': remitente,
+    }
@@ -0,0 +1,185 @@
+import threading
+from datetime import timedelta
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from unittest.mock import patch
+from .cola import Trabajadores, arrancar_trabajadores, encolar_correo, encolar_correos, procesar_pendientes
+from .eventos import al_confirmar, al_confirmar_en_lote
+from .models import CorreoSaliente
+
+
+class BackendRoto(EmailBackend):
+    """Servidor de correo que rechaza todos los envíos."""
+
+    def send_messages(self, messages):
+        raise ConnectionError("SMTP caído")
+
+
+@override_settings(NOTIFICACIONES={'MODO': 'comando', 'MAX_INTENTOS': 3, 'ESPERA_BASE': 30})
+class BandejaSalidaTests(TestCase):
+    '''
+    Pruebas de la bandeja de salida de correos y de su envío por lotes.
+    '''
+    def test_no_duplica_el_mismo_aviso(self):
+        """Caso Negativo: Encolar dos veces la misma clave deja un solo correo."""
+        primero = encolar_correo("Pedido #1", "Hola", ['a@test.com'], clave='pedido:1:nuevo:cliente')
+        segundo = encolar_correo("Pedido #1", "Hola", ['a@test.com'], clave='pedido:1:nuevo:cliente')
+        self.assertEqual(primero.pk, segundo.pk)
+        encolar_correo("Sin clave", "Hola", ['a@test.com'])
+        self.assertEqual(CorreoSaliente.objects.count(), 2)
+
+        # En lote: un INSERT, y lo que ya estaba (misma clave) se ignora
+        with self.assertNumQueries(1):
+            encolar_correos([
+                {'asunto': "Pedido #1", 'cuerpo': "Hola", 'destinatarios': ['a@test.com'], 'clave': 'pedido:1:nuevo:cliente'},
+                {'asunto': "Pedido #2", 'cuerpo': "Hola", 'destinatarios': ['b@test.com'], 'clave': 'pedido:2:nuevo:cliente'},
+            ])
+        self.assertEqual(CorreoSaliente.objects.count(), 3)
+
+    def test_lote_con_una_sola_conexion(self):
+        """Caso Rendimiento: Un lote entero se envía abriendo una única conexión con el servidor."""
+        for i in range(5):
+            encolar_correo(f"Aviso {i}", "Cuerpo", [f"c{i}@test.com"], cuerpo_html=f"<p>Aviso {i}</p>")
+
+        with patch('notificaciones.cola.get_connection', wraps=__import__('django.core.mail', fromlist=['x']).get_connection) as conexiones:
+            self.assertEqual(procesar_pendientes(), 5)
+
+        conexiones.assert_called_once()
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertEqual(mail.outbox[0].alternatives[0][1], 'text/html')
+        self.assertFalse(CorreoSaliente.objects.exclude(estado='ENVIADO').exists())
+        # Lo enviado no se vuelve a enviar
+        self.assertEqual(procesar_pendientes(), 0)
+
+    @override_settings(EMAIL_BACKEND='notificaciones.tests.BackendRoto')
+    def test_reintentos_con_espera_creciente(self):
+        """Caso Negativo: Si el envío falla se reintenta más tarde y, tras MAX_INTENTOS, se abandona."""
+        correo = encolar_correo("Aviso", "Cuerpo", ['a@test.com'])
+
+        procesar_pendientes()
+        correo.refresh_from_db()
+        self.assertEqual((correo.estado, correo.intentos), ('PENDIENTE', 1))
+        self.assertIn("SMTP caído", correo.ultimo_error)
+        primera_espera = correo.proximo_intento - timezone.now()
+        self.assertGreater(primera_espera, timedelta(seconds=20))
+        # Hasta que llegue su hora no se vuelve a intentar
+        self.assertEqual(procesar_pendientes(), 0)
+
+        for intentos in (2, 3):
+            CorreoSaliente.objects.filter(pk=correo.pk).update(proximo_intento=timezone.now())
+            procesar_pendientes()
+            correo.refresh_from_db()
+        self.assertEqual((correo.estado, correo.intentos), ('FALLIDO', 3))
+
+    def test_recupera_correos_a_medias(self):
+        """Caso Lógica: Un correo reclamado por un proceso que murió vuelve a la cola."""
+        correo = encolar_correo("Aviso", "Cuerpo", ['a@test.com'])
+        CorreoSaliente.objects.filter(pk=correo.pk).update(
+            estado='ENVIANDO', lote='perdido', reclamado=timezone.now() - timedelta(hours=1)
+        )
+        call_command('procesar_correos', '--una-vez', stdout=open('/dev/null', 'w'))
+        correo.refresh_from_db()
+        self.assertEqual(correo.estado, 'ENVIADO')
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_reintentar_solo_los_fallidos(self):
+        """Caso Negativo: La acción del admin no vuelve a encolar lo que un trabajador está enviando."""
+        fallido = encolar_correo("Fallido", "Cuerpo", ['a@test.com'])
+        enviando = encolar_correo("Enviando", "Cuerpo", ['b@test.com'])
+        CorreoSaliente.objects.filter(pk=fallido.pk).update(estado='FALLIDO', intentos=3)
+        CorreoSaliente.objects.filter(pk=enviando.pk).update(estado='ENVIANDO', lote='activo', reclamado=timezone.now())
+        admin = get_user_model().objects.create_superuser(
+            email='admin@test.com', nombre='Admin', telefono='987654320', password='pass'
+        )
+        self.client.force_login(admin)
+
+        self.client.post(reverse('admin:notificaciones_correosaliente_changelist'), {
+            'action': 'reintentar', '_selected_action': [fallido.pk, enviando.pk],
+        })
+
+        fallido.refresh_from_db()
+        enviando.refresh_from_db()
+        self.assertEqual((fallido.estado, fallido.intentos), ('PENDIENTE', 0))
+        self.assertEqual((enviando.estado, enviando.lote), ('ENVIANDO', 'activo'))
+
+
+class TrabajadoresTests(TestCase):
+
+    def test_hilos_acotados(self):
+        """Caso Rendimiento: Cientos de avisos seguidos no crean más hilos que los configurados."""
+        llamadas = threading.Semaphore(0)
+        trabajadores = Trabajadores(hilos=2, intervalo=60, procesar=llamadas.release)
+        self.addCleanup(trabajadores.detener, 5)
+        for _ in range(300):
+            trabajadores.despertar()
+        self.assertTrue(llamadas.acquire(timeout=5))
+
+        self.assertEqual(len(trabajadores._arrancados), 2)
+        self.assertTrue(all(hilo.daemon for hilo in trabajadores._arrancados))
+        trabajadores.detener(5)
+        self.assertFalse(any(hilo.is_alive() for hilo in trabajadores._arrancados))
+
+    def test_arrancan_con_el_proceso(self):
+        """Caso Lógica: Al arrancar, en modo 'hilos' los trabajadores revisan la cola sin esperar a un correo nuevo."""
+        with patch('notificaciones.cola.obtener_trabajadores') as obtener:
+            with override_settings(NOTIFICACIONES={'MODO': 'hilos'}):
+                arrancar_trabajadores()
+            obtener.return_value.despertar.assert_called_once()
+
+            with override_settings(NOTIFICACIONES={'MODO': 'comando'}):
+                arrancar_trabajadores()
+            obtener.return_value.despertar.assert_called_once()
+
+
+class AvisosDiferidosTests(TestCase):
+    '''
+    Pruebas de los avisos que se despachan al confirmar la transacción.
+    '''
+    def test_se_despachan_una_vez_al_confirmar(self):
+        """Caso Lógica: Avisos repetidos en la misma transacción se despachan una sola vez, tras el commit."""
+        despachados = []
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                for pk in (1, 1, 2, 1):
+                    al_confirmar(despachados.append, pk)
+                self.assertEqual(despachados, [])
+
+        self.assertEqual(despachados, [1, 2])
+
+    def test_transaccion_deshecha_no_avisa(self):
+        """Caso Negativo: Si la transacción se deshace no se despacha nada."""
+        despachados = []
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    al_confirmar(despachados.append, 1)
+                    raise ValueError("rollback")
+            except ValueError:
+                pass
+        self.assertEqual(despachados, [])
+
+    def test_un_aviso_que_falla_no_rompe_el_resto(self):
+        """Caso Negativo: Un aviso que falla no impide despachar los demás."""
+        despachados = []
+        def fallar(pk):
+            raise RuntimeError("sin plantilla")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            al_confirmar(fallar, 1)
+            al_confirmar(despachados.append, 2)
+        self.assertEqual(despachados, [2])
+
+    def test_lote_en_una_sola_llamada(self):
+        """Caso Rendimiento: Los ids anotados en lote para la misma función llegan juntos en una llamada."""
+        llamadas = []
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                al_confirmar_en_lote(llamadas.append, [3, 1])
+                al_confirmar_en_lote(llamadas.append, [2, 3])
+        self.assertEqual(llamadas, [[1, 2, 3]])
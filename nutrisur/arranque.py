@@ -0,0 +1,74 @@
+import time
+from django.db import connection
+
+
+def _base_de_datos():
+    connection.ensure_connection()
+
+
+def _cliente_llm():
+    # Importa google.generativeai (gRPC, protobuf), configura la clave y crea el modelo
+    from nutrisur.llm import obtener_cliente
+    proveedor = obtener_cliente().proveedor
+    if hasattr(proveedor, 'modelo'):
+        proveedor.modelo()
+
+
+def _fechas():
+    # dateparser carga sus datos de idioma la primera vez que interpreta algo en español
+    from citas.utils.dates import _dateparser
+    _dateparser().parse('25 de diciembre a las 10', languages=['es'])
+
+
+def _chatbot_citas():
+    # Al importarse fija el locale en español (locale.setlocale)
+    import citas.utils.gemini_utils  # noqa: F401
+
+
+def _catalogo():
+    from productos.catalogo import obtener_catalogo
+    obtener_catalogo()
+
+
+def _plantillas_correo():
+    from notificaciones.plantillas import precompilar
+    from pedidos.avisos import PLANTILLAS
+    precompilar(PLANTILLAS)
+
+
+def _cola_correos():
+    from notificaciones.cola import arrancar_trabajadores
+    arrancar_trabajadores()
+
+
+PASOS = [
+    ('base de datos', _base_de_datos),
+    ('cliente LLM', _cliente_llm),
+    ('dateparser', _fechas),
+    ('chatbot de citas', _chatbot_citas),
+    ('catálogo', _catalogo),
+    ('plantillas de correo', _plantillas_correo),
+    ('cola de correos', _cola_correos),
+]
+
+
+def calentar(pasos=None):
+    """
+    Hace antes de la primera petición lo que esta pagaría: importar las librerías
+    pesadas, abrir la conexión, preparar el catálogo y las plantillas de correo y poner
+    en marcha los trabajadores de la cola de correos. Un paso que falla no impide los
+    demás (la petición lo volverá a intentar).
+    Devuelve {paso: segundos}.
+    """
+    tiempos = {}
+    for nombre, paso in pasos or PASOS:
+        inicio = time.perf_counter()
+        try:
+            paso()
+        except Exception as e:
+            print(f"Error calentando '{nombre}': {e}")
+        tiempos[nombre] = time.perf_counter() - inicio
+
+    resumen = ", ".join(f"{nombre} {segundos * 1000:.0f} ms" for nombre, segundos in tiempos.items())
+    print(f"Arranque del worker ({sum(tiempos.values()) * 1000:.0f} ms): {resumen}")
+    return tiempos
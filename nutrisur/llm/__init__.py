@@ -0,0 +1,17 @@
+from .errores import ErrorLLM, LLMSaturado, LLMTiempoAgotado
+from .proveedores import ProveedorGemini, ProveedorLLM, ProveedorLocal
+from .cliente import (
+    ClienteLLM,
+    crear_cliente,
+    limpiar_json,
+    obtener_cliente,
+    reiniciar_cliente,
+)
+from .respuestas import (
+    RespuestaInvalida,
+    esquema_para_api,
+    interpretar_respuesta,
+    reparar_json,
+    validar,
+)
+from .streaming import ExtractorTexto, evento_sse, respuesta_sse
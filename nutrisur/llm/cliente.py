@@ -0,0 +1,185 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturoTimeout
+from django.conf import settings
+from .errores import LLMSaturado, LLMTiempoAgotado
+from .proveedores import crear_proveedor
+from .respuestas import RespuestaInvalida, interpretar_respuesta, limpiar_json, prompt_de_correccion
+
+CONFIG_POR_DEFECTO = {
+    'PROVEEDOR': 'gemini',
+    'MODELO': 'gemini-2.5-flash',
+    'TIMEOUT': 20,
+    'MAX_CONCURRENTES': 4,
+    'ESPERA_HUECO': 2,
+    'LOCAL': {},
+}
+
+
+def obtener_config():
+    config = dict(CONFIG_POR_DEFECTO)
+    config.update(getattr(settings, 'LLM', {}))
+    return config
+
+
+class ClienteLLM:
+    """
+    Cliente único por proceso sobre el proveedor configurado (Gemini o el local):
+    pone a cada llamada un plazo y un límite de llamadas simultáneas, para que
+    unas pocas respuestas lentas no ocupen todos los workers.
+    """
+
+    def __init__(self, proveedor, timeout, max_concurrentes, espera_hueco):
+        self.proveedor = proveedor
+        self.timeout = timeout
+        self.espera_hueco = espera_hueco
+        self._huecos = threading.BoundedSemaphore(max_concurrentes)
+        # Un hilo por hueco: una llamada colgada no puede acumular hilos sin límite
+        self._hilos = ThreadPoolExecutor(max_workers=max_concurrentes, thread_name_prefix='llm')
+        # Cómo llegan las respuestas JSON: bien a la primera, arregladas en local,
+        # tras volver a preguntar o inservibles
+        self.estadisticas = {'validas': 0, 'reparadas': 0, 'repreguntas': 0, 'fallidas': 0}
+        self._lock_estadisticas = threading.Lock()
+
+    @property
+    def disponible(self):
+        return self.proveedor.disponible
+
+    def _ocupar_hueco(self):
+        if not self._huecos.acquire(timeout=self.espera_hueco):
+            raise LLMSaturado("Demasiadas consultas al modelo en curso")
+
+    async def _aocupar_hueco(self):
+        limite = time.monotonic() + self.espera_hueco
+        while not self._huecos.acquire(blocking=False):
+            if time.monotonic() >= limite:
+                raise LLMSaturado("Demasiadas consultas al modelo en curso")
+            await asyncio.sleep(0.05)
+
+    def _contar(self, clave):
+        with self._lock_estadisticas:
+            self.estadisticas[clave] += 1
+
+    def generar(self, prompt, timeout=None, esquema=None):
+        """Devuelve el texto de la respuesta o lanza ErrorLLM si no llega a tiempo."""
+        timeout = timeout or self.timeout
+        self._ocupar_hueco()
+        try:
+            futuro = self._hilos.submit(self.proveedor.generar, prompt, esquema)
+        except Exception:
+            self._huecos.release()
+            raise
+        # El hueco se libera cuando la llamada termina de verdad, no cuando dejamos de esperarla
+        futuro.add_done_callback(lambda _: self._huecos.release())
+        try:
+            return futuro.result(timeout=timeout)
+        except FuturoTimeout:
+            raise LLMTiempoAgotado(f"El modelo no respondió en {timeout}s") from None
+
+    async def agenerar(self, prompt, timeout=None, esquema=None):
+        """Versión asíncrona de generar() para las vistas async (no ocupa un hilo mientras espera)."""
+        timeout = timeout or self.timeout
+        await self._aocupar_hueco()
+        try:
+            return await asyncio.wait_for(self.proveedor.agenerar(prompt, esquema), timeout)
+        except asyncio.TimeoutError:
+            raise LLMTiempoAgotado(f"El modelo no respondió en {timeout}s") from None
+        finally:
+            self._huecos.release()
+
+    async def agenerar_stream(self, prompt, timeout=None, esquema=None):
+        """
+        Devuelve los trozos de texto según los genera el modelo. El plazo cuenta para la
+        respuesta entera y el hueco queda ocupado hasta el último trozo.
+        """
+        timeout = timeout or self.timeout
+        await self._aocupar_hueco()
+        limite = time.monotonic() + timeout
+        trozos = self.proveedor.agenerar_stream(prompt, esquema)
+        try:
+            while True:
+                try:
+                    trozo = await asyncio.wait_for(anext(trozos), max(limite - time.monotonic(), 0))
+                except StopAsyncIteration:
+                    return
+                except asyncio.TimeoutError:
+                    raise LLMTiempoAgotado(f"El modelo no respondió en {timeout}s") from None
+                yield trozo
+        finally:
+            await trozos.aclose()
+            self._huecos.release()
+
+    # --- Respuestas JSON validadas contra un esquema (ver respuestas.py) ---
+
+    def _interpretar(self, texto, esquema):
+        datos, reparada = interpretar_respuesta(texto, esquema)
+        self._contar('reparadas' if reparada else 'validas')
+        return datos
+
+    def validar_o_repreguntar(self, texto, prompt, esquema, timeout=None):
+        """
+        Valida el texto ya recibido. Si ni reparándolo en local cumple el esquema, vuelve
+        a preguntar una vez al modelo con el error; si tampoco vale, lanza RespuestaInvalida.
+        """
+        try:
+            return self._interpretar(texto, esquema)
+        except RespuestaInvalida as e:
+            self._contar('repreguntas')
+            texto = self.generar(prompt_de_correccion(prompt, texto, e), timeout, esquema)
+        try:
+            return self._interpretar(texto, esquema)
+        except RespuestaInvalida:
+            self._contar('fallidas')
+            raise
+
+    async def avalidar_o_repreguntar(self, texto, prompt, esquema, timeout=None):
+        try:
+            return self._interpretar(texto, esquema)
+        except RespuestaInvalida as e:
+            self._contar('repreguntas')
+            texto = await self.agenerar(prompt_de_correccion(prompt, texto, e), timeout, esquema)
+        try:
+            return self._interpretar(texto, esquema)
+        except RespuestaInvalida:
+            self._contar('fallidas')
+            raise
+
+    def generar_json(self, prompt, esquema, timeout=None):
+        """Pide la respuesta como JSON estructurado y la devuelve ya validada (un dict)."""
+        return self.validar_o_repreguntar(self.generar(prompt, timeout, esquema), prompt, esquema, timeout)
+
+    async def agenerar_json(self, prompt, esquema, timeout=None):
+        texto = await self.agenerar(prompt, timeout, esquema)
+        return await self.avalidar_o_repreguntar(texto, prompt, esquema, timeout)
+
+
+_cliente = None
+_cliente_lock = threading.Lock()
+
+
+def crear_cliente(config=None):
+    config = config or obtener_config()
+    return ClienteLLM(
+        proveedor=crear_proveedor(config, api_key=getattr(settings, 'GEMINI_API_KEY', None)),
+        timeout=config['TIMEOUT'],
+        max_concurrentes=config['MAX_CONCURRENTES'],
+        espera_hueco=config['ESPERA_HUECO'],
+    )
+
+
+def obtener_cliente():
+    """Cliente compartido por todo el proceso, creado la primera vez que se necesita."""
+    global _cliente
+    if _cliente is None:
+        with _cliente_lock:
+            if _cliente is None:
+                _cliente = crear_cliente()
+    return _cliente
+
+
+def reiniciar_cliente():
+    """Descarta el cliente compartido (tras cambiar settings.LLM, p. ej. en los tests)."""
+    global _cliente
+    with _cliente_lock:
+        _cliente = None
@@ -0,0 +1,10 @@
+class ErrorLLM(Exception):
+    """Error al hablar con el modelo (los chatbots responden con su mensaje de emergencia)."""
+
+
+class LLMTiempoAgotado(ErrorLLM):
+    pass
+
+
+class LLMSaturado(ErrorLLM):
+    pass
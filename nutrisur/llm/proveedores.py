@@ -0,0 +1,203 @@
+import asyncio
+import json
+import random
+import re
+import threading
+import time
+import weakref
+from django.utils.module_loading import import_string
+from .errores import ErrorLLM
+from .respuestas import esquema_para_api
+
+
+class ProveedorLLM:
+    """
+    Interfaz mínima de un proveedor: recibe el prompt completo y devuelve el texto.
+    'esquema' es el esquema JSON que debe cumplir la respuesta; el proveedor lo usa
+    si sabe pedir salida estructurada y, si no, lo ignora (el cliente valida igualmente).
+    """
+
+    # False si falta configuración (p. ej. la clave de la API) y no merece la pena llamar
+    disponible = True
+
+    def generar(self, prompt, esquema=None):
+        raise NotImplementedError
+
+    async def agenerar(self, prompt, esquema=None):
+        raise NotImplementedError
+
+    async def agenerar_stream(self, prompt, esquema=None):
+        """Texto a trozos según llega. Por defecto, la respuesta entera de una vez."""
+        yield await self.agenerar(prompt, esquema)
+
+
+class ProveedorGemini(ProveedorLLM):
+    """Google Gemini. Configura la librería una vez y reutiliza el modelo entre llamadas."""
+
+    def __init__(self, api_key, modelo='gemini-2.5-flash'):
+        self.api_key = api_key
+        self.nombre_modelo = modelo
+        self.disponible = bool(api_key)
+        self._modelo = None
+        self._modelos_async = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        import google.generativeai as genai
+        genai.configure(api_key=api_key)
+        self._salida_estructurada = self.admite_salida_estructurada()
+
+    def _crear_modelo(self):
+        import google.generativeai as genai
+        return genai.GenerativeModel(self.nombre_modelo)
+
+    def modelo(self):
+        with self._lock:
+            if self._modelo is None:
+                self._modelo = self._crear_modelo()
+            return self._modelo
+
+    def modelo_async(self):
+        # El cliente asíncrono de gRPC queda ligado al bucle de eventos en el que se
+        # crea, así que se guarda uno por bucle (con WSGI cada vista asíncrona puede
+        # ejecutarse en un bucle distinto)
+        bucle = asyncio.get_running_loop()
+        with self._lock:
+            modelo = self._modelos_async.get(bucle)
+            if modelo is None:
+                modelo = self._crear_modelo()
+                self._modelos_async[bucle] = modelo
+            return modelo
+
+    @staticmethod
+    def admite_salida_estructurada():
+        """Las versiones antiguas de google-generativeai no saben pedir JSON con esquema."""
+        from google.ai import generativelanguage as glm
+        campos = glm.GenerationConfig.meta.fields
+        return 'response_mime_type' in campos and 'response_schema' in campos
+
+    def config_generacion(self, esquema):
+        if esquema is None or not self._salida_estructurada:
+            return None
+        return {'response_mime_type': 'application/json', 'response_schema': esquema_para_api(esquema)}
+
+    def generar(self, prompt, esquema=None):
+        return self.modelo().generate_content(prompt, generation_config=self.config_generacion(esquema)).text
+
+    async def agenerar(self, prompt, esquema=None):
+        respuesta = await self.modelo_async().generate_content_async(
+            prompt, generation_config=self.config_generacion(esquema)
+        )
+        return respuesta.text
+
+    async def agenerar_stream(self, prompt, esquema=None):
+        respuesta = await self.modelo_async().generate_content_async(
+            prompt, generation_config=self.config_generacion(esquema), stream=True
+        )
+        async for trozo in respuesta:
+            yield trozo.text
+
+
+# Respuesta por defecto del proveedor local: vale para los dos chatbots
+RESPUESTA_LOCAL = {
+    "texto_respuesta": "Respuesta de prueba del asistente local.",
+    "acciones": [],
+    "finalizar_pedido": False,
+    "datos_extraidos": {"fecha": None, "hora": None, "observaciones": None},
+    "intencion": "continuar",
+    "resetear": False,
+}
+
+# Cómo terminan los prompts de cada chatbot: así las reglas miran solo el mensaje del cliente
+PATRONES_MENSAJE = [
+    re.compile(r'Cliente: (?P<mensaje>.*)\nNutriBot \(JSON\):\s*$', re.S),
+    re.compile(r'Usuario dice: "(?P<mensaje>.*)"\s*$', re.S),
+]
+
+
+def extraer_mensaje(prompt):
+    for patron in PATRONES_MENSAJE:
+        encontrado = patron.search(prompt)
+        if encontrado:
+            return encontrado.group('mensaje')
+    return prompt
+
+
+class ProveedorLocal(ProveedorLLM):
+    """
+    Sustituto determinista para pruebas de carga, sin red ni coste.
+    Responde según reglas [{'patron': regex, 'respuesta': dict o str}, ...] aplicadas
+    al mensaje del cliente (la primera que encaje; si ninguna, RESPUESTA_LOCAL), con
+    una latencia configurable y una tasa de fallos reproducible gracias a la semilla.
+    """
+
+    def __init__(self, reglas=None, fixtures=None, latencia=0, variacion=0, tasa_fallos=0, semilla=0):
+        if fixtures:
+            with open(fixtures, encoding='utf-8') as f:
+                reglas = json.load(f)
+        self.reglas = [
+            (re.compile(regla['patron'], re.I), regla['respuesta'])
+            for regla in (reglas or [])
+        ]
+        self.latencia = latencia
+        self.variacion = variacion
+        self.tasa_fallos = tasa_fallos
+        self._azar = random.Random(semilla)
+        self._lock = threading.Lock()
+
+    def _sortear(self):
+        # Un solo generador compartido: la secuencia de fallos y latencias se repite en cada ejecución
+        with self._lock:
+            espera = self.latencia + (self._azar.uniform(0, self.variacion) if self.variacion else 0)
+            falla = self.tasa_fallos and self._azar.random() < self.tasa_fallos
+        return espera, falla
+
+    def responder(self, prompt):
+        mensaje = extraer_mensaje(prompt)
+        for patron, respuesta in self.reglas:
+            if patron.search(mensaje):
+                break
+        else:
+            respuesta = RESPUESTA_LOCAL
+        return respuesta if isinstance(respuesta, str) else json.dumps(respuesta, ensure_ascii=False)
+
+    def generar(self, prompt, esquema=None):
+        espera, falla = self._sortear()
+        if espera:
+            time.sleep(espera)
+        if falla:
+            raise ErrorLLM("Fallo simulado del proveedor local")
+        return self.responder(prompt)
+
+    async def agenerar(self, prompt, esquema=None):
+        espera, falla = self._sortear()
+        if espera:
+            await asyncio.sleep(espera)
+        if falla:
+            raise ErrorLLM("Fallo simulado del proveedor local")
+        return self.responder(prompt)
+
+    async def agenerar_stream(self, prompt, esquema=None, tamano_trozo=16):
+        # La latencia cae antes del primer trozo, como el tiempo hasta el primer token
+        texto = await self.agenerar(prompt, esquema)
+        for inicio in range(0, len(texto), tamano_trozo):
+            yield texto[inicio:inicio + tamano_trozo]
+            await asyncio.sleep(0)
+
+
+PROVEEDORES = {
+    'gemini': ProveedorGemini,
+    'local': ProveedorLocal,
+}
+
+
+def crear_proveedor(config, api_key=None):
+    """
+    config['PROVEEDOR'] es 'gemini', 'local' o la ruta de una clase propia.
+    Las opciones del proveedor local van en config['LOCAL'] y las de una clase
+    propia en config['OPCIONES'].
+    """
+    nombre = config.get('PROVEEDOR', 'gemini')
+    clase = PROVEEDORES.get(nombre) or import_string(nombre)
+    if clase is ProveedorGemini:
+        return ProveedorGemini(api_key=api_key, modelo=config['MODELO'])
+    opciones = config.get('LOCAL' if clase is ProveedorLocal else 'OPCIONES', {})
+    return clase(**{clave.lower(): valor for clave, valor in opciones.items()})
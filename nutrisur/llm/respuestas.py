@@ -0,0 +1,167 @@
+import copy
+import json
+import re
+from .errores import ErrorLLM
+
+
+class RespuestaInvalida(ErrorLLM):
+    """La respuesta del modelo no es JSON o no cumple el esquema (ni tras repararla)."""
+
+
+def limpiar_json(texto):
+    """Quita los bloques ```json que a veces añade el modelo alrededor de la respuesta."""
+    return texto.replace('```json', '').replace('```', '').strip()
+
+
+# --- Reparación local (sin volver a llamar al modelo) ---
+
+COMILLAS_TIPOGRAFICAS = str.maketrans({'“': '"', '”': '"'})
+COMA_FINAL = re.compile(r',\s*([}\]])')
+# Las cadenas JSON se emparejan enteras (también la última si quedó sin cerrar) para
+# dejarlas como están: solo se cambian True/False/None sueltos, fuera de comillas
+LITERALES_PYTHON = re.compile(r'"(?:\\.|[^"\\])*"?|\b(True|False|None)\b')
+EQUIVALENCIAS_PYTHON = {'True': 'true', 'False': 'false', 'None': 'null'}
+
+
+def _cerrar_estructuras(texto):
+    """Cierra comillas, corchetes y llaves que quedaron abiertos (respuesta cortada)."""
+    pila, en_cadena, escape = [], False, False
+    for c in texto:
+        if en_cadena:
+            if escape:
+                escape = False
+            elif c == '\\':
+                escape = True
+            elif c == '"':
+                en_cadena = False
+        elif c == '"':
+            en_cadena = True
+        elif c in '{[':
+            pila.append('}' if c == '{' else ']')
+        elif c in '}]' and pila:
+            pila.pop()
+    if en_cadena:
+        texto += '"'
+    return COMA_FINAL.sub(r'\1', texto.rstrip().rstrip(',') + ''.join(reversed(pila)))
+
+
+def reparar_json(texto):
+    """
+    Convierte el texto del modelo en un objeto JSON, arreglando los fallos habituales:
+    bloques ```json, texto antes o después del objeto, comas finales, comillas
+    tipográficas, True/False/None de Python y respuestas cortadas.
+    Devuelve (datos, reparado) o lanza RespuestaInvalida.
+    """
+    texto = limpiar_json(texto or '')
+    try:
+        return json.loads(texto), False
+    except ValueError:
+        pass
+
+    inicio = texto.find('{')
+    if inicio == -1:
+        raise RespuestaInvalida("La respuesta no contiene un objeto JSON")
+    fin = texto.rfind('}')
+    candidato = texto[inicio:fin + 1] if fin > inicio else texto[inicio:]
+    candidato = candidato.translate(COMILLAS_TIPOGRAFICAS)
+    candidato = LITERALES_PYTHON.sub(
+        lambda m: EQUIVALENCIAS_PYTHON[m.group(1)] if m.group(1) else m.group(0), candidato
+    )
+    candidato = COMA_FINAL.sub(r'\1', candidato)
+
+    for intento in (candidato, _cerrar_estructuras(candidato), _cerrar_estructuras(texto[inicio:])):
+        try:
+            return json.loads(intento), True
+        except ValueError:
+            continue
+    raise RespuestaInvalida("La respuesta no es JSON válido")
+
+
+# --- Validación contra el esquema ---
+# Los esquemas usan el subconjunto de OpenAPI que acepta Gemini (type, properties,
+# required, items, enum, nullable) más 'default' para los campos que se pueden rellenar.
+
+def validar(valor, esquema, ruta='respuesta'):
+    """
+    Comprueba el valor contra el esquema y lo normaliza (cantidad "2" -> 2,
+    "true" -> True, campos con 'default' que faltan). Lanza RespuestaInvalida.
+    """
+    if valor is None:
+        if esquema.get('nullable'):
+            return None
+        if 'default' in esquema:
+            return copy.deepcopy(esquema['default'])
+        raise RespuestaInvalida(f"{ruta}: no puede ser null")
+
+    tipo = esquema['type']
+    if tipo == 'object':
+        if not isinstance(valor, dict):
+            raise RespuestaInvalida(f"{ruta}: debe ser un objeto")
+        resultado = dict(valor)
+        for clave, subesquema in esquema.get('properties', {}).items():
+            if clave in valor:
+                resultado[clave] = validar(valor[clave], subesquema, f"{ruta}.{clave}")
+            elif 'default' in subesquema:
+                resultado[clave] = copy.deepcopy(subesquema['default'])
+            elif clave in esquema.get('required', []):
+                raise RespuestaInvalida(f"{ruta}: falta '{clave}'")
+        return resultado
+
+    if tipo == 'array':
+        if not isinstance(valor, list):
+            raise RespuestaInvalida(f"{ruta}: debe ser una lista")
+        return [validar(elemento, esquema['items'], f"{ruta}[{i}]") for i, elemento in enumerate(valor)]
+
+    if tipo == 'string':
+        if isinstance(valor, (int, float)) and not isinstance(valor, bool):
+            valor = str(valor)
+        if not isinstance(valor, str):
+            raise RespuestaInvalida(f"{ruta}: debe ser texto")
+        if 'enum' in esquema:
+            normalizado = valor.strip().lower()
+            if normalizado not in esquema['enum']:
+                raise RespuestaInvalida(f"{ruta}: '{valor}' no es uno de {esquema['enum']}")
+            return normalizado
+        return valor
+
+    if tipo == 'integer':
+        if isinstance(valor, bool):
+            raise RespuestaInvalida(f"{ruta}: debe ser un número entero")
+        if isinstance(valor, float) and valor.is_integer():
+            return int(valor)
+        if isinstance(valor, str) and valor.strip().lstrip('-').isdigit():
+            return int(valor.strip())
+        if not isinstance(valor, int):
+            raise RespuestaInvalida(f"{ruta}: debe ser un número entero")
+        return valor
+
+    if tipo == 'boolean':
+        if isinstance(valor, str) and valor.strip().lower() in ('true', 'false'):
+            return valor.strip().lower() == 'true'
+        if not isinstance(valor, bool):
+            raise RespuestaInvalida(f"{ruta}: debe ser true o false")
+        return valor
+
+    raise ValueError(f"Tipo de esquema no soportado: {tipo}")
+
+
+def esquema_para_api(esquema):
+    """El esquema sin las claves propias ('default') para enviarlo como response_schema."""
+    if isinstance(esquema, dict):
+        return {clave: esquema_para_api(valor) for clave, valor in esquema.items() if clave != 'default'}
+    return esquema
+
+
+def interpretar_respuesta(texto, esquema):
+    """Repara y valida el texto del modelo. Devuelve (datos, reparado)."""
+    datos, reparado = reparar_json(texto)
+    return validar(datos, esquema), reparado
+
+
+def prompt_de_correccion(prompt, texto, error):
+    """Prompt para volver a pedir la respuesta cuando ni la reparación local la salva."""
+    return (
+        f"{prompt}\n\n"
+        f"Tu respuesta anterior no era válida ({error}):\n{texto[:2000]}\n"
+        "Responde de nuevo SOLO con el JSON corregido, sin texto adicional."
+    )
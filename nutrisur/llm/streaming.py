@@ -0,0 +1,80 @@
+import json
+import re
+from django.http import StreamingHttpResponse
+
+
+class ExtractorTexto:
+    """
+    Saca el valor de una clave de texto de un JSON que llega a trozos, según llega,
+    sin esperar a que el JSON esté completo: así se puede ir mostrando
+    'texto_respuesta' mientras el modelo todavía escribe las acciones.
+    """
+
+    ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+    def __init__(self, clave='texto_respuesta'):
+        self._inicio = re.compile(r'"%s"\s*:\s*"' % re.escape(clave))
+        self._buffer = ''
+        self._dentro = False
+        self.terminado = False
+        self.texto = ''
+
+    def alimentar(self, trozo):
+        """Devuelve el texto nuevo que aporta este trozo (puede ser '')."""
+        if self.terminado:
+            return ''
+        self._buffer += trozo
+        if not self._dentro:
+            encontrado = self._inicio.search(self._buffer)
+            if not encontrado:
+                return ''
+            self._buffer = self._buffer[encontrado.end():]
+            self._dentro = True
+
+        salida, i, b = [], 0, self._buffer
+        while i < len(b):
+            c = b[i]
+            if c == '"':
+                self.terminado = True
+                i += 1
+                break
+            if c != '\\':
+                salida.append(c)
+                i += 1
+                continue
+            # Secuencia de escape: si está cortada entre dos trozos, se espera al siguiente
+            if i + 1 >= len(b):
+                break
+            if b[i + 1] != 'u':
+                salida.append(self.ESCAPES.get(b[i + 1], b[i + 1]))
+                i += 2
+                continue
+            if i + 6 > len(b):
+                break
+            codigo = int(b[i + 2:i + 6], 16)
+            if 0xD800 <= codigo < 0xDC00:
+                # Emoji y demás fuera del plano básico llegan como pareja de escapes (\ud83d\ude00)
+                if i + 12 > len(b):
+                    break
+                bajo = int(b[i + 8:i + 12], 16)
+                codigo = 0x10000 + ((codigo - 0xD800) << 10) + (bajo - 0xDC00)
+                i += 6
+            salida.append(chr(codigo))
+            i += 6
+
+        self._buffer = b[i:]
+        nuevo = ''.join(salida)
+        self.texto += nuevo
+        return nuevo
+
+
+def evento_sse(nombre, datos):
+    return f"event: {nombre}\ndata: {json.dumps(datos, ensure_ascii=False)}\n\n"
+
+
+def respuesta_sse(eventos):
+    """StreamingHttpResponse de Server-Sent Events sin caché ni buffer del proxy."""
+    response = StreamingHttpResponse(eventos, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
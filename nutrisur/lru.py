@@ -0,0 +1,48 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUConTTL:
+    """
+    Diccionario en memoria con tamaño máximo (se expulsa el menos usado)
+    y caducidad por elemento. Es seguro entre hilos del mismo proceso.
+    """
+
+    def __init__(self, max_elementos, ttl=None, reloj=time.monotonic):
+        self.max_elementos = max_elementos
+        self.ttl = ttl
+        self._reloj = reloj
+        self._datos = OrderedDict()  # clave -> (caduca_en, valor)
+        self._lock = threading.Lock()
+
+    def get(self, clave, defecto=None):
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None:
+                return defecto
+            caduca_en, valor = entrada
+            if caduca_en is not None and caduca_en <= self._reloj():
+                del self._datos[clave]
+                return defecto
+            self._datos.move_to_end(clave)
+            return valor
+
+    def set(self, clave, valor):
+        with self._lock:
+            caduca_en = self._reloj() + self.ttl if self.ttl else None
+            self._datos[clave] = (caduca_en, valor)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.max_elementos:
+                self._datos.popitem(last=False)
+
+    def delete(self, clave):
+        with self._lock:
+            self._datos.pop(clave, None)
+
+    def clear(self):
+        with self._lock:
+            self._datos.clear()
+
+    def __len__(self):
+        return len(self._datos)
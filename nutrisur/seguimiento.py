@@ -0,0 +1,62 @@
+class CamposSeguidosMixin:
+    """
+    Mixin de modelo que recuerda el valor de CAMPOS_SEGUIDOS tal y como se cargó de la
+    base de datos (from_db) o se guardó por última vez, así se sabe qué ha cambiado al
+    guardar sin volver a leer la fila. Al guardar una instancia que ya existía, por cada
+    campo cambiado con señal en SENALES_CAMBIO se envía (sender, instance, anterior, nuevo).
+    """
+
+    CAMPOS_SEGUIDOS = ()
+    SENALES_CAMBIO = {}
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        instancia._recordar_valores()
+        return instancia
+
+    def _recordar_valores(self, campos=None):
+        guardados = self.__dict__.setdefault('_valores_guardados', {})
+        for campo in self.CAMPOS_SEGUIDOS if campos is None else campos:
+            attname = self._meta.get_field(campo).attname
+            # Los campos diferidos (only/defer) no están: se leen si llega a hacer falta
+            if attname in self.__dict__:
+                guardados[campo] = self.__dict__[attname]
+
+    def valor_guardado(self, campo):
+        """Valor del campo en la base de datos antes de los cambios en memoria (None si la instancia es nueva)."""
+        if self._state.adding:
+            return None
+        guardados = self.__dict__.setdefault('_valores_guardados', {})
+        if campo not in guardados:
+            fila = type(self)._base_manager.using(self._state.db).filter(pk=self.pk).values(campo).first()
+            guardados[campo] = fila[campo] if fila else None
+        return guardados[campo]
+
+    def ha_cambiado(self, campo):
+        return getattr(self, self._meta.get_field(campo).attname) != self.valor_guardado(campo)
+
+    def save(self, *args, **kwargs):
+        creando = self._state.adding
+        update_fields = kwargs.get('update_fields')
+        campos = [c for c in self.CAMPOS_SEGUIDOS if update_fields is None or c in update_fields]
+        if creando:
+            # Durante las señales de la creación, lo "guardado antes" es nada
+            self._valores_guardados = dict.fromkeys(self.CAMPOS_SEGUIDOS)
+            cambios = {}
+        else:
+            cambios = {c: self.valor_guardado(c) for c in campos if c in self.SENALES_CAMBIO and self.ha_cambiado(c)}
+
+        super().save(*args, **kwargs)
+        self._recordar_valores(campos)
+
+        for campo, anterior in cambios.items():
+            self.SENALES_CAMBIO[campo].send(
+                sender=type(self), instance=self, anterior=anterior,
+                nuevo=getattr(self, self._meta.get_field(campo).attname),
+            )
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        fields = kwargs.get('fields') or (args[1] if len(args) > 1 else None)
+        self._recordar_valores([c for c in self.CAMPOS_SEGUIDOS if fields is None or c in fields])
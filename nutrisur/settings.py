@@ -43,6 +43,7 @@ INSTALLED_APPS = [
     'productos',
     'pedidos',
     'citas',
+    'notificaciones',
     'jazzmin',
     'django.contrib.admin',
     'django.contrib.auth',
@@ -156,6 +157,69 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
 
+# --- CACHÉ COMPARTIDA ---
+# Por defecto es memoria local. En producción conviene apuntar a una caché común
+# a todos los workers de gunicorn (Redis, Memcached o la tabla de la BD):
+#   CACHE_BACKEND=django.core.cache.backends.db.DatabaseCache
+#   CACHE_LOCATION=nutrisur_cache
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'nutrisur'),
+    }
+}
+
+# Segundos que se conserva cada instantánea del catálogo (se invalida al cambiar un producto)
+CATALOGO_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Segundos que se conserva el mapa de ocupación de cada día de la agenda de citas
+# (se recalcula al guardar una cita; el plazo cubre cambios hechos con update())
+CITAS_OCUPACION_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Historial del chatbot de pedidos: 'memoria' (solo este proceso), 'cache' o 'bd'
+CHATBOT_CONVERSACIONES = {
+    'BACKEND': os.getenv('CHATBOT_CONVERSACIONES_BACKEND', 'cache'),
+    'MAX_MENSAJES': 20,
+    'MAX_USUARIOS': 1000,
+    'TTL': 60 * 60 * 2,
+}
+
+# Presupuesto del historial en el prompt: últimos turnos literales y el resto resumido
+CHATBOT_CONTEXTO = {
+    'MAX_CARACTERES': 4000,
+    'TURNOS_LITERALES': 3,
+    'MAX_CARACTERES_RESUMEN': 1000,
+}
+
+# Respuestas del chatbot de pedidos reutilizadas para turnos idénticos (mismo mensaje
+# normalizado, catálogo, carrito e historial del prompt). Caché por proceso; TTL en segundos
+CHATBOT_CACHE_RESPUESTAS = {
+    'ACTIVADA': True,
+    'MAX_ELEMENTOS': 500,
+    'TTL': 60 * 10,
+}
+
+# Cliente LLM compartido por los dos chatbots. Cada llamada tiene un plazo (segundos)
+# y como mucho MAX_CONCURRENTES llamadas a la vez por proceso; si no hay hueco en
+# ESPERA_HUECO segundos se responde con el mensaje de error en vez de bloquear el worker.
+# PROVEEDOR='local' sustituye a Gemini por respuestas fijas (pruebas de carga sin red):
+#   LLM_FIXTURES=ruta/reglas.json  [{"patron": "batido", "respuesta": {...}}, ...]
+#   LLM_LATENCIA=0.8  LLM_TASA_FALLOS=0.05
+LLM = {
+    'PROVEEDOR': os.getenv('LLM_PROVEEDOR', 'gemini'),
+    'MODELO': os.getenv('LLM_MODELO', 'gemini-2.5-flash'),
+    'TIMEOUT': int(os.getenv('LLM_TIMEOUT', 20)),
+    'MAX_CONCURRENTES': int(os.getenv('LLM_MAX_CONCURRENTES', 4)),
+    'ESPERA_HUECO': 2,
+    'LOCAL': {
+        'FIXTURES': os.getenv('LLM_FIXTURES'),
+        'LATENCIA': float(os.getenv('LLM_LATENCIA', 0)),
+        'VARIACION': float(os.getenv('LLM_VARIACION', 0)),
+        'TASA_FALLOS': float(os.getenv('LLM_TASA_FALLOS', 0)),
+        'SEMILLA': int(os.getenv('LLM_SEMILLA', 0)),
+    },
+}
+
 # --- CONFIGURACIÓN DE JAZZMIN (NutriSur) ---
 
 JAZZMIN_SETTINGS = {
@@ -229,6 +293,15 @@ EMAIL_USE_TLS = True
 EMAIL_HOST_USER = os.getenv('EMAIL_HOST_USER')  # <--- PON AQUÍ TU GMAIL
 EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD') # <--- AQUÍ TU CONTRASEÑA DE APLICACIÓN (No la normal)
 DEFAULT_FROM_EMAIL = F'NutriSur Admin <{EMAIL_HOST_USER}>'
+
+# Bandeja de salida de correos (notificaciones/cola.py). MODO: 'hilos' (trabajadores en
+# cada proceso web), 'comando' (los envía `python manage.py procesar_correos`) o 'sincrono'
+NOTIFICACIONES = {
+    'MODO': os.getenv('NOTIFICACIONES_MODO', 'hilos'),
+    'HILOS': int(os.getenv('NOTIFICACIONES_HILOS', 2)),
+    'MAX_INTENTOS': 5,
+    'ESPERA_BASE': 30,
+}
 # --- INICIO DEL LOG DE DEBUG ---
 print("--------------------------------------------------")
 print(f"🕵️ DEBUG EMAIL USER: {EMAIL_HOST_USER}")
@@ -0,0 +1,27 @@
+from django.test import TestCase, override_settings
+from unittest.mock import patch
+from nutrisur.arranque import PASOS, calentar
+from nutrisur.llm import cliente as modulo_cliente
+
+
+class CalentarTests(TestCase):
+
+    @override_settings(NOTIFICACIONES={'MODO': 'comando'})
+    def test_mide_cada_paso(self):
+        """Caso Positivo: El calentamiento recorre todos los pasos y devuelve lo que tardó cada uno."""
+        with patch.object(modulo_cliente, '_cliente', None), patch('google.generativeai.configure'):
+            tiempos = calentar()
+        self.assertEqual(list(tiempos), [nombre for nombre, _ in PASOS])
+        self.assertTrue(all(segundos >= 0 for segundos in tiempos.values()))
+
+    def test_un_fallo_no_detiene_el_resto(self):
+        """Caso Negativo: Si un paso falla se sigue con los demás."""
+        hechos = []
+
+        def fallar():
+            raise RuntimeError("sin conexión")
+
+        tiempos = calentar([('roto', fallar), ('bien', lambda: hechos.append('bien'))])
+
+        self.assertEqual(list(tiempos), ['roto', 'bien'])
+        self.assertEqual(hechos, ['bien'])
@@ -1,5 +1,5 @@
 import json
-from django.test import TestCase, Client
+from django.test import TestCase, Client, override_settings
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 from django.core import mail
@@ -10,38 +10,30 @@ from citas.models import Cita
 
 User = get_user_model()
 
+# Los correos salen de la bandeja de salida al confirmar cada transacción, sin hilos
+@override_settings(NOTIFICACIONES={'MODO': 'sincrono'})
 class FlujoUsuarioNutrisurTest(TestCase):
 
     def setUp(self):
-        self.patcher = patch('threading.Thread')
-        self.mock_thread = self.patcher.start()
-        
-        def run_synchronously(target, *args, **kwargs):
-            class SyncThread:
-                def start(self):
-                    target(*args, **kwargs)
-            return SyncThread()
-            
-        self.mock_thread.side_effect = run_synchronously
-
         self.client = Client()
         
-        self.usuario = User.objects.create_user(
-            email='cliente@test.com',
-            nombre='Cliente Tester',
-            telefono='123456789',
-            password='password123',
-            is_vip=True
-        )
+        # El aviso de registro sale aquí; la bandeja se vacía antes de cada historia
+        with self.captureOnCommitCallbacks(execute=True):
+            self.usuario = User.objects.create_user(
+                email='cliente@test.com',
+                nombre='Cliente Tester',
+                telefono='123456789',
+                password='password123',
+                is_vip=True
+            )
         
-        self.prod1 = Producto.objects.create(nombre="Batido Fresa", precio=35.50)
-        self.prod2 = Producto.objects.create(nombre="Té Verde", precio=20.00)
+        # El catálogo se invalida al confirmar la transacción
+        with self.captureOnCommitCallbacks(execute=True):
+            self.prod1 = Producto.objects.create(nombre="Batido Fresa", precio=35.50)
+            self.prod2 = Producto.objects.create(nombre="Té Verde", precio=20.00)
 
         mail.outbox = []
 
-    def tearDown(self):
-        self.patcher.stop()
-
     @patch('pedidos.views.obtener_respuesta_gemini') 
     def test_historia_compra_completa(self, mock_gemini):
         self.client.force_login(self.usuario)
@@ -73,11 +65,12 @@ class FlujoUsuarioNutrisurTest(TestCase):
             "finalizar_pedido": True
         }
 
-        response = self.client.post(
-            url_chat, 
-            json.dumps({'mensaje': 'Eso es todo, gracias'}), 
-            content_type='application/json'
-        )
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                url_chat, 
+                json.dumps({'mensaje': 'Eso es todo, gracias'}), 
+                content_type='application/json'
+            )
 
         self.assertEqual(response.json()['status'], 'finalizado')
 
@@ -123,11 +116,12 @@ class FlujoUsuarioNutrisurTest(TestCase):
             "resetear": False
         }
 
-        response = self.client.post(
-            url_cita, 
-            json.dumps({'mensaje': 'Sí, perfecto'}), 
-            content_type='application/json'
-        )
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                url_cita, 
+                json.dumps({'mensaje': 'Sí, perfecto'}), 
+                content_type='application/json'
+            )
 
         self.assertEqual(response.json()['status'], 'finalizado')
 
@@ -0,0 +1,302 @@
+import asyncio
+import json
+import threading
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from datetime import timedelta
+from unittest.mock import patch
+from nutrisur.llm import (
+    ClienteLLM, ErrorLLM, ExtractorTexto, LLMSaturado, LLMTiempoAgotado, ProveedorGemini, ProveedorLLM, ProveedorLocal,
+    RespuestaInvalida, reiniciar_cliente, reparar_json, validar,
+)
+from nutrisur.llm import cliente as modulo_cliente
+from pedidos.models import Pedido
+from productos.models import Producto
+
+User = get_user_model()
+
+
+class ProveedorFalso(ProveedorLLM):
+    """Responde 'ok: <prompt>' tras esperar al evento (si lo hay)."""
+
+    def __init__(self, bloqueo=None):
+        self.bloqueo = bloqueo
+
+    def generar(self, prompt, esquema=None):
+        if self.bloqueo:
+            self.bloqueo.wait(5)
+        return f"ok: {prompt}"
+
+    async def agenerar(self, prompt, esquema=None):
+        if self.bloqueo:
+            await asyncio.sleep(5)
+        return f"ok: {prompt}"
+
+
+class ProveedorGuion(ProveedorLLM):
+    """Devuelve las respuestas indicadas, una por llamada, y guarda los prompts recibidos."""
+
+    def __init__(self, *respuestas):
+        self.respuestas = list(respuestas)
+        self.prompts = []
+
+    def generar(self, prompt, esquema=None):
+        self.prompts.append(prompt)
+        return self.respuestas.pop(0)
+
+    async def agenerar(self, prompt, esquema=None):
+        return self.generar(prompt, esquema)
+
+
+def crear_cliente_falso(proveedor, timeout=1, max_concurrentes=2):
+    return ClienteLLM(proveedor, timeout=timeout, max_concurrentes=max_concurrentes, espera_hueco=0.1)
+
+
+class ClienteLLMTests(SimpleTestCase):
+
+    def test_plazo_agotado(self):
+        """Caso Negativo: Una llamada lenta se corta al vencer el plazo."""
+        bloqueo = threading.Event()
+        cliente = crear_cliente_falso(ProveedorFalso(bloqueo), timeout=0.1)
+        try:
+            with self.assertRaises(LLMTiempoAgotado):
+                cliente.generar('lento')
+        finally:
+            bloqueo.set()
+
+    def test_limite_de_llamadas_simultaneas(self):
+        """Caso Negativo: Con todos los huecos ocupados por llamadas colgadas no se espera indefinidamente."""
+        bloqueo = threading.Event()
+        cliente = crear_cliente_falso(ProveedorFalso(bloqueo), timeout=0.05, max_concurrentes=1)
+        try:
+            with self.assertRaises(LLMTiempoAgotado):
+                cliente.generar('colgada')
+            # La llamada anterior sigue en curso y ocupa el único hueco
+            with self.assertRaises(LLMSaturado):
+                cliente.generar('otra')
+        finally:
+            bloqueo.set()
+
+        cliente._hilos.shutdown(wait=True)
+        self.assertTrue(cliente._huecos.acquire(blocking=False))
+
+    def test_agenerar(self):
+        """Caso Positivo: La versión asíncrona respeta el plazo y libera el hueco."""
+        cliente = crear_cliente_falso(ProveedorFalso(), max_concurrentes=1)
+        self.assertEqual(asyncio.run(cliente.agenerar('hola')), 'ok: hola')
+
+        lento = crear_cliente_falso(ProveedorFalso(bloqueo=True), timeout=0.05, max_concurrentes=1)
+        with self.assertRaises(LLMTiempoAgotado):
+            asyncio.run(lento.agenerar('lento'))
+        self.assertTrue(lento._huecos.acquire(blocking=False))
+
+    def test_cliente_unico_por_proceso(self):
+        """Caso Lógica: obtener_cliente configura la librería una sola vez."""
+        with patch.object(modulo_cliente, '_cliente', None), \
+             patch('google.generativeai.configure') as configure:
+            primero = modulo_cliente.obtener_cliente()
+            self.assertIs(modulo_cliente.obtener_cliente(), primero)
+        configure.assert_called_once()
+
+
+class StreamingTests(SimpleTestCase):
+
+    def test_extractor_con_trozos_cortados(self):
+        """Caso Positivo: El texto sale según llega aunque los escapes queden partidos entre trozos."""
+        respuesta = '```json\n{"texto_respuesta": "Hola \\"Ana\\",\\n ¿un t\\u00e9? \\ud83d\\ude00", "acciones": []}'
+        extractor = ExtractorTexto()
+        partes = [extractor.alimentar(respuesta[i:i + 3]) for i in range(0, len(respuesta), 3)]
+
+        self.assertEqual(''.join(partes), 'Hola "Ana",\n ¿un té? \U0001F600')
+        self.assertTrue(extractor.terminado)
+        self.assertGreater(len([p for p in partes if p]), 3)
+
+    def test_stream_con_plazo(self):
+        """Caso Negativo: El plazo también corta una respuesta en streaming y libera el hueco."""
+        cliente = crear_cliente_falso(ProveedorFalso(bloqueo=True), timeout=0.05, max_concurrentes=1)
+
+        async def consumir():
+            return [trozo async for trozo in cliente.agenerar_stream('lento')]
+
+        with self.assertRaises(LLMTiempoAgotado):
+            asyncio.run(consumir())
+        self.assertTrue(cliente._huecos.acquire(blocking=False))
+
+
+class ProveedorLocalTests(SimpleTestCase):
+
+    def test_reglas_sobre_el_mensaje_del_cliente(self):
+        """Caso Positivo: Las reglas miran el mensaje, no el catálogo que va en el prompt."""
+        proveedor = ProveedorLocal(reglas=[{'patron': 'batido', 'respuesta': 'BATIDO'}])
+        self.assertEqual(proveedor.generar("- Batido Fresa\nCliente: hola\nNutriBot (JSON):"), ProveedorLocal().generar('x'))
+        self.assertEqual(proveedor.generar("Cliente: quiero un batido\nNutriBot (JSON):"), 'BATIDO')
+        self.assertEqual(proveedor.generar('Usuario dice: "un BATIDO"\n'), 'BATIDO')
+
+    def test_fallos_reproducibles(self):
+        """Caso Lógica: Con la misma semilla los fallos simulados caen en las mismas llamadas."""
+        def secuencia():
+            proveedor = ProveedorLocal(tasa_fallos=0.5, semilla=7)
+            resultado = []
+            for _ in range(20):
+                try:
+                    proveedor.generar('x')
+                    resultado.append(True)
+                except ErrorLLM:
+                    resultado.append(False)
+            return resultado
+
+        primera = secuencia()
+        self.assertEqual(primera, secuencia())
+        self.assertIn(True, primera)
+        self.assertIn(False, primera)
+
+
+ESQUEMA_PRUEBA = {
+    'type': 'object',
+    'properties': {
+        'texto_respuesta': {'type': 'string'},
+        'acciones': {
+            'type': 'array',
+            'default': [],
+            'items': {
+                'type': 'object',
+                'properties': {
+                    'tipo': {'type': 'string', 'enum': ['agregar', 'eliminar']},
+                    'cantidad': {'type': 'integer'},
+                },
+                'required': ['tipo', 'cantidad'],
+            },
+        },
+        'finalizar_pedido': {'type': 'boolean', 'default': False},
+    },
+    'required': ['texto_respuesta'],
+}
+
+
+class RespuestasJSONTests(SimpleTestCase):
+
+    def test_reparacion_local(self):
+        """Caso Positivo: Los fallos típicos del modelo se arreglan sin volver a llamarlo."""
+        self.assertEqual(reparar_json('{"a": 1}'), ({'a': 1}, False))
+        self.assertEqual(reparar_json('```json\n{"a": 1}\n```'), ({'a': 1}, False))
+        self.assertEqual(reparar_json('Aquí tienes: {"a": [1, 2,], "b": True}. ¡Saludos!'), ({'a': [1, 2], 'b': True}, True))
+        # Respuesta cortada a mitad de una cadena
+        self.assertEqual(reparar_json('{"texto_respuesta": "Hola, {amigo", "acciones": [{"tipo": "agr'),
+                         ({'texto_respuesta': 'Hola, {amigo', 'acciones': [{'tipo': 'agr'}]}, True))
+        # True/False/None de Python solo se cambian fuera de las cadenas
+        self.assertEqual(reparar_json('{"respuesta_bot": "None es True", "a": 1,}'),
+                         ({'respuesta_bot': 'None es True', 'a': 1}, True))
+        self.assertEqual(reparar_json('{"a": None, "b": "di \\"False\\" y True", "c": False,}'),
+                         ({'a': None, 'b': 'di "False" y True', 'c': False}, True))
+        with self.assertRaises(RespuestaInvalida):
+            reparar_json('Lo siento, no puedo ayudarte.')
+
+    def test_validacion_con_esquema(self):
+        """Caso Lógica: Se normalizan tipos y se rellenan valores por defecto; lo que no encaja se rechaza."""
+        datos = validar({'texto_respuesta': 'Hecho', 'acciones': [{'tipo': 'Agregar', 'cantidad': '2'}]}, ESQUEMA_PRUEBA)
+        self.assertEqual(datos, {
+            'texto_respuesta': 'Hecho',
+            'acciones': [{'tipo': 'agregar', 'cantidad': 2}],
+            'finalizar_pedido': False,
+        })
+        for invalido in (
+            {'acciones': []},
+            {'texto_respuesta': 'x', 'acciones': [{'tipo': 'regalar', 'cantidad': 1}]},
+            {'texto_respuesta': 'x', 'acciones': [{'tipo': 'agregar', 'cantidad': 'dos'}]},
+            {'texto_respuesta': 'x', 'finalizar_pedido': 'quizá'},
+        ):
+            with self.assertRaises(RespuestaInvalida):
+                validar(invalido, ESQUEMA_PRUEBA)
+
+    def test_repregunta_una_sola_vez(self):
+        """Caso Negativo: Si la reparación no basta se repregunta con el error, y solo una vez."""
+        proveedor = ProveedorGuion('{"acciones": []}', '{"texto_respuesta": "Ahora sí"}')
+        cliente = crear_cliente_falso(proveedor)
+        self.assertEqual(cliente.generar_json('prompt', ESQUEMA_PRUEBA)['texto_respuesta'], 'Ahora sí')
+        self.assertIn("falta 'texto_respuesta'", proveedor.prompts[1])
+
+        cliente_async = crear_cliente_falso(ProveedorGuion('nada', 'tampoco', 'no se usa'))
+        with self.assertRaises(RespuestaInvalida):
+            asyncio.run(cliente_async.agenerar_json('prompt', ESQUEMA_PRUEBA))
+        self.assertEqual(cliente.estadisticas, {'validas': 1, 'reparadas': 0, 'repreguntas': 1, 'fallidas': 0})
+        self.assertEqual(cliente_async.estadisticas['fallidas'], 1)
+
+    def test_salida_estructurada_segun_version(self):
+        """Caso Lógica: El esquema solo se envía a Gemini si la librería instalada lo admite."""
+        with patch('google.generativeai.configure'), \
+             patch.object(ProveedorGemini, 'admite_salida_estructurada', return_value=False):
+            self.assertIsNone(ProveedorGemini('clave').config_generacion(ESQUEMA_PRUEBA))
+        with patch('google.generativeai.configure'), \
+             patch.object(ProveedorGemini, 'admite_salida_estructurada', return_value=True):
+            config = ProveedorGemini('clave').config_generacion(ESQUEMA_PRUEBA)
+        self.assertEqual(config['response_mime_type'], 'application/json')
+        self.assertNotIn('default', config['response_schema']['properties']['finalizar_pedido'])
+
+
+@override_settings(LLM={'PROVEEDOR': 'local', 'LOCAL': {'REGLAS': [{
+    'patron': 'aloe',
+    'respuesta': {
+        'texto_respuesta': 'Añadido el aloe.',
+        'acciones': [{'tipo': 'agregar', 'producto_nombre': 'Aloe Vera', 'cantidad': 2}],
+        'finalizar_pedido': False,
+    },
+}]}})
+class ProveedorLocalVistasTests(TestCase):
+
+    def setUp(self):
+        reiniciar_cliente()
+        self.addCleanup(reiniciar_cliente)
+        self.usuario = User.objects.create_user(email='vip@test.com', nombre='VIP', telefono='600000000', password='pass', is_vip=True)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.aloe = Producto.objects.create(nombre='Aloe Vera', precio=10)
+        self.client.force_login(self.usuario)
+
+    def test_chatbot_pedidos_sin_red(self):
+        """Caso Positivo: El recorrido completo del chatbot de pedidos funciona con el proveedor local."""
+        self.client.get(reverse('chatbot_pedidos'))
+        response = self.client.post(reverse('procesar_mensaje_pedido'), {'mensaje': 'me apetece algo de aloe'}, content_type='application/json')
+
+        self.assertEqual(response.status_code, 200)
+        pedido = Pedido.objects.get(usuario=self.usuario, estado='B')
+        self.assertEqual(pedido.pedidoproducto_set.get().cantidad, 2)
+
+    def test_chatbot_citas_sin_red(self):
+        """Caso Positivo: El chatbot de citas recibe la respuesta por defecto del proveedor local."""
+        response = self.client.post(reverse('procesar_mensaje_cita'), {'mensaje': 'hola'}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+
+    async def leer_eventos(self, url, mensaje):
+        await self.async_client.aforce_login(self.usuario)
+        response = await self.async_client.post(url, {'mensaje': mensaje}, content_type='application/json')
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        contenido = b''.join([trozo async for trozo in response.streaming_content]).decode()
+        eventos = []
+        for bloque in contenido.strip().split('\n\n'):
+            nombre, datos = bloque.split('\n')
+            eventos.append((nombre.removeprefix('event: '), json.loads(datos.removeprefix('data: '))))
+        return eventos
+
+    async def test_stream_pedidos(self):
+        """Caso Positivo: El texto llega en varios eventos y el carrito en el evento final."""
+        eventos = await self.leer_eventos(reverse('procesar_mensaje_pedido_stream'), 'me apetece algo de aloe')
+
+        textos = [datos['texto'] for nombre, datos in eventos if nombre == 'texto']
+        self.assertGreater(len(textos), 1)
+        self.assertEqual(''.join(textos), 'Añadido el aloe.')
+        nombre, fin = eventos[-1]
+        self.assertEqual(nombre, 'fin')
+        self.assertEqual(fin['items'][0]['cantidad'], 2)
+        self.assertEqual(fin['total_pedido'], 20.0)
+
+    async def test_stream_citas_guarda_la_sesion(self):
+        """Caso Positivo: El chatbot de citas en streaming guarda la reserva en curso en la sesión."""
+        dia = timezone.localdate() + timedelta(days=14)
+        dia += timedelta(days=(1 - dia.weekday()) % 7)
+        eventos = await self.leer_eventos(reverse('procesar_mensaje_cita_stream'), f"{dia.strftime('%d/%m/%Y')} a las 10")
+
+        nombre, fin = eventos[-1]
+        self.assertEqual((nombre, fin['status']), ('fin', 'ok'))
+        sesion = await self.async_client.asession()
+        self.assertEqual((await sesion.aget('cita_temporal'))['hora'], '10:00')
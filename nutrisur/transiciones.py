@@ -0,0 +1,31 @@
+from django.db import connections, transaction
+
+
+def actualizar_estado(queryset, estado, campo='estado'):
+    """
+    Pone campo=estado en las filas del queryset que aún no lo tienen y devuelve sus ids,
+    con una sola sentencia UPDATE ... WHERE campo <> estado RETURNING id. No carga
+    instancias ni envía señales: quien llama programa los avisos de los ids devueltos.
+    """
+    modelo = queryset.model
+    conexion = connections[queryset.db]
+
+    if not conexion.features.can_return_columns_from_insert:
+        # Sin RETURNING (SQLite < 3.35...): se leen los ids bloqueados y se actualizan
+        with transaction.atomic(using=queryset.db):
+            ids = list(queryset.exclude(**{campo: estado}).select_for_update().values_list('pk', flat=True))
+            modelo._base_manager.using(queryset.db).filter(pk__in=ids).update(**{campo: estado})
+        return ids
+
+    quote = conexion.ops.quote_name
+    tabla = quote(modelo._meta.db_table)
+    columna = quote(modelo._meta.get_field(campo).column)
+    pk = quote(modelo._meta.pk.column)
+    subconsulta, params = queryset.order_by().values('pk').query.get_compiler(queryset.db).as_sql()
+    sql = (
+        f"UPDATE {tabla} SET {columna} = %s "
+        f"WHERE {columna} <> %s AND {pk} IN ({subconsulta}) RETURNING {pk}"
+    )
+    with conexion.cursor() as cursor:
+        cursor.execute(sql, [estado, estado, *params])
+        return [fila[0] for fila in cursor.fetchall()]
@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Pedido, PedidoProducto, ConfiguracionChatbot
+from .models import Pedido, PedidoProducto, ConfiguracionChatbot, recalculo_agrupado
+from .transiciones import cambiar_estado_pedidos
 
 class PedidoProductoInline(admin.TabularInline):
     model = PedidoProducto
@@ -28,9 +29,20 @@ class PedidoAdmin(admin.ModelAdmin):
         return super().formfield_for_choice_field(db_field, request, **kwargs)
     
 
+    def get_queryset(self, request):
+        # El usuario en la misma consulta del listado (sin N+1)
+        return super().get_queryset(request).select_related('usuario')
+
+    def save_related(self, request, form, formsets, change):
+        # Las líneas del inline se guardan sin recalcular una a una; el total, una vez al final
+        with recalculo_agrupado():
+            super().save_related(request, form, formsets, change)
+        form.instance.recalcular_total()
+
     def calcular_total_display(self, obj):
         return f"{obj.calcular_total():.2f} €"
     calcular_total_display.short_description = "Total"
+    calcular_total_display.admin_order_field = 'total'
     
     def is_vip_display(self, obj):
         return obj.usuario.is_vip
@@ -39,30 +51,23 @@ class PedidoAdmin(admin.ModelAdmin):
     is_vip_display.short_description = "Cliente VIP" # Título de la columna
     is_vip_display.admin_order_field = 'usuario__es_vip'
     
+    def save_model(self, request, obj, form, change):
+        # Si solo cambia el estado (la columna editable del listado) basta un UPDATE:
+        # el servicio de transiciones programa los correos igual que save()
+        if change and form.changed_data == ['estado']:
+            cambiar_estado_pedidos([obj.pk], obj.estado)
+        else:
+            super().save_model(request, obj, form, change)
+
     @admin.action(description='Marcar como Pendiente')
     def marcar_como_pendiente(self, request, queryset):
-        # ANTES: queryset.update(estado='P')  <-- Esto no enviaba correos
-        
-        # AHORA: Recorremos y guardamos uno a uno
-        count = 0
-        for pedido in queryset:
-            pedido.estado = 'P'
-            pedido.save() # ¡AQUÍ ES DONDE SALTA LA SEÑAL!
-            count += 1
-            
+        # Un solo UPDATE para todos; los correos de los que cambian se encolan en lote
+        count = len(cambiar_estado_pedidos(queryset, 'P'))
         self.message_user(request, f"{count} pedidos marcados como Pendientes.")
 
     @admin.action(description='Marcar como Realizado')
     def marcar_como_realizado(self, request, queryset):
-        # ANTES: queryset.update(estado='R')
-        
-        # AHORA:
-        count = 0
-        for pedido in queryset:
-            pedido.estado = 'R'
-            pedido.save() # Al hacer save(), se activa enviar_aviso_cliente en signals.py
-            count += 1
-            
+        count = len(cambiar_estado_pedidos(queryset, 'R'))
         self.message_user(request, f"{count} pedidos marcados como Realizados y correos enviados.")
 
 @admin.register(ConfiguracionChatbot)
@@ -0,0 +1,62 @@
+from django.conf import settings
+from django.db.models import Prefetch
+from notificaciones.plantillas import correo
+from .models import Pedido, PedidoProducto
+
+SITIO = "https://nutrisur.onrender.com"
+
+# Correos de pedidos (pedidos/templates/pedidos/correos/<nombre>.txt y .html)
+PLANTILLAS = ['pedidos/correos/nuevo_pedido_admin', 'pedidos/correos/nuevo_pedido_cliente',
+              'pedidos/correos/pedido_realizado', 'pedidos/correos/nuevo_usuario']
+
+
+def pedidos_para_aviso(ids):
+    """
+    Los pedidos tal y como quedaron al confirmar la transacción, con cliente, líneas y
+    productos: dos consultas en total, sean cuantos sean.
+    """
+    lineas = PedidoProducto.objects.select_related('producto').order_by('id')
+    return (
+        Pedido.objects.filter(pk__in=ids).select_related('usuario')
+        .prefetch_related(Prefetch('pedidoproducto_set', queryset=lineas)).order_by('id')
+    )
+
+
+def resumen_pedido(pedido):
+    """
+    Lo que muestran los correos de un pedido, sacado una vez de un pedido de
+    pedidos_para_aviso: todos los correos de ese pedido se renderizan desde aquí sin consultas.
+    """
+    return {
+        'id': pedido.id,
+        'cliente': {'nombre': pedido.usuario.nombre, 'email': pedido.usuario.email},
+        'lineas': [
+            {'cantidad': item.cantidad, 'producto': item.producto.nombre, 'subtotal': item.subtotal}
+            for item in pedido.pedidoproducto_set.all()
+        ],
+        'total': pedido.total,
+        'url_admin': f"{SITIO}/admin/pedidos/pedido/{pedido.id}/change/",
+    }
+
+
+def correos_nuevo_pedido(resumen):
+    """El aviso al administrador y la confirmación al cliente de un pedido nuevo."""
+    contexto = {'pedido': resumen}
+    # La clave evita avisar dos veces del mismo pedido si se vuelve a guardar
+    return [
+        correo('pedidos/correos/nuevo_pedido_admin', contexto, f"💰 Nuevo Pedido Recibido #{resumen['id']}",
+               [settings.EMAIL_HOST_USER], clave=f"pedido:{resumen['id']}:nuevo:admin"),
+        correo('pedidos/correos/nuevo_pedido_cliente', contexto, f"✅ Pedido Confirmado #{resumen['id']} - NutriSur",
+               [resumen['cliente']['email']], clave=f"pedido:{resumen['id']}:nuevo:cliente"),
+    ]
+
+
+def correo_pedido_realizado(resumen):
+    return correo('pedidos/correos/pedido_realizado', {'pedido': resumen}, "🚚 ¡Tu pedido ha sido enviado!",
+                  [resumen['cliente']['email']], clave=f"pedido:{resumen['id']}:realizado")
+
+
+def correo_nuevo_usuario(usuario):
+    contexto = {'usuario': usuario, 'url_admin': f"{SITIO}/admin/usuarios/"}
+    return correo('pedidos/correos/nuevo_usuario', contexto, f"👤 Nuevo Usuario Registrado: {usuario.nombre}",
+                  [settings.EMAIL_HOST_USER], clave=f"usuario:{usuario.id}:registro", remitente=settings.EMAIL_HOST_USER)
@@ -0,0 +1,103 @@
+import copy
+import hashlib
+import json
+import threading
+from django.conf import settings
+from nutrisur.lru import LRUConTTL
+from productos.buscador import normalizar
+
+CONFIG_POR_DEFECTO = {
+    'ACTIVADA': True,
+    'MAX_ELEMENTOS': 500,
+    'TTL': 60 * 10,
+}
+
+
+def obtener_config():
+    config = dict(CONFIG_POR_DEFECTO)
+    config.update(getattr(settings, 'CHATBOT_CACHE_RESPUESTAS', {}))
+    return config
+
+
+def _resumen(datos):
+    return hashlib.sha1(json.dumps(datos, ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+
+def huella_carrito(estado_pedido):
+    """Mismo carrito (productos, cantidades y precios) -> misma huella."""
+    return _resumen(sorted(
+        (item['id_producto'], item['cantidad'], item['precio_unitario']) for item in estado_pedido['items']
+    ))
+
+
+def clave_respuesta(mensaje, version_catalogo, estado_pedido, contexto, instrucciones=''):
+    """
+    Clave de un turno: mensaje normalizado ('¡Sí!' == 'si'), versión del catálogo,
+    huella del carrito, huella del bloque de historial que va en el prompt (turnos
+    literales y resumen de los anteriores, de ensamblar_contexto) y notas del
+    administrador. La caché es común a todos los usuarios: solo comparten respuesta
+    los turnos cuyo prompt sería el mismo.
+    """
+    return ':'.join([
+        normalizar(mensaje),
+        str(version_catalogo),
+        huella_carrito(estado_pedido),
+        _resumen(contexto),
+        _resumen(instrucciones),
+    ])
+
+
+class CacheRespuestas:
+    """Respuestas ya generadas por el modelo, con tamaño máximo, caducidad y contadores."""
+
+    def __init__(self, max_elementos, ttl):
+        self._respuestas = LRUConTTL(max_elementos, ttl=ttl)
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+
+    def obtener(self, clave):
+        respuesta = self._respuestas.get(clave)
+        with self._lock:
+            if respuesta is None:
+                self.fallos += 1
+            else:
+                self.aciertos += 1
+        # Copia: quien la recibe le añade el historial de su usuario
+        return copy.deepcopy(respuesta)
+
+    def guardar(self, clave, respuesta):
+        self._respuestas.set(clave, copy.deepcopy(respuesta))
+
+    def limpiar(self):
+        self._respuestas.clear()
+        with self._lock:
+            self.aciertos = self.fallos = 0
+
+    def estadisticas(self):
+        with self._lock:
+            consultas = self.aciertos + self.fallos
+            return {
+                'aciertos': self.aciertos,
+                'fallos': self.fallos,
+                'tasa_aciertos': round(self.aciertos / consultas, 3) if consultas else 0.0,
+                'elementos': len(self._respuestas),
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def obtener_cache_respuestas():
+    """Caché del proceso, o None si está desactivada en settings."""
+    global _cache
+    config = obtener_config()
+    if not config['ACTIVADA']:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            # Con varios hilos por worker, solo el primero la crea: nadie pierde entradas ni contadores
+            if _cache is None:
+                _cache = CacheRespuestas(config['MAX_ELEMENTOS'], config['TTL'])
+    return _cache
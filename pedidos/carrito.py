@@ -0,0 +1,88 @@
+from django.db import transaction
+from productos.catalogo import obtener_catalogo
+from productos.models import Producto
+from .models import PedidoProducto, recalculo_agrupado
+
+
+def calcular_cantidades(actuales, acciones):
+    """
+    Aplica en memoria y en orden las acciones sobre las cantidades actuales
+    {producto_id: cantidad}. Mantiene las reglas del chatbot:
+    - 'agregar' suma la cantidad.
+    - 'eliminar' resta; con cantidad 0 o si el resultado es <= 0, quita el producto.
+    """
+    cantidades = dict(actuales)
+    for tipo, producto_id, cantidad in acciones:
+        actual = cantidades.get(producto_id, 0)
+        if tipo == 'agregar' and cantidad > 0:
+            cantidades[producto_id] = actual + cantidad
+        elif tipo == 'eliminar' and actual:
+            if cantidad == 0 or actual - cantidad <= 0:
+                cantidades[producto_id] = 0
+            else:
+                cantidades[producto_id] = actual - cantidad
+    return cantidades
+
+
+def precios_actuales(ids):
+    """
+    Precio vigente de cada producto sacado de la instantánea del catálogo;
+    solo se consulta la BD por los que no estén en ella (catálogo recién cambiado).
+    """
+    ids = set(ids)
+    precios = {p['id']: p['precio'] for p in obtener_catalogo()['productos'] if p['id'] in ids}
+    faltan = ids - set(precios)
+    if faltan:
+        precios.update(Producto.objects.filter(id__in=faltan).values_list('id', 'precio'))
+    return precios
+
+
+def aplicar_acciones(pedido, acciones):
+    """
+    Aplica una lista de acciones [(tipo, producto_id, cantidad), ...] al pedido
+    con un número fijo de consultas, sea cual sea el número de acciones:
+    una lectura de las líneas afectadas y, como mucho, un bulk_create,
+    un bulk_update y un delete, todo dentro de la misma transacción.
+    Las líneas nuevas guardan el precio del momento y el total del pedido
+    se actualiza al final.
+    """
+    if not acciones:
+        return
+
+    ids = {producto_id for _, producto_id, _ in acciones}
+
+    with transaction.atomic():
+        lineas = {
+            pp.producto_id: pp
+            for pp in PedidoProducto.objects.select_for_update().filter(pedido=pedido, producto_id__in=ids)
+        }
+        actuales = {producto_id: pp.cantidad for producto_id, pp in lineas.items()}
+        finales = calcular_cantidades(actuales, acciones)
+
+        precios = precios_actuales([pid for pid, cantidad in finales.items() if pid not in lineas and cantidad > 0])
+
+        nuevas, modificadas, borradas = [], [], []
+        for producto_id, cantidad in finales.items():
+            linea = lineas.get(producto_id)
+            if linea is None:
+                # Si el producto ya no existe no tiene precio: la acción se ignora
+                if cantidad > 0 and producto_id in precios:
+                    nuevas.append(PedidoProducto(
+                        pedido=pedido, producto_id=producto_id, cantidad=cantidad, precio_unitario=precios[producto_id]
+                    ))
+            elif cantidad <= 0:
+                borradas.append(linea.id)
+            elif cantidad != linea.cantidad:
+                linea.cantidad = cantidad
+                modificadas.append(linea)
+
+        if nuevas:
+            PedidoProducto.objects.bulk_create(nuevas)
+        if modificadas:
+            PedidoProducto.objects.bulk_update(modificadas, ['cantidad'])
+        if borradas:
+            # El total se recalcula una vez abajo, no por cada línea borrada
+            with recalculo_agrupado():
+                PedidoProducto.objects.filter(id__in=borradas).delete()
+        if nuevas or modificadas or borradas:
+            pedido.recalcular_total()
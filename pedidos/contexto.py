@@ -0,0 +1,91 @@
+from django.conf import settings
+from django.core.cache import cache
+
+CONFIG_POR_DEFECTO = {
+    'MAX_CARACTERES': 4000,          # Presupuesto del bloque de historial (~4 caracteres por token)
+    'TURNOS_LITERALES': 3,           # Intercambios cliente/bot que se copian tal cual
+    'MAX_CARACTERES_RESUMEN': 1000,  # Tope del resumen de turnos antiguos
+    'MAX_CARACTERES_LINEA': 120,     # Cada mensaje antiguo queda en una línea de este tamaño
+}
+
+PREFIJO_RESUMEN = 'chatbot:resumen:'
+
+
+def obtener_config():
+    config = dict(CONFIG_POR_DEFECTO)
+    config.update(getattr(settings, 'CHATBOT_CONTEXTO', {}))
+    return config
+
+
+def _remitente(mensaje):
+    return "Cliente" if mensaje['remitente'] == 'usuario' else "NutriBot"
+
+
+def _recortar(texto, limite):
+    texto = " ".join(str(texto).split())
+    return texto if len(texto) <= limite else texto[:limite - 1] + "…"
+
+
+def plegar_en_resumen(resumen, mensajes, config):
+    """Añade al resumen una línea compacta por mensaje y lo limita por el final."""
+    lineas = [resumen] if resumen else []
+    for mensaje in mensajes:
+        lineas.append(f"- {_remitente(mensaje)}: {_recortar(mensaje['contenido'], config['MAX_CARACTERES_LINEA'])}")
+
+    resumen = "\n".join(lineas)
+    limite = config['MAX_CARACTERES_RESUMEN']
+    if len(resumen) > limite:
+        # Conservamos lo más reciente, que es lo que suele importar para el pedido
+        resumen = "…" + resumen[-(limite - 1):]
+    return resumen
+
+
+def obtener_resumen(usuario_id, antiguos, config):
+    """
+    Resumen acumulado de los mensajes que ya no entran literalmente.
+    Se guarda en caché junto con el número del último mensaje incorporado,
+    así cada turno solo pliega los mensajes nuevos (y conserva los que el
+    almacén de conversaciones ya ha descartado).
+    """
+    clave = f"{PREFIJO_RESUMEN}{usuario_id}"
+    guardado = cache.get(clave) or {'hasta': 0, 'texto': ""}
+
+    nuevos = [m for m in antiguos if m.get('n', 0) > guardado['hasta']]
+    if not nuevos:
+        return guardado['texto']
+
+    guardado = {
+        'hasta': nuevos[-1].get('n', 0),
+        'texto': plegar_en_resumen(guardado['texto'], nuevos, config),
+    }
+    cache.set(clave, guardado, getattr(settings, 'CHATBOT_CONVERSACIONES', {}).get('TTL', 60 * 60 * 2))
+    return guardado['texto']
+
+
+def ensamblar_contexto(usuario_id, historial):
+    """
+    Construye el bloque de historial para el prompt dentro del presupuesto de
+    caracteres: los últimos turnos van literales y el resto se resume.
+    """
+    config = obtener_config()
+    if not historial:
+        cache.delete(f"{PREFIJO_RESUMEN}{usuario_id}")
+        return "--- HISTORIAL DE CONVERSACIÓN ---\n"
+
+    corte = max(len(historial) - config['TURNOS_LITERALES'] * 2, 0)
+    literales = [f"{_remitente(m)}: {m['contenido']}" for m in historial[corte:]]
+
+    # Si los turnos literales no caben, los más antiguos pasan también al resumen
+    presupuesto = config['MAX_CARACTERES'] - config['MAX_CARACTERES_RESUMEN']
+    while len(literales) > 1 and sum(len(linea) + 1 for linea in literales) > presupuesto:
+        literales.pop(0)
+        corte += 1
+    if literales and len(literales[0]) > presupuesto:
+        literales[0] = _recortar(literales[0], presupuesto)
+
+    bloque = ""
+    if corte:
+        resumen = obtener_resumen(usuario_id, historial[:corte], config)
+        bloque += f"--- RESUMEN DE LA CONVERSACIÓN ANTERIOR ---\n{resumen}\n\n"
+    bloque += "--- HISTORIAL DE CONVERSACIÓN ---\n" + "\n".join(literales) + "\n"
+    return bloque
@@ -0,0 +1,145 @@
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from nutrisur.lru import LRUConTTL
+from .models import ConversacionChatbot
+
+CONFIG_POR_DEFECTO = {
+    'BACKEND': 'cache',
+    'MAX_MENSAJES': 20,     # Mensajes que se guardan por usuario (los más antiguos se descartan)
+    'MAX_USUARIOS': 1000,   # Conversaciones vivas como máximo (solo memoria y BD)
+    'TTL': 60 * 60 * 2,     # Segundos sin actividad antes de olvidar la conversación
+}
+
+
+def obtener_config():
+    config = dict(CONFIG_POR_DEFECTO)
+    config.update(getattr(settings, 'CHATBOT_CONVERSACIONES', {}))
+    return config
+
+
+class AlmacenConversaciones:
+    """
+    Interfaz común de los almacenes de historial del chatbot.
+    Cada mensaje es un diccionario {'remitente': 'usuario'|'bot', 'contenido': str}.
+    """
+
+    def __init__(self, max_mensajes, max_usuarios, ttl):
+        self.max_mensajes = max_mensajes
+        self.max_usuarios = max_usuarios
+        self.ttl = ttl
+
+    def obtener(self, usuario_id):
+        raise NotImplementedError
+
+    def guardar(self, usuario_id, mensajes):
+        raise NotImplementedError
+
+    def borrar(self, usuario_id):
+        raise NotImplementedError
+
+    def agregar(self, usuario_id, *mensajes):
+        """
+        Añade mensajes al final del historial respetando el tope por usuario.
+        Cada mensaje se numera ('n') para que el resumen sepa cuáles ya ha incorporado.
+        """
+        historial = self.obtener(usuario_id)
+        siguiente = historial[-1].get('n', len(historial)) + 1 if historial else 1
+        for i, mensaje in enumerate(mensajes):
+            historial.append({**mensaje, 'n': siguiente + i})
+        historial = historial[-self.max_mensajes:]
+        self.guardar(usuario_id, historial)
+        return historial
+
+
+class AlmacenMemoria(AlmacenConversaciones):
+    """Memoria del proceso. Rápido, pero no se comparte entre workers."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._datos = LRUConTTL(self.max_usuarios, self.ttl)
+
+    def obtener(self, usuario_id):
+        return list(self._datos.get(usuario_id, []))
+
+    def guardar(self, usuario_id, mensajes):
+        self._datos.set(usuario_id, list(mensajes))
+
+    def borrar(self, usuario_id):
+        self._datos.delete(usuario_id)
+
+
+class AlmacenCache(AlmacenConversaciones):
+    """
+    Caché de Django. Compartido entre workers si la caché lo es (ver CACHES);
+    la expulsión por tamaño la hace el propio backend de caché.
+    """
+    PREFIJO = 'chatbot:conversacion:'
+
+    def obtener(self, usuario_id):
+        return list(cache.get(f"{self.PREFIJO}{usuario_id}", []))
+
+    def guardar(self, usuario_id, mensajes):
+        cache.set(f"{self.PREFIJO}{usuario_id}", list(mensajes), self.ttl)
+
+    def borrar(self, usuario_id):
+        cache.delete(f"{self.PREFIJO}{usuario_id}")
+
+
+class AlmacenBD(AlmacenConversaciones):
+    """Tabla ConversacionChatbot. Sobrevive a reinicios y es común a todos los workers."""
+    PURGAR_CADA = 100
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._escrituras = 0
+
+    def _limite(self):
+        return timezone.now() - timedelta(seconds=self.ttl)
+
+    def obtener(self, usuario_id):
+        conversacion = ConversacionChatbot.objects.filter(
+            usuario_id=usuario_id, actualizada__gte=self._limite()
+        ).values_list('mensajes', flat=True).first()
+        return list(conversacion or [])
+
+    def guardar(self, usuario_id, mensajes):
+        ConversacionChatbot.objects.update_or_create(usuario_id=usuario_id, defaults={'mensajes': list(mensajes)})
+
+        self._escrituras += 1
+        if self._escrituras % self.PURGAR_CADA == 0:
+            self.purgar()
+
+    def borrar(self, usuario_id):
+        ConversacionChatbot.objects.filter(usuario_id=usuario_id).delete()
+
+    def purgar(self):
+        """Elimina las conversaciones caducadas y las que sobran por antigüedad."""
+        ConversacionChatbot.objects.filter(actualizada__lt=self._limite()).delete()
+        sobrantes = ConversacionChatbot.objects.order_by('-actualizada').values_list('id', flat=True)[self.max_usuarios:]
+        ConversacionChatbot.objects.filter(id__in=list(sobrantes)).delete()
+
+
+BACKENDS = {
+    'memoria': AlmacenMemoria,
+    'cache': AlmacenCache,
+    'bd': AlmacenBD,
+}
+
+_almacen = None
+
+
+def crear_almacen(config):
+    backend = config['BACKEND']
+    clase = BACKENDS[backend] if backend in BACKENDS else import_string(backend)
+    return clase(config['MAX_MENSAJES'], config['MAX_USUARIOS'], config['TTL'])
+
+
+def obtener_almacen():
+    """Devuelve el almacén configurado en settings.CHATBOT_CONVERSACIONES (uno por proceso)."""
+    global _almacen
+    if _almacen is None:
+        _almacen = crear_almacen(obtener_config())
+    return _almacen
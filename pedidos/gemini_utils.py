@@ -1,122 +1,163 @@
-import google.generativeai as genai
-from django.conf import settings
 from pedidos.models import Pedido, ConfiguracionChatbot
-from productos.models import Producto
+from productos.catalogo import obtener_catalogo
+from .conversaciones import obtener_almacen
+from .contexto import ensamblar_contexto
+from .cache_respuestas import obtener_cache_respuestas, clave_respuesta
+from .intenciones import interpretar_mensaje
+from nutrisur.llm import obtener_cliente
 import json
 
-conversaciones = {}
+# Respuesta de emergencia si falla la IA
+RESPUESTA_ERROR = {
+    "texto_respuesta": "Lo siento, tuve un problema procesando tu solicitud. ¿Podrías repetirlo?",
+    "acciones": [],
+    "finalizar_pedido": False
+}
+
+# Estructura que debe tener la respuesta del modelo (se le pide así y se valida al recibirla)
+ESQUEMA_RESPUESTA = {
+    'type': 'object',
+    'properties': {
+        'texto_respuesta': {'type': 'string'},
+        'acciones': {
+            'type': 'array',
+            'default': [],
+            'items': {
+                'type': 'object',
+                'properties': {
+                    'tipo': {'type': 'string', 'enum': ['agregar', 'eliminar']},
+                    'producto_nombre': {'type': 'string'},
+                    'cantidad': {'type': 'integer', 'default': 1},
+                },
+                'required': ['tipo', 'producto_nombre'],
+            },
+        },
+        'finalizar_pedido': {'type': 'boolean', 'default': False},
+    },
+    'required': ['texto_respuesta'],
+}
+
+
+def preparar_turno(mensaje_usuario, usuario):
+    """
+    Todo lo que va antes de llamar al modelo. Devuelve un diccionario con la respuesta
+    si el turno se resuelve sin él (atajo local o caché) o con el prompt que hay que enviarle.
+    """
+    # 1. Obtener el catálogo (instantánea precalculada en caché, sin consultas)
+    catalogo = obtener_catalogo()
+    catalogo_texto = catalogo['texto']
+
+    config_db = ConfiguracionChatbot.objects.first()
+    instrucciones_extra = ""
+    if config_db and config_db.activado:
+        instrucciones_extra = f"""
+        NOTAS DEL ADMINISTRADOR (Prioridad Alta):
+        {config_db.instrucciones_sistema}
+        """
+
+    # 2. Obtener el historial del usuario (almacén acotado y común a todos los workers)
+    historial = obtener_almacen().obtener(usuario.id)
+    turno = {'mensaje': mensaje_usuario, 'usuario_id': usuario.id, 'historial': historial, 'prompt': None, 'clave': None}
+
+    # 3. Estado actual del pedido
+    pedido = Pedido.objects.get(usuario=usuario, estado='B')
+    estado_pedido = get_data_pedido(pedido)
+
+    # 4. Órdenes sin ambigüedad ("añade 2 de ...", "confirmar pedido") se resuelven en local
+    turno['respuesta'] = interpretar_mensaje(mensaje_usuario, estado_pedido)
+    if turno['respuesta'] is not None:
+        return turno
+
+    # 5. Historial para el contexto (últimos turnos literales + resumen). Turnos repetidos con
+    # el mismo catálogo, carrito y este mismo bloque reutilizan la respuesta sin llamar al modelo
+    contexto = ensamblar_contexto(usuario.id, historial)
+    cache_respuestas = obtener_cache_respuestas()
+    if cache_respuestas:
+        turno['clave'] = clave_respuesta(mensaje_usuario, catalogo['version'], estado_pedido, contexto, instrucciones_extra)
+        turno['respuesta'] = cache_respuestas.obtener(turno['clave'])
+        if turno['respuesta'] is not None:
+            return turno
+
+    # 6. Prompt del sistema (el modelo lo reutiliza el cliente compartido)
+    prompt_sistema = f"""
+    Eres 'NutriBot', el asistente virtual de ventas de NutriSur.
+
+    CATÁLOGO DISPONIBLE:
+    {catalogo_texto}
+
+    TU OBJETIVO:
+    Ayudar al usuario a elegir productos y añadirlos a su pedido.
+
+    INSTRUCCIONES DE RESPUESTA (IMPORTANTE):
+    Debes responder SIEMPRE en formato JSON estricto. No añadas texto fuera del JSON.
+
+    El JSON debe tener esta estructura:
+    {{
+        "texto_respuesta": "Tu respuesta amable al cliente aquí...",
+        "acciones": [
+            {{ "tipo": "agregar", "producto_nombre": "Nombre Exacto del Producto", "cantidad": 1 }},
+            {{ "tipo": "eliminar", "producto_nombre": "Nombre exacto del producto", "cantidad": 1 }}
+        ],
+        "finalizar_pedido": false
+    }}
+
+    {instrucciones_extra}
+
+    REGLAS:
+    1. Si el usuario quiere comprar algo, busca el nombre más parecido en el catálogo.
+    2. Si encuentras el producto, añade la acción "agregar" al JSON.
+    3. Si el usuario quiere eliminar un producto, añade la acción "eliminar" al JSON.
+    4. Si el usuario quiere cancelar su pedido, elimina todos los productos del pedido.
+    5. Si el usuario no desea añadir mas productos al pedido, pon "finalizar_pedido": true.
+    6. Si el usuario quiere añadir o eliminar un producto pero no lo nombra, se refiere al último producto mencionado.
+    7. Si el usuario quiere añadir o eliminar un prodcuto pero el nombre no coincide con ningún producto del catálogo, se refiere al último producto mencionado en el historial con el nombre parecido.
+    8. Sé amable y breve.
+    9. Pide confirmación antes de finalizar el pedido.
+    10. Al finalizar el pedido, resume los productos añadidos y el total a pagar.
+    """
+
+    chat_completo = prompt_sistema + "\n\n" + contexto
+
+    chat_completo += f"\nEstado actual del pedido: {json.dumps(estado_pedido, ensure_ascii=False)}\n"
+    chat_completo += f"Cliente: {mensaje_usuario}\nNutriBot (JSON):"
+    turno['prompt'] = chat_completo
+    return turno
+
+
+def cerrar_turno(turno, respuesta_json):
+    """Guarda la respuesta del modelo en la caché y el turno en el historial del usuario."""
+    cache_respuestas = obtener_cache_respuestas()
+    if turno['prompt'] and turno['clave'] and cache_respuestas:
+        cache_respuestas.guardar(turno['clave'], respuesta_json)
+
+    historial = obtener_almacen().agregar(
+        turno['usuario_id'],
+        {'remitente': 'usuario', 'contenido': turno['mensaje']},
+        {'remitente': 'bot', 'contenido': respuesta_json.get('texto_respuesta', '')},
+    )
+    respuesta_json['historial'] = historial
+    return respuesta_json
+
 
 def obtener_respuesta_gemini(mensaje_usuario, request):
     """
     Procesa el mensaje del usuario usando Gemini y devuelve una respuesta estructurada.
     """
     try:
-        genai.configure(api_key=settings.GEMINI_API_KEY)
-        
-        # 1. Obtener el catálogo actual de la base de datos
-        productos = Producto.objects.all()
-        catalogo_texto = "\n".join([f"- ID: {p.id}, Nombre: {p.nombre}, Precio: {p.precio}€" for p in productos])
-
-        config_db = ConfiguracionChatbot.objects.first()
-        instrucciones_extra = ""
-        if config_db and config_db.activado:
-            instrucciones_extra = f"""
-            NOTAS DEL ADMINISTRADOR (Prioridad Alta):
-            {config_db.instrucciones_sistema}
-            """
-
-        # 2. Obtener o crear el historial del usuario
-        usuario_id = request.user.id
-        if usuario_id not in conversaciones:
-            conversaciones[usuario_id] = []
-        
-        historial = conversaciones[usuario_id]
-
-        # 3. Configurar el modelo y el prompt del sistema
-        model = genai.GenerativeModel('gemini-2.5-flash')
-        
-        prompt_sistema = f"""
-        Eres 'NutriBot', el asistente virtual de ventas de NutriSur.
-        
-        CATÁLOGO DISPONIBLE:
-        {catalogo_texto}
-        
-        TU OBJETIVO:
-        Ayudar al usuario a elegir productos y añadirlos a su pedido.
-        
-        INSTRUCCIONES DE RESPUESTA (IMPORTANTE):
-        Debes responder SIEMPRE en formato JSON estricto. No añadas texto fuera del JSON.
-        
-        El JSON debe tener esta estructura:
-        {{
-            "texto_respuesta": "Tu respuesta amable al cliente aquí...",
-            "acciones": [
-                {{ "tipo": "agregar", "producto_nombre": "Nombre Exacto del Producto", "cantidad": 1 }},
-                {{ "tipo": "eliminar", "producto_nombre": "Nombre exacto del producto", "cantidad": 1 }}
-            ],
-            "finalizar_pedido": false
-        }}
-        
-        {instrucciones_extra}
-        
-        REGLAS:
-        1. Si el usuario quiere comprar algo, busca el nombre más parecido en el catálogo.
-        2. Si encuentras el producto, añade la acción "agregar" al JSON.
-        3. Si el usuario quiere eliminar un producto, añade la acción "eliminar" al JSON.
-        4. Si el usuario quiere cancelar su pedido, elimina todos los productos del pedido.
-        5. Si el usuario no desea añadir mas productos al pedido, pon "finalizar_pedido": true.
-        6. Si el usuario quiere añadir o eliminar un producto pero no lo nombra, se refiere al último producto mencionado.
-        7. Si el usuario quiere añadir o eliminar un prodcuto pero el nombre no coincide con ningún producto del catálogo, se refiere al último producto mencionado en el historial con el nombre parecido.
-        8. Sé amable y breve.
-        9. Pide confirmación antes de finalizar el pedido.
-        10. Al finalizar el pedido, resume los productos añadidos y el total a pagar.
-        """
+        turno = preparar_turno(mensaje_usuario, request.user)
+        respuesta_json = turno['respuesta']
 
-        # 4. Construir el historial para el contexto (simplificado)
-        chat_completo = prompt_sistema + "\n\n--- HISTORIAL DE CONVERSACIÓN ---\n"
-        
-        for msg in historial:
-            if msg['remitente'] == 'usuario':
-                chat_completo += f"Cliente: {msg['contenido']}\n"
-            else:
-                chat_completo += f"NutriBot: {msg['contenido']}\n"
-        
-        # 5. Obtener estado actual del pedido
-        pedido = Pedido.objects.get(usuario=request.user, estado='B')
-        estado_pedido = get_data_pedido(pedido)
-        
-        chat_completo += f"\nEstado actual del pedido: {json.dumps(estado_pedido, ensure_ascii=False)}\n"
-        chat_completo += f"Cliente: {mensaje_usuario}\nNutriBot (JSON):"
-
-        # 6. Generar respuesta
-        response = model.generate_content(chat_completo)
-        texto_limpio = response.text.replace('```json', '').replace('```', '').strip()
-        
-        respuesta_json = json.loads(texto_limpio)
-        
-        # 7. Guardar en la variable historial
-        historial.append({
-            'remitente': 'usuario',
-            'contenido': mensaje_usuario
-        })
-        
-        historial.append({
-            'remitente': 'bot',
-            'contenido': respuesta_json.get('texto_respuesta', '')
-        })
-        
-        respuesta_json['historial'] = historial
+        if respuesta_json is None:
+            # 7. Generar respuesta (con plazo máximo y límite de llamadas simultáneas),
+            # ya validada contra el esquema
+            respuesta_json = obtener_cliente().generar_json(turno['prompt'], ESQUEMA_RESPUESTA)
 
-        return respuesta_json
+        # 8. Guardar el turno en el historial
+        return cerrar_turno(turno, respuesta_json)
 
     except Exception as e:
         print(f"Error Gemini: {e}")
-        # Respuesta de emergencia si falla la IA
-        return {
-            "texto_respuesta": "Lo siento, tuve un problema procesando tu solicitud. ¿Podrías repetirlo?",
-            "acciones": [],
-            "finalizar_pedido": False
-        }
+        return dict(RESPUESTA_ERROR)
     
 def get_data_pedido(pedido):
     """Devuelve el estado actual del pedido en formato diccionario para JSON"""
@@ -125,12 +166,13 @@ def get_data_pedido(pedido):
         items.append({
             'id_producto': pp.producto.id,
             'nombre': pp.producto.nombre,
-            'precio_unitario': float(pp.producto.precio),
+            'precio_unitario': float(pp.precio_unitario),
             'cantidad': pp.cantidad,
-            'subtotal': float(pp.producto.precio * pp.cantidad)
+            'subtotal': float(pp.subtotal)
         })
     
+    # El total se mantiene en el propio pedido al modificar el carrito
     return {
-        'total_pedido': float(pedido.calcular_total()),
+        'total_pedido': float(pedido.total),
         'items': items
     }
\ No newline at end of file
@@ -0,0 +1,87 @@
+import re
+from productos.buscador import normalizar, obtener_indice
+
+# Con esta puntuación y esta ventaja sobre el segundo candidato el nombre no es ambiguo
+PUNTUACION_SEGURA = 0.85
+VENTAJA_MINIMA = 0.15
+
+NUMEROS = {
+    'un': 1, 'uno': 1, 'una': 1, 'otro': 1, 'otra': 1, 'dos': 2, 'tres': 3, 'cuatro': 4,
+    'cinco': 5, 'seis': 6, 'siete': 7, 'ocho': 8, 'nueve': 9, 'diez': 10,
+}
+CANTIDAD = r'(?: (?P<cantidad>\d+|' + '|'.join(NUMEROS) + r'))?(?: unidades?)?(?: de)?'
+
+# Se aplican sobre el texto normalizado (sin tildes ni signos): "Añade 2 de Té verde!" -> "anade 2 de te verde"
+PATRON_AGREGAR = re.compile(r'^(?:anade|anademe|agrega|agregame|pon|ponme|mete|meteme|quiero)' + CANTIDAD + r' (?P<producto>.+)$')
+PATRON_ELIMINAR = re.compile(r'^(?:quita|quitame|elimina|borra|saca)' + CANTIDAD + r' (?P<producto>.+)$')
+PATRON_CONFIRMAR = re.compile(r'^(?:confirmar|confirmo|confirma|finalizar|finaliza|tramitar|tramita)(?: el)?(?: pedido)?$')
+SUFIJO_CORTESIA = re.compile(r'(?: por favor| gracias)+$')
+
+
+def _cantidad(texto):
+    if texto is None:
+        return None
+    return int(texto) if texto.isdigit() else NUMEROS[texto]
+
+
+def resolver_producto(texto):
+    """El producto del catálogo al que se refiere el texto, o None si hay duda."""
+    resultados = obtener_indice().buscar(texto, limite=2)
+    if not resultados or resultados[0][0] < PUNTUACION_SEGURA:
+        return None
+    if len(resultados) > 1 and resultados[0][0] - resultados[1][0] < VENTAJA_MINIMA:
+        return None
+    return resultados[0][1]
+
+
+def _respuesta(texto, acciones=None, finalizar=False):
+    # Mismo esquema que devuelve Gemini, para que procesar_mensaje_view no distinga el origen
+    return {
+        "texto_respuesta": texto,
+        "acciones": acciones or [],
+        "finalizar_pedido": finalizar,
+    }
+
+
+def interpretar_mensaje(mensaje, estado_pedido):
+    """
+    Atajo local para órdenes sin ambigüedad ("añade 2 de Batido Fresa", "quita el té verde",
+    "confirmar pedido"). Devuelve la respuesta con el esquema de Gemini o None si el mensaje
+    necesita al modelo.
+    """
+    texto = SUFIJO_CORTESIA.sub('', normalizar(mensaje))
+    if not texto:
+        return None
+
+    if PATRON_CONFIRMAR.match(texto):
+        return _respuesta("Perfecto, confirmo tu pedido.", finalizar=True)
+
+    encontrado = PATRON_AGREGAR.match(texto)
+    if encontrado:
+        cantidad = _cantidad(encontrado.group('cantidad')) or 1
+        producto = resolver_producto(encontrado.group('producto'))
+        if producto is None or cantidad <= 0:
+            return None
+        return _respuesta(
+            f"Hecho, he añadido {cantidad} x {producto['nombre']} a tu pedido. ¿Quieres algo más?",
+            [{"tipo": "agregar", "producto_nombre": producto['nombre'], "cantidad": cantidad}],
+        )
+
+    encontrado = PATRON_ELIMINAR.match(texto)
+    if encontrado:
+        producto = resolver_producto(encontrado.group('producto'))
+        en_carrito = {item['id_producto'] for item in estado_pedido['items']}
+        if producto is None or producto['id'] not in en_carrito:
+            return None
+        # Sin cantidad se quita el producto entero (cantidad 0, como en las reglas del chatbot)
+        cantidad = _cantidad(encontrado.group('cantidad')) or 0
+        texto_respuesta = (
+            f"He quitado {cantidad} x {producto['nombre']} de tu pedido." if cantidad
+            else f"He quitado {producto['nombre']} de tu pedido."
+        )
+        return _respuesta(
+            texto_respuesta + " ¿Necesitas algo más?",
+            [{"tipo": "eliminar", "producto_nombre": producto['nombre'], "cantidad": cantidad}],
+        )
+
+    return None
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.7 on 2026-10-18 10:16
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pedidos', '0006_remove_pedido_productos_chat'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConversacionChatbot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mensajes', models.JSONField(blank=True, default=list)),
+                ('actualizada', models.DateTimeField(auto_now=True, db_index=True)),
+                ('usuario', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='conversacion_chatbot', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Conversación del Chatbot',
+                'verbose_name_plural': 'Conversaciones del Chatbot',
+            },
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.7 on 2026-10-18 10:23
+
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def rellenar_precios_y_totales(apps, schema_editor):
+    """Copia el precio actual a las líneas existentes y calcula el total de cada pedido."""
+    Pedido = apps.get_model('pedidos', 'Pedido')
+    PedidoProducto = apps.get_model('pedidos', 'PedidoProducto')
+    Producto = apps.get_model('productos', 'Producto')
+    db_alias = schema_editor.connection.alias
+
+    PedidoProducto.objects.using(db_alias).update(
+        precio_unitario=Subquery(Producto.objects.filter(pk=OuterRef('producto_id')).values('precio')[:1])
+    )
+
+    totales = (
+        PedidoProducto.objects.filter(pedido_id=OuterRef('pk'))
+        .values('pedido_id')
+        .annotate(suma=Sum(F('cantidad') * F('precio_unitario'), output_field=DecimalField(max_digits=12, decimal_places=2)))
+        .values('suma')
+    )
+    Pedido.objects.using(db_alias).update(
+        total=Coalesce(Subquery(totales), Value(Decimal('0.00')), output_field=DecimalField(max_digits=12, decimal_places=2))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pedidos', '0007_conversacionchatbot'),
+        ('productos', '0003_añadir_enlace'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pedido',
+            name='total',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), editable=False, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='pedidoproducto',
+            name='precio_unitario',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.RunPython(rellenar_precios_y_totales, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.7 on 2026-10-18 10:27
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pedidos', '0008_pedido_total_precio_unitario'),
+        ('productos', '0003_añadir_enlace'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['usuario', '-fecha_pedido', '-id'], name='pedido_usuario_fecha_idx'),
+        ),
+    ]
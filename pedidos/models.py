@@ -1,11 +1,54 @@
+import threading
+from contextlib import contextmanager
+from decimal import Decimal
 from django.db import models
+from django.db.models import DecimalField, F, Sum, Value
+from django.db.models.functions import Coalesce
 from django.conf import settings
+from django.dispatch import Signal
 from django.utils import timezone
+from nutrisur.seguimiento import CamposSeguidosMixin
 from productos.models import Producto
 
+# Se envía al guardar un pedido existente cuyo estado ha cambiado: (sender, instance, anterior, nuevo)
+pedido_estado_cambiado = Signal()
+
+_recalculo = threading.local()
+
+
+@contextmanager
+def recalculo_agrupado():
+    """
+    Dentro de este bloque las líneas que se guardan o borran no recalculan el total
+    una a una (ver actualizar_total_pedido en signals.py): quien lo usa llama a
+    recalcular_total() una vez al final.
+    """
+    anterior = getattr(_recalculo, 'agrupado', False)
+    _recalculo.agrupado = True
+    try:
+        yield
+    finally:
+        _recalculo.agrupado = anterior
+
+
+def recalculo_agrupado_activo():
+    return getattr(_recalculo, 'agrupado', False)
+
+
+def expresion_total():
+    """Suma de cantidad * precio guardado de las líneas, calculada por la base de datos."""
+    return Coalesce(
+        Sum(
+            F('cantidad') * F('precio_unitario'),
+            output_field=DecimalField(max_digits=12, decimal_places=2)
+        ),
+        Value(Decimal('0.00')),
+        output_field=DecimalField(max_digits=12, decimal_places=2)
+    )
+
 
 # Create your models here.
-class Pedido(models.Model):
+class Pedido(CamposSeguidosMixin, models.Model):
     ESTADOS =[
         ('B', 'Borrador'),
         ('P', 'Pendiente'),
@@ -17,28 +60,50 @@ class Pedido(models.Model):
     
     fecha_pedido = models.DateTimeField(default=timezone.now)
     estado = models.CharField(max_length=20, choices=ESTADOS, default='P')
+    # Se mantiene con cada cambio de las líneas (ver recalcular_total y
+    # actualizar_total_pedido en signals.py), así los listados
+    # y los correos leen una sola columna
+    total = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'), editable=False)
     productos = models.ManyToManyField(
             Producto,
             through='PedidoProducto',  # referencia al modelo intermedio
             related_name='pedidos'
         )    
+
+    # El estado con el que se cargó se recuerda para detectar transiciones sin otra consulta
+    CAMPOS_SEGUIDOS = ('estado',)
+    SENALES_CAMBIO = {'estado': pedido_estado_cambiado}
+
+    class Meta:
+        # "Mis pedidos" pagina por (fecha_pedido, id) dentro de cada usuario
+        indexes = [
+            models.Index(fields=['usuario', '-fecha_pedido', '-id'], name='pedido_usuario_fecha_idx'),
+        ]
     
     def agregar_producto(self, producto, cantidad=1):
-        pedido_producto, creado = PedidoProducto.objects.get_or_create(
-            pedido = self, 
-            producto = producto,
-            defaults={'cantidad': cantidad}
-        )
-        if not creado:
-            pedido_producto.cantidad += cantidad
-            pedido_producto.save()
+        with recalculo_agrupado():
+            pedido_producto, creado = PedidoProducto.objects.get_or_create(
+                pedido = self, 
+                producto = producto,
+                defaults={'cantidad': cantidad}
+            )
+            if not creado:
+                pedido_producto.cantidad += cantidad
+                pedido_producto.save()
+        self.recalcular_total()
         return pedido_producto
+
+    def recalcular_total(self):
+        """
+        Vuelve a sumar las líneas y guarda el total con un UPDATE directo
+        (sin save(), para no disparar las señales de correo).
+        """
+        self.total = self.pedidoproducto_set.aggregate(total=expresion_total())['total']
+        Pedido.objects.filter(pk=self.pk).update(total=self.total)
+        return self.total
     
     def calcular_total(self):
-        total = sum([
-            pp.producto.precio * pp.cantidad for pp in self.pedidoproducto_set.all()
-        ])
-        return total
+        return self.total
     
     @property
     def cliente_nombre(self):
@@ -63,10 +128,18 @@ class PedidoProducto(models.Model):
     pedido = models.ForeignKey(Pedido, on_delete=models.CASCADE)
     producto = models.ForeignKey(Producto, on_delete=models.CASCADE)
     cantidad = models.PositiveIntegerField(default=1)
+    # Precio en el momento de añadirlo: si el producto cambia de precio, el pedido no
+    precio_unitario = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
     
     @property
     def subtotal(self):
-        return self.producto.precio * self.cantidad
+        precio = self.precio_unitario if self.precio_unitario is not None else self.producto.precio
+        return precio * self.cantidad
+
+    def save(self, *args, **kwargs):
+        if self.precio_unitario is None:
+            self.precio_unitario = self.producto.precio
+        return super().save(*args, **kwargs)
     
     class Meta:
         unique_together = ('pedido', 'producto')
@@ -97,3 +170,16 @@ class ConfiguracionChatbot(models.Model):
             pass 
         return super(ConfiguracionChatbot, self).save(*args, **kwargs)
     
+
+class ConversacionChatbot(models.Model):
+    """Historial del chatbot de pedidos cuando se usa el almacén en base de datos."""
+    usuario = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='conversacion_chatbot')
+    mensajes = models.JSONField(default=list, blank=True)
+    actualizada = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        verbose_name = "Conversación del Chatbot"
+        verbose_name_plural = "Conversaciones del Chatbot"
+
+    def __str__(self):
+        return f"Conversación de {self.usuario_id}"
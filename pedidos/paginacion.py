@@ -0,0 +1,40 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.db.models import Q
+
+EPOCA = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def codificar_cursor(pedido):
+    """'<microsegundos desde 1970>-<id>' del último pedido de la página."""
+    microsegundos = (pedido.fecha_pedido - EPOCA) // timedelta(microseconds=1)
+    return f"{microsegundos}-{pedido.id}"
+
+
+def decodificar_cursor(cursor):
+    """Devuelve (fecha, id) o None si el cursor no es válido."""
+    try:
+        microsegundos, pedido_id = cursor.rsplit('-', 1)
+        return EPOCA + timedelta(microseconds=int(microsegundos)), int(pedido_id)
+    except (AttributeError, ValueError, OverflowError):
+        return None
+
+
+def pagina_por_cursor(queryset, cursor=None, tamano=10):
+    """
+    Paginación por cursor sobre (fecha_pedido, id), de más reciente a más antiguo.
+    A diferencia de OFFSET, cada página cuesta lo mismo aunque el cliente tenga
+    cientos de pedidos. Devuelve (pedidos, cursor_siguiente o None).
+    """
+    queryset = queryset.order_by('-fecha_pedido', '-id')
+    posicion = decodificar_cursor(cursor) if cursor else None
+    if posicion:
+        fecha, pedido_id = posicion
+        queryset = queryset.filter(Q(fecha_pedido__lt=fecha) | Q(fecha_pedido=fecha, id__lt=pedido_id))
+
+    # Uno de más para saber si hay página siguiente sin hacer un COUNT
+    pedidos = list(queryset[:tamano + 1])
+    siguiente = None
+    if len(pedidos) > tamano:
+        pedidos = pedidos[:tamano]
+        siguiente = codificar_cursor(pedidos[-1])
+    return pedidos, siguiente
@@ -1,146 +1,69 @@
-import threading
-import time
-from django.db.models.signals import post_save, pre_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
-from django.core.mail import send_mail
-from django.conf import settings
+from notificaciones.cola import encolar_correos
+from notificaciones.eventos import al_confirmar, al_confirmar_en_lote
 from usuarios.models import CustomUser
-from pedidos.models import Pedido
+from pedidos.models import Pedido, PedidoProducto, pedido_estado_cambiado, recalculo_agrupado_activo
+from pedidos.avisos import (
+    correo_nuevo_usuario, correo_pedido_realizado, correos_nuevo_pedido, pedidos_para_aviso, resumen_pedido,
+)
+
 
 @receiver(post_save, sender=CustomUser)
 def avisar_nuevo_usuario(sender, instance, created, **kwargs):
     if created: # Solo si es un usuario NUEVO (no si edita su perfil)
-        asunto = f"👤 Nuevo Usuario Registrado: {instance.nombre}"
-        mensaje = f"""
-        Se ha registrado un nuevo cliente en NutriSur.
-        
-        Nombre: {instance.nombre}
-        Email: {instance.email}
-        Teléfono: {instance.telefono}
-        
-        Entra para revisar si es un cliente habitual:
-        https://nutrisur.onrender.com/admin/usuarios/
-        """
-        threading.Thread(target=lambda: send_mail(
-            asunto, mensaje, settings.EMAIL_HOST_USER, [settings.EMAIL_HOST_USER]
-        )).start()
-    
+        al_confirmar(notificar_nuevo_usuario, instance.id)
+
+
+def notificar_nuevo_usuario(usuario_id):
+    instance = CustomUser.objects.filter(pk=usuario_id).first()
+    if instance:
+        encolar_correos([correo_nuevo_usuario(instance)])
 
 
 @receiver(post_save, sender=Pedido)
 def avisar_nuevo_pedido(sender, instance, created, **kwargs):
-    # Solo enviamos el correo cuando el estado pasa a 'P' (Pendiente/Confirmado)
-    if instance.estado == 'P': 
-        
-        # 1. GENERAMOS LA LISTA DE PRODUCTOS
-        # Recorremos los productos asociados a este pedido
-        items_texto = ""
-        for item in instance.pedidoproducto_set.all():
-            # Formato: "- 2 x Batido Fresa (35.50 €)"
-            # Usamos item.subtotal que ya definiste en models.py
-            items_texto += f"- {item.cantidad} x {item.producto.nombre} ({item.subtotal} €)\n"
+    # Solo enviamos el correo cuando el estado pasa a 'P' (Pendiente/Confirmado).
+    # Se prepara al confirmar la transacción, con el carrito ya completo, y una sola
+    # vez aunque el pedido se guarde varias veces en la misma petición
+    if instance.estado == 'P':
+        al_confirmar_en_lote(notificar_nuevos_pedidos, [instance.id])
 
-        # 2. CONSTRUIMOS EL MENSAJE
-        
-        def email_admin():
-            try:        
-                asunto = f"💰 Nuevo Pedido Recibido #{instance.id}"
-                mensaje = f"""
-                ¡Enhorabuena! Tienes una nueva venta confirmada.
-                
-                ------------------------------------------
-                DETALLES DEL CLIENTE:
-                Cliente: {instance.usuario.nombre}
-                Email: {instance.usuario.email}
-                ------------------------------------------
-                
-                CARRITO DE COMPRA:
-                {items_texto}
-                
-                ------------------------------------------
-                TOTAL DEL PEDIDO: {instance.calcular_total()} €
-                ------------------------------------------
-                
-                Gestionar pedido aquí:
-                https://nutrisur.onrender.com/admin/pedidos/pedido/{instance.id}/change/
-                """
-                send_mail(asunto, mensaje, settings.DEFAULT_FROM_EMAIL, [settings.EMAIL_HOST_USER])
-                print(f"Correo de nuevo pedido enviado al admin para el pedido #{instance.id}")
-            except Exception as e:
-                print(f"Error construyendo email para admin: {e}")
-                
-            
-        def email_cliente():
-            try:
-                asunto = f"✅ Pedido Confirmado #{instance.id} - NutriSur"
-                msj = f"""
-                Hola {instance.usuario.nombre},
-                
-                Hemos recibido tu pedido correctamente.
-                
-                RESUMEN DE COMPRA:
-                {items_texto}
-                --------------------
-                TOTAL: {instance.calcular_total()} €
-                --------------------
-                
-                Te avisaremos cuando lo enviemos.
-                """
-                # Enviamos al correo del usuario
-                send_mail(asunto, msj, settings.DEFAULT_FROM_EMAIL, [instance.usuario.email])
-            except: pass
-        
-        threading.Thread(target=email_admin).start()
-        threading.Thread(target=email_cliente).start()
 
-            
-@receiver(pre_save, sender=Pedido)
-def detectar_cambio_a_realizado(sender, instance, **kwargs):
-    if instance.pk: # Solo si el pedido ya existía (es una edición)
-        try:
-            pedido_antiguo = Pedido.objects.get(pk=instance.pk)
-            # Verificamos: Antes NO era 'R' y Ahora SÍ es 'R'
-            if pedido_antiguo.estado != 'R' and instance.estado == 'R':
-                instance._enviar_correo_cliente = True # Ponemos una marca temporal
-        except Pedido.DoesNotExist:
-            pass
-        
-@receiver(post_save, sender=Pedido)
-def enviar_aviso_cliente(sender, instance, **kwargs):
-    # Buscamos si existe la marca que pusimos antes
-    if getattr(instance, '_enviar_correo_cliente', False):
-        items_texto = ""
-        for item in instance.pedidoproducto_set.all():
-            # Formato: "- 2 x Batido Fresa (35.50 €)"
-            # Usamos item.subtotal que ya definiste en models.py
-            items_texto += f"- {item.cantidad} x {item.producto.nombre} ({item.subtotal} €)\n"
-        
-        asunto = f"🚚 ¡Tu pedido ha sido enviado!"
-        mensaje = f"""
-        Hola {instance.usuario.nombre},
-        
-        ¡Buenas noticias! Tu pedido ha sido procesado y marcado como REALIZADO.
-        Pronto lo recibirás en la dirección habitual.
-        
-        Resumen del pedido #{instance.id}:
-        
-        CARRITO DE COMPRA:
-        {items_texto}
-        
-        ------------------------------------------
-        TOTAL DEL PEDIDO: {instance.calcular_total()} €
-        ------------------------------------------
-        
-        Gracias por confiar en NutriSur.
-        """
-        def tarea_enviar_email():
-            try:              
-                print(f"Hilo: Intentando enviar correo a {instance.usuario.email}...")
-                send_mail(asunto, mensaje, settings.DEFAULT_FROM_EMAIL, [instance.usuario.email])
-                print(f"Correo de confirmación enviado a {instance.usuario.email}")
-            except Exception as e:
-                print(f"Error enviando correo al cliente: {e}")        
-        email_thread = threading.Thread(target=tarea_enviar_email)
-        email_thread.start()
+def notificar_nuevos_pedidos(pedido_ids):
+    """Avisos de pedido nuevo (al administrador y al cliente) de varios pedidos a la vez."""
+    correos = []
+    # Si al final no quedó pendiente (se deshizo o cambió después), no hay aviso.
+    # Un resumen por pedido sirve para sus dos correos
+    for instance in pedidos_para_aviso(pedido_ids).filter(estado='P'):
+        correos += correos_nuevo_pedido(resumen_pedido(instance))
+    encolar_correos(correos)
+
+
+@receiver(pedido_estado_cambiado, sender=Pedido)
+def avisar_pedido_realizado(sender, instance, anterior, nuevo, **kwargs):
+    # Antes NO era 'R' y ahora SÍ (el estado anterior lo recuerda el modelo, sin consultas)
+    if nuevo == 'R':
+        al_confirmar_en_lote(notificar_pedidos_realizados, [instance.id])
+
+
+def notificar_pedidos_realizados(pedido_ids):
+    """Avisos al cliente de pedido enviado de varios pedidos a la vez."""
+    encolar_correos([
+        correo_pedido_realizado(resumen_pedido(instance))
+        for instance in pedidos_para_aviso(pedido_ids).filter(estado='R')
+    ])
+
 
-            
\ No newline at end of file
+@receiver(post_save, sender=PedidoProducto)
+@receiver(post_delete, sender=PedidoProducto)
+def actualizar_total_pedido(sender, instance, **kwargs):
+    # Cualquier alta, cambio o baja de una línea (también las que se borran en cascada
+    # al borrar un producto) deja al día el total guardado del pedido
+    if recalculo_agrupado_activo():
+        return
+    if PedidoProducto.pedido.is_cached(instance):
+        pedido = instance.pedido
+    else:
+        pedido = Pedido(pk=instance.pedido_id)
+    pedido.recalcular_total()
@@ -1,13 +1,34 @@
-import json
-from django.test import TestCase, Client
+import threading
+import time
+from types import SimpleNamespace
+from django.test import TestCase, Client, override_settings
+from django.core.cache import cache
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 from unittest.mock import patch
-from .models import Pedido, PedidoProducto
+from .models import Pedido, PedidoProducto, ConversacionChatbot, expresion_total, pedido_estado_cambiado
+from .conversaciones import AlmacenMemoria, AlmacenCache, AlmacenBD
+from . import contexto
+from .carrito import aplicar_acciones
+from .transiciones import cambiar_estado_pedidos
+from .avisos import correos_nuevo_pedido, pedidos_para_aviso, resumen_pedido
+from .cache_respuestas import clave_respuesta, obtener_cache_respuestas
+from .gemini_utils import obtener_respuesta_gemini
+from .intenciones import interpretar_mensaje
+from django.core import mail
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
 from productos.models import Producto
+from notificaciones.models import CorreoSaliente
+from productos.catalogo import obtener_catalogo
 
 User = get_user_model()
 
+def suma_lineas(pedido):
+    """Total del pedido recalculado desde sus líneas, para compararlo con el guardado."""
+    return PedidoProducto.objects.filter(pedido=pedido).aggregate(total=expresion_total())['total']
+
+
 class PedidosBaseTest(TestCase):
     def setUp(self):
         self.client = Client()
@@ -173,4 +194,585 @@ class PedidosAPITests(PedidosBaseTest):
         self.client.post(url, {'mensaje': 'dame un batido'}, content_type='application/json')
         
         pedido = Pedido.objects.get(usuario=self.vip_user, estado='B')
-        self.assertTrue(pedido.pedidoproducto_set.filter(producto=self.prod3).exists())
\ No newline at end of file
+        self.assertTrue(pedido.pedidoproducto_set.filter(producto=self.prod3).exists())
+
+
+# --- 4. TESTS DEL ALMACÉN DE CONVERSACIONES ---
+class ConversacionesTests(PedidosBaseTest):
+
+    def mensaje(self, texto):
+        return {'remitente': 'usuario', 'contenido': texto}
+
+    def test_memoria_limita_mensajes_y_usuarios(self):
+        """Caso Lógica: Se guardan como mucho N mensajes por usuario y M usuarios."""
+        almacen = AlmacenMemoria(max_mensajes=3, max_usuarios=2, ttl=60)
+        for i in range(5):
+            almacen.agregar(1, self.mensaje(f"m{i}"))
+
+        self.assertEqual([m['contenido'] for m in almacen.obtener(1)], ['m2', 'm3', 'm4'])
+
+        almacen.agregar(2, self.mensaje("hola"))
+        almacen.agregar(3, self.mensaje("hola"))
+        self.assertEqual(almacen.obtener(1), [])  # El menos usado se expulsa
+        self.assertEqual(len(almacen.obtener(3)), 1)
+
+    def test_memoria_caduca_por_ttl(self):
+        """Caso Lógica: Una conversación sin actividad se olvida pasado el TTL."""
+        almacen = AlmacenMemoria(max_mensajes=10, max_usuarios=10, ttl=60)
+        ahora = [1000.0]
+        almacen._datos._reloj = lambda: ahora[0]
+
+        almacen.agregar(1, self.mensaje("hola"))
+        ahora[0] += 61
+        self.assertEqual(almacen.obtener(1), [])
+
+    def test_cache_comparte_historial(self):
+        """Caso Positivo: Dos instancias (como dos workers) ven el mismo historial."""
+        worker_a = AlmacenCache(max_mensajes=10, max_usuarios=10, ttl=60)
+        worker_b = AlmacenCache(max_mensajes=10, max_usuarios=10, ttl=60)
+        worker_a.borrar(self.vip_user.id)
+
+        worker_a.agregar(self.vip_user.id, self.mensaje("quiero aloe"))
+        self.assertEqual([m['contenido'] for m in worker_b.obtener(self.vip_user.id)], ["quiero aloe"])
+
+    def test_bd_persiste_y_purga(self):
+        """Caso Lógica: El almacén en BD guarda el historial y purga lo que sobra."""
+        almacen = AlmacenBD(max_mensajes=2, max_usuarios=1, ttl=60)
+        almacen.agregar(self.user.id, self.mensaje("a"), self.mensaje("b"), self.mensaje("c"))
+        almacen.agregar(self.vip_user.id, self.mensaje("d"))
+
+        self.assertEqual([m['contenido'] for m in almacen.obtener(self.user.id)], ['b', 'c'])
+
+        almacen.purgar()
+        self.assertEqual(ConversacionChatbot.objects.count(), 1)
+        self.assertEqual([m['contenido'] for m in almacen.obtener(self.vip_user.id)], ["d"])
+
+
+
+# --- 5. TESTS DEL ENSAMBLADO DE CONTEXTO ---
+@override_settings(CHATBOT_CONTEXTO={'MAX_CARACTERES': 600, 'TURNOS_LITERALES': 2, 'MAX_CARACTERES_RESUMEN': 200})
+class ContextoTests(PedidosBaseTest):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.almacen = AlmacenMemoria(max_mensajes=100, max_usuarios=10, ttl=60)
+
+    def conversar(self, turnos):
+        for i in range(turnos):
+            historial = self.almacen.agregar(
+                self.vip_user.id,
+                {'remitente': 'usuario', 'contenido': f"pregunta {len(self.almacen.obtener(self.vip_user.id)) // 2} " + "x" * 50},
+                {'remitente': 'bot', 'contenido': "respuesta"},
+            )
+        return historial
+
+    def test_contexto_acotado_en_conversacion_larga(self):
+        """Caso Lógica: El bloque no crece con la conversación y conserva lo último literal."""
+        bloque = contexto.ensamblar_contexto(self.vip_user.id, self.conversar(40))
+
+        self.assertLessEqual(len(bloque), 700)
+        self.assertIn("Cliente: pregunta 39", bloque)
+        self.assertIn("Cliente: pregunta 38", bloque)
+        self.assertIn("RESUMEN DE LA CONVERSACIÓN ANTERIOR", bloque)
+        self.assertNotIn("pregunta 0 ", bloque)
+
+    def test_resumen_incremental_en_cache(self):
+        """Caso Lógica: Cada turno solo pliega en el resumen los mensajes nuevos."""
+        contexto.ensamblar_contexto(self.vip_user.id, self.conversar(3))
+
+        with patch('pedidos.contexto.plegar_en_resumen', wraps=contexto.plegar_en_resumen) as plegar:
+            historial = self.conversar(1)
+            bloque = contexto.ensamblar_contexto(self.vip_user.id, historial)
+            contexto.ensamblar_contexto(self.vip_user.id, historial)
+
+        self.assertEqual(plegar.call_count, 1)
+        self.assertEqual(len(plegar.call_args.args[1]), 2)
+        self.assertIn("pregunta 0", bloque)
+        self.assertIn("Cliente: pregunta 3", bloque)
+
+
+# --- 6. TESTS DEL MOTOR DE CARRITO ---
+class CarritoTests(PedidosBaseTest):
+
+    def setUp(self):
+        super().setUp()
+        self.pedido = Pedido.objects.create(usuario=self.vip_user, estado='B')
+
+    def cantidades(self):
+        return dict(self.pedido.pedidoproducto_set.values_list('producto_id', 'cantidad'))
+
+    def test_acciones_en_orden_con_delta_neto(self):
+        """Caso Lógica: Se respeta el orden de las acciones y se aplica el resultado neto."""
+        self.pedido.agregar_producto(self.prod1, 3)
+        self.pedido.agregar_producto(self.prod2, 1)
+
+        aplicar_acciones(self.pedido, [
+            ('agregar', self.prod3.id, 2),
+            ('eliminar', self.prod3.id, 1),
+            ('eliminar', self.prod1.id, 0),      # Borrar todo
+            ('agregar', self.prod1.id, 1),
+            ('eliminar', self.prod2.id, 5),      # Resta de más: se quita
+        ])
+
+        self.assertEqual(self.cantidades(), {self.prod1.id: 1, self.prod3.id: 1})
+
+    def test_numero_de_consultas_constante(self):
+        """Caso Rendimiento: Un mensaje con 10 productos cuesta lo mismo que uno con 2."""
+        productos = [Producto.objects.create(nombre=f"Producto {i}", precio=5) for i in range(10)]
+        for producto in productos[:5]:
+            self.pedido.agregar_producto(producto, 2)
+        obtener_catalogo()  # Los precios salen de la instantánea ya cargada
+
+        def contar(acciones):
+            with CaptureQueriesContext(connection) as consultas:
+                aplicar_acciones(self.pedido, acciones)
+            return len(consultas)
+
+        pocas = contar([('agregar', productos[0].id, 1), ('agregar', productos[5].id, 1)])
+        muchas = contar(
+            [('agregar', p.id, 1) for p in productos[1:4]] +
+            [('eliminar', productos[4].id, 0)] +
+            [('agregar', p.id, 1) for p in productos[6:]]
+        )
+        # + el DELETE, que con 2 acciones no hacía falta (y su lectura previa: las líneas tienen señales)
+        self.assertEqual(muchas, pocas + 2)
+
+
+# --- 7. TESTS DE TOTALES CALCULADOS EN BASE DE DATOS ---
+class TotalesPedidoTests(PedidosBaseTest):
+
+    def test_total_guardado_coincide(self):
+        """Caso Positivo: El total guardado es la suma de las líneas."""
+        pedido = Pedido.objects.create(usuario=self.user, estado='P')
+        pedido.agregar_producto(self.prod1, 2)
+        pedido.agregar_producto(self.prod3, 1)
+        vacio = Pedido.objects.create(usuario=self.user, estado='P')
+
+        self.assertEqual(pedido.calcular_total(), 55)
+        self.assertEqual(suma_lineas(pedido), 55)
+        self.assertEqual(Pedido.objects.get(pk=vacio.pk).calcular_total(), 0)
+
+    def test_listado_de_pedidos_en_una_consulta(self):
+        """Caso Rendimiento: Listar 100 pedidos con su total cuesta una sola consulta (el total es una columna)."""
+        for _ in range(100):
+            pedido = Pedido.objects.create(usuario=self.user, estado='P')
+            pedido.agregar_producto(self.prod2, 1)
+
+        with self.assertNumQueries(1):
+            totales = [p.calcular_total() for p in Pedido.objects.all()]
+        self.assertEqual(sum(totales), 2000)
+
+    def test_admin_listado_pedidos(self):
+        """Caso Positivo: El listado del admin muestra el total guardado."""
+        admin = User.objects.create_superuser(email='admin@test.com', nombre='Admin', password='pass')
+        pedido = Pedido.objects.create(usuario=self.user, estado='P')
+        pedido.agregar_producto(self.prod3, 2)
+        self.client.force_login(admin)
+
+        response = self.client.get(reverse('admin:pedidos_pedido_changelist'))
+        self.assertContains(response, "70.00 €")
+
+
+
+# --- 8. TESTS DEL TOTAL GUARDADO Y PRECIO CONGELADO ---
+class TotalGuardadoTests(PedidosBaseTest):
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.vip_user)
+        self.pedido = Pedido.objects.create(usuario=self.vip_user, estado='B')
+
+    def test_total_se_mantiene_en_cada_mutacion(self):
+        """Caso Lógica: agregar_producto, el motor del carrito y la API dejan el total al día."""
+        self.pedido.agregar_producto(self.prod1, 2)
+        aplicar_acciones(self.pedido, [('agregar', self.prod3.id, 1)])
+        self.client.post(reverse('actualizar_cantidad'), {'id_producto': self.prod1.id, 'accion': 'incrementar'},
+                         content_type='application/json')
+
+        self.pedido.refresh_from_db()
+        self.assertEqual(self.pedido.total, 65)
+        self.assertEqual(self.pedido.total, suma_lineas(self.pedido))
+
+    def test_total_al_dia_fuera_del_carrito(self):
+        """Caso Lógica: Guardar o borrar líneas a mano, o borrar un producto, también actualiza el total."""
+        self.pedido.agregar_producto(self.prod1, 2)
+        self.pedido.agregar_producto(self.prod3, 1)
+
+        linea = PedidoProducto.objects.get(pedido=self.pedido, producto=self.prod1)
+        linea.cantidad = 4
+        linea.save()
+        self.pedido.refresh_from_db()
+        self.assertEqual(self.pedido.total, 75)
+
+        # Borrar el producto se lleva sus líneas en cascada
+        self.prod3.delete()
+        self.pedido.refresh_from_db()
+        self.assertEqual(self.pedido.total, 40)
+
+        PedidoProducto.objects.filter(pedido=self.pedido).delete()
+        self.pedido.refresh_from_db()
+        self.assertEqual(self.pedido.total, 0)
+
+    def test_cambio_de_precio_no_altera_pedidos_antiguos(self):
+        """Caso Lógica: El precio se congela al añadir el producto."""
+        self.pedido.agregar_producto(self.prod2, 1)
+        self.prod2.precio = 99
+        self.prod2.save()
+
+        self.pedido.agregar_producto(self.prod2, 1)
+        self.pedido.refresh_from_db()
+        linea = self.pedido.pedidoproducto_set.get()
+        self.assertEqual(linea.precio_unitario, 20)
+        self.assertEqual(self.pedido.calcular_total(), 40)
+
+    def test_admin_inline_recalcula_total(self):
+        """Caso Positivo: Editar las líneas desde el admin actualiza el total."""
+        admin = User.objects.create_superuser(email='admin@test.com', nombre='Admin', password='pass')
+        self.client.force_login(admin)
+        pp = self.pedido.agregar_producto(self.prod1, 1)
+
+        url = reverse('admin:pedidos_pedido_change', args=[self.pedido.id])
+        self.client.post(url, {
+            'usuario': self.vip_user.id,
+            'fecha_pedido_0': '2025-01-01', 'fecha_pedido_1': '10:00:00',
+            'estado': 'P',
+            'pedidoproducto_set-TOTAL_FORMS': '2', 'pedidoproducto_set-INITIAL_FORMS': '1',
+            'pedidoproducto_set-MIN_NUM_FORMS': '0', 'pedidoproducto_set-MAX_NUM_FORMS': '1000',
+            'pedidoproducto_set-0-id': pp.id, 'pedidoproducto_set-0-pedido': self.pedido.id,
+            'pedidoproducto_set-0-producto': self.prod1.id, 'pedidoproducto_set-0-cantidad': '3',
+            'pedidoproducto_set-0-precio_unitario': '10.00',
+            'pedidoproducto_set-1-pedido': self.pedido.id,
+            'pedidoproducto_set-1-producto': self.prod2.id, 'pedidoproducto_set-1-cantidad': '1',
+            'pedidoproducto_set-1-precio_unitario': '',
+        })
+
+        self.pedido.refresh_from_db()
+        self.assertEqual(self.pedido.total, 50)
+
+
+# --- 9. TESTS DEL HISTORIAL PAGINADO ---
+class HistorialPedidosTests(PedidosBaseTest):
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+
+    def crear_pedidos(self, n):
+        for _ in range(n):
+            pedido = Pedido.objects.create(usuario=self.user, estado='R')
+            pedido.agregar_producto(self.prod1, 1)
+            pedido.agregar_producto(self.prod2, 2)
+
+    def contar_consultas(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('mis_pedidos'))
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_numero_de_consultas_constante(self):
+        """Caso Rendimiento: Las consultas no crecen con el número de pedidos."""
+        self.crear_pedidos(2)
+        pocas = self.contar_consultas()
+        self.crear_pedidos(30)
+        self.assertEqual(self.contar_consultas(), pocas)
+
+    def test_recorrer_paginas_sin_repetir_ni_saltar(self):
+        """Caso Positivo: Siguiendo el cursor se ven todos los pedidos una sola vez, del más reciente al más antiguo."""
+        self.crear_pedidos(23)
+        vistos, url = [], reverse('mis_pedidos')
+        while url:
+            response = self.client.get(url)
+            vistos += [p.id for p in response.context['pedidos']]
+            cursor = response.context['cursor_siguiente']
+            url = f"{reverse('mis_pedidos')}?antes={cursor}" if cursor else None
+
+        esperados = list(Pedido.objects.filter(usuario=self.user).order_by('-fecha_pedido', '-id').values_list('id', flat=True))
+        self.assertEqual(vistos, esperados)
+
+    def test_cursor_invalido_muestra_primera_pagina(self):
+        """Caso Negativo: Un cursor manipulado no rompe la página."""
+        self.crear_pedidos(1)
+        response = self.client.get(reverse('mis_pedidos'), {'antes': 'basura'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['pedidos']), 1)
+
+
+# --- 10. TESTS DE LA CACHÉ DE RESPUESTAS ---
+class CacheRespuestasTests(PedidosBaseTest):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        obtener_cache_respuestas().limpiar()
+        self.otro_vip = User.objects.create_user(email='vip2@test.com', nombre='Otro VIP', telefono='700000001', password='pass', is_vip=True)
+        for usuario in (self.vip_user, self.otro_vip):
+            Pedido.objects.create(usuario=usuario, estado='B')
+
+    def test_una_sola_cache_por_proceso(self):
+        """Caso Lógica: Varios hilos que piden la caché a la vez reciben la misma instancia."""
+        from . import cache_respuestas
+        creada = cache_respuestas.CacheRespuestas
+
+        def lenta(*args):
+            time.sleep(0.05)
+            return creada(*args)
+
+        recibidas = []
+        with patch.object(cache_respuestas, '_cache', None), patch.object(cache_respuestas, 'CacheRespuestas', side_effect=lenta):
+            hilos = [threading.Thread(target=lambda: recibidas.append(obtener_cache_respuestas())) for _ in range(4)]
+            for hilo in hilos:
+                hilo.start()
+            for hilo in hilos:
+                hilo.join()
+
+        self.assertEqual(len(recibidas), 4)
+        self.assertEqual(len({id(c) for c in recibidas}), 1)
+
+    def test_clave_normaliza_y_distingue_contexto(self):
+        """Caso Lógica: '¡Sí!' y 'si' comparten clave; otro carrito u otro historial no."""
+        vacio = {'items': []}
+        sin_historial = contexto.ensamblar_contexto(self.vip_user.id, [])
+        base = clave_respuesta('¡Sí!', 'v1', vacio, sin_historial)
+        self.assertEqual(base, clave_respuesta('si', 'v1', vacio, sin_historial))
+        self.assertNotEqual(base, clave_respuesta('si', 'v2', vacio, sin_historial))
+        carrito = {'items': [{'id_producto': 1, 'cantidad': 1, 'precio_unitario': 10.0}]}
+        self.assertNotEqual(base, clave_respuesta('si', 'v1', carrito, sin_historial))
+        historial = [{'remitente': 'bot', 'contenido': '¿Confirmo el pedido?', 'n': 1}]
+        self.assertNotEqual(base, clave_respuesta('si', 'v1', vacio, contexto.ensamblar_contexto(self.vip_user.id, historial)))
+
+    def test_clave_incluye_el_resumen(self):
+        """Caso Negativo: Dos usuarios con los mismos últimos turnos pero distinta conversación anterior no comparten respuesta."""
+        recientes = [
+            {'remitente': 'usuario' if i % 2 == 0 else 'bot', 'contenido': f'mensaje {i}', 'n': i + 3}
+            for i in range(6)
+        ]
+        claves = set()
+        for usuario, antiguo in ((self.vip_user, 'quiero proteína'), (self.otro_vip, 'soy alérgico a la lactosa')):
+            historial = [{'remitente': 'usuario', 'contenido': antiguo, 'n': 1},
+                         {'remitente': 'bot', 'contenido': 'Anotado.', 'n': 2}] + recientes
+            claves.add(clave_respuesta('si', 'v1', {'items': []}, contexto.ensamblar_contexto(usuario.id, historial)))
+        self.assertEqual(len(claves), 2)
+
+    @patch('pedidos.gemini_utils.obtener_cliente')
+    def test_turno_repetido_no_llama_al_modelo(self, mock_cliente):
+        """Caso Rendimiento: El mismo turno en el mismo contexto se sirve desde la caché."""
+        mock_cliente.return_value.generar_json.return_value = {
+            "texto_respuesta": "¡Hola! ¿Qué te apetece?", "acciones": [], "finalizar_pedido": False
+        }
+
+        primera = obtener_respuesta_gemini('Hola', SimpleNamespace(user=self.vip_user))
+        segunda = obtener_respuesta_gemini('hola', SimpleNamespace(user=self.otro_vip))
+
+        self.assertEqual(mock_cliente.return_value.generar_json.call_count, 1)
+        self.assertEqual(segunda['texto_respuesta'], primera['texto_respuesta'])
+        # Cada usuario conserva su propio historial
+        self.assertEqual(segunda['historial'][0]['contenido'], 'hola')
+        estadisticas = obtener_cache_respuestas().estadisticas()
+        self.assertEqual((estadisticas['aciertos'], estadisticas['fallos']), (1, 1))
+
+    @patch('pedidos.gemini_utils.obtener_cliente')
+    def test_cambio_de_carrito_invalida(self, mock_cliente):
+        """Caso Negativo: Con otro carrito la respuesta guardada no se reutiliza."""
+        mock_cliente.return_value.generar_json.return_value = {
+            "texto_respuesta": "Perfecto.", "acciones": [], "finalizar_pedido": False
+        }
+
+        obtener_respuesta_gemini('me lo pienso', SimpleNamespace(user=self.vip_user))
+        Pedido.objects.get(usuario=self.otro_vip, estado='B').agregar_producto(self.prod1)
+        obtener_respuesta_gemini('me lo pienso', SimpleNamespace(user=self.otro_vip))
+
+        self.assertEqual(mock_cliente.return_value.generar_json.call_count, 2)
+
+
+# --- 11. TESTS DEL ATAJO LOCAL (SIN GEMINI) ---
+class IntencionesPedidoTests(PedidosBaseTest):
+
+    def test_agregar_con_cantidad(self):
+        """Caso Positivo: 'Añade 2 de batido de fresa' se resuelve en local con el nombre exacto."""
+        res = interpretar_mensaje('Añade 2 de batido de fresa', {'items': []})
+        self.assertEqual(res['acciones'], [{"tipo": "agregar", "producto_nombre": "Batido Fresa", "cantidad": 2}])
+
+    def test_quitar_solo_si_esta_en_el_carrito(self):
+        """Caso Lógica: 'quita el té verde' sin cantidad quita la línea entera; si no está en el carrito decide Gemini."""
+        carrito = {'items': [{'id_producto': self.prod2.id, 'cantidad': 3, 'precio_unitario': 20.0}]}
+        res = interpretar_mensaje('quita el té verde', carrito)
+        self.assertEqual(res['acciones'], [{"tipo": "eliminar", "producto_nombre": "Té Verde", "cantidad": 0}])
+        self.assertIsNone(interpretar_mensaje('quita el té verde', {'items': []}))
+
+    def test_mensajes_ambiguos_van_a_gemini(self):
+        """Caso Negativo: Lo que no es una orden clara no se interpreta en local."""
+        for mensaje in ['quiero algo para dormir', '¿cuánto cuesta el aloe?', 'pon uno de eso', 'sí']:
+            self.assertIsNone(interpretar_mensaje(mensaje, {'items': []}), mensaje)
+
+    def test_confirmar_pedido(self):
+        """Caso Positivo: 'Confirmar pedido' finaliza sin pasar por el modelo."""
+        self.assertTrue(interpretar_mensaje('Confirmar pedido, por favor', {'items': []})['finalizar_pedido'])
+
+    @patch('pedidos.gemini_utils.obtener_cliente')
+    def test_atajo_no_llama_al_modelo(self, mock_cliente):
+        """Caso Rendimiento: El recorrido completo de una orden clara no toca Gemini."""
+        cache.clear()
+        self.client.force_login(self.vip_user)
+        self.client.get(reverse('chatbot_pedidos'))
+        self.client.post(reverse('procesar_mensaje_pedido'), {'mensaje': 'ponme 3 aloe vera'}, content_type='application/json')
+
+        pedido = Pedido.objects.get(usuario=self.vip_user, estado='B')
+        self.assertEqual(pedido.pedidoproducto_set.get(producto=self.prod1).cantidad, 3)
+        mock_cliente.assert_not_called()
+
+
+@override_settings(NOTIFICACIONES={'MODO': 'sincrono'})
+class AvisosPedidoTests(PedidosBaseTest):
+    '''
+    Pruebas de los correos de pedido, que se preparan al confirmar la transacción.
+    '''
+    def test_correo_con_el_carrito_confirmado(self):
+        """Caso Positivo: El aviso se prepara una vez y con las líneas añadidas después de guardar."""
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                pedido = Pedido.objects.create(usuario=self.user, estado='P')
+                pedido.agregar_producto(self.prod1, 2)
+                pedido.save()
+                pedido.agregar_producto(self.prod3)
+                pedido.save()
+
+        self.assertEqual(len(mail.outbox), 2)
+        for correo in mail.outbox:
+            self.assertIn("Aloe Vera", correo.body)
+            self.assertIn("Batido Fresa", correo.body)
+            self.assertIn("55,00", correo.body)
+
+    def test_resumen_y_plantillas_sin_consultas(self):
+        """Caso Rendimiento: Con el resumen del pedido, los dos correos (texto y HTML) no hacen consultas."""
+        pedido = Pedido.objects.create(usuario=self.user, estado='P')
+        pedido.agregar_producto(self.prod1, 2)
+        pedido.agregar_producto(self.prod2)
+        self.user.nombre = 'Ana <b>'
+        self.user.save()
+
+        with self.assertNumQueries(2):
+            resumen = resumen_pedido(pedidos_para_aviso([pedido.id]).get())
+        with self.assertNumQueries(0):
+            admin, cliente = correos_nuevo_pedido(resumen)
+
+        self.assertIn("- 2 x Aloe Vera (20,00 €)", admin['cuerpo'])
+        self.assertIn("TOTAL DEL PEDIDO: 40,00 €", cliente['cuerpo'])
+        self.assertIn(f"/admin/pedidos/pedido/{pedido.id}/change/", admin['cuerpo_html'])
+        # El HTML escapa lo que escribe el cliente; el texto plano no
+        self.assertIn("Ana &lt;b&gt;", cliente['cuerpo_html'])
+        self.assertIn("Hola Ana <b>,", cliente['cuerpo'])
+
+    def test_sin_correo_si_se_deshace(self):
+        """Caso Negativo: Un pedido cuya transacción se deshace no manda ningún correo."""
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    Pedido.objects.create(usuario=self.user, estado='P')
+                    raise ValueError("pago rechazado")
+            except ValueError:
+                pass
+        self.assertEqual(len(mail.outbox), 0)
+
+
+class TransicionesEstadoTests(PedidosBaseTest):
+    '''
+    Pruebas de la detección de cambios de estado sin releer el pedido.
+    '''
+    def setUp(self):
+        super().setUp()
+        self.cambios = []
+        pedido_estado_cambiado.connect(self.registrar, sender=Pedido)
+        self.addCleanup(pedido_estado_cambiado.disconnect, self.registrar, sender=Pedido)
+
+    def registrar(self, sender, instance, anterior, nuevo, **kwargs):
+        self.cambios.append((instance.id, anterior, nuevo))
+
+    def test_cambio_de_estado_sin_consulta_extra(self):
+        """Caso Rendimiento: Marcar un pedido cargado como Realizado es un solo UPDATE y avisa del cambio."""
+        pedido_id = Pedido.objects.create(usuario=self.user, estado='P').id
+        pedido = Pedido.objects.get(id=pedido_id)
+
+        pedido.estado = 'R'
+        with self.assertNumQueries(1):
+            pedido.save()
+        self.assertEqual(self.cambios, [(pedido_id, 'P', 'R')])
+
+        # Guardar otra vez sin cambios no repite el aviso
+        pedido.save()
+        self.assertEqual(len(self.cambios), 1)
+
+    def test_crear_no_es_una_transicion(self):
+        """Caso Lógica: Crear un pedido no envía la señal; el primer cambio posterior sí."""
+        pedido = Pedido.objects.create(usuario=self.user, estado='B')
+        self.assertEqual(self.cambios, [])
+
+        pedido.estado = 'P'
+        pedido.save()
+        pedido.estado = 'C'
+        pedido.save(update_fields=['total'])  # el estado no se guarda: no hay transición
+        self.assertEqual(self.cambios, [(pedido.id, 'B', 'P')])
+        self.assertEqual(pedido.valor_guardado('estado'), 'P')
+
+
+@override_settings(NOTIFICACIONES={'MODO': 'comando'})
+class TransicionesMasivasTests(PedidosBaseTest):
+    '''
+    Pruebas del cambio de estado en bloque (acciones y columna editable del admin).
+    '''
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_superuser(email='admin@test.com', nombre='Admin', password='pass')
+
+    def crear_pedidos(self, n, estado='P'):
+        pedidos = Pedido.objects.bulk_create([Pedido(usuario=self.user, estado=estado) for _ in range(n)])
+        PedidoProducto.objects.bulk_create([
+            PedidoProducto(pedido=pedido, producto=self.prod1, cantidad=1, precio_unitario=self.prod1.precio)
+            for pedido in pedidos
+        ])
+        return [pedido.id for pedido in pedidos]
+
+    def test_500_pedidos_en_bloque(self):
+        """Caso Rendimiento: Marcar 500 pedidos como Realizados no hace consultas por pedido y encola un correo por cada uno."""
+        ids = self.crear_pedidos(500)
+        ya_realizados = self.crear_pedidos(5, estado='R')
+
+        with CaptureQueriesContext(connection) as consultas:
+            with self.captureOnCommitCallbacks(execute=True):
+                cambiados = cambiar_estado_pedidos(Pedido.objects.all(), 'R')
+
+        self.assertEqual(sorted(cambiados), ids)
+        # UPDATE + pedidos con cliente + líneas con producto; el resto son los INSERT en lote de los correos
+        no_inserts = [q for q in consultas.captured_queries if not q['sql'].startswith('INSERT')]
+        self.assertEqual(len(no_inserts), 3)
+        self.assertEqual(Pedido.objects.filter(estado='R').count(), 505)
+        correos = CorreoSaliente.objects.filter(clave__endswith=':realizado')
+        self.assertEqual(correos.count(), 500)
+        self.assertFalse(correos.filter(clave__in=[f"pedido:{i}:realizado" for i in ya_realizados]).exists())
+        self.assertIn("Aloe Vera", correos.first().cuerpo)
+
+    def test_accion_admin(self):
+        """Caso Positivo: La acción del admin cambia los seleccionados y encola sus correos."""
+        ids = self.crear_pedidos(3)
+        self.client.force_login(self.admin)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('admin:pedidos_pedido_changelist'), {
+                'action': 'marcar_como_realizado', '_selected_action': ids[:2],
+            })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(list(Pedido.objects.filter(estado='R').values_list('id', flat=True).order_by('id')), ids[:2])
+        self.assertEqual(CorreoSaliente.objects.filter(clave__endswith=':realizado').count(), 2)
+
+    def test_columna_editable(self):
+        """Caso Positivo: Cambiar el estado desde el listado usa el servicio y avisa al cliente."""
+        pedido_id = self.crear_pedidos(1)[0]
+        self.client.force_login(self.admin)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('admin:pedidos_pedido_changelist'), {
+                'form-TOTAL_FORMS': '1', 'form-INITIAL_FORMS': '1',
+                'form-MIN_NUM_FORMS': '0', 'form-MAX_NUM_FORMS': '1000',
+                'form-0-id': str(pedido_id), 'form-0-estado': 'R', '_save': 'Guardar',
+            })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Pedido.objects.get(id=pedido_id).estado, 'R')
+        self.assertTrue(CorreoSaliente.objects.filter(clave=f"pedido:{pedido_id}:realizado").exists())
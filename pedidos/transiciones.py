@@ -0,0 +1,24 @@
+from nutrisur.transiciones import actualizar_estado
+from notificaciones.eventos import al_confirmar_en_lote
+from .models import Pedido
+from .signals import notificar_nuevos_pedidos, notificar_pedidos_realizados
+
+# Avisos que lleva cada estado de destino (los mismos que al guardar un pedido uno a uno)
+AVISOS_POR_ESTADO = {
+    'P': notificar_nuevos_pedidos,
+    'R': notificar_pedidos_realizados,
+}
+
+
+def cambiar_estado_pedidos(pedidos, estado):
+    """
+    Pasa a 'estado' los pedidos (queryset o lista de ids) que no lo tengan ya, con un
+    solo UPDATE, y programa para cuando se confirme la transacción los avisos de los
+    que han cambiado, todos en un lote. Devuelve los ids cambiados.
+    """
+    if not hasattr(pedidos, 'query'):
+        pedidos = Pedido.objects.filter(pk__in=list(pedidos))
+    ids = actualizar_estado(pedidos, estado)
+    if ids and estado in AVISOS_POR_ESTADO:
+        al_confirmar_en_lote(AVISOS_POR_ESTADO[estado], ids)
+    return ids
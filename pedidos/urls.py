@@ -6,6 +6,7 @@ urlpatterns = [
     
     path('nuevo-pedido', views.chatbot_view, name="chatbot_pedidos"),
     path('procesar-mensaje-pedido', views.procesar_mensaje_view, name="procesar_mensaje_pedido"),
+    path('procesar-mensaje-pedido/stream', views.procesar_mensaje_stream_view, name="procesar_mensaje_pedido_stream"),
     path('api/actualizar-cantidad/', views.actualizar_cantidad_view, name="actualizar_cantidad"),
     path('cancelar/<int:pedido_id>/', views.cancelar_pedido_view, name='cancelar_pedido'),
     path('modificar/<int:pedido_id>/', views.modificar_pedido_view, name='modificar_pedido'),
@@ -1,13 +1,21 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from django.db.models import Prefetch
 from .models import Pedido, PedidoProducto
 from productos.models import Producto
 from django.http import JsonResponse
 from django.views.decorators.http import require_POST
-from .gemini_utils import obtener_respuesta_gemini, get_data_pedido
+from .gemini_utils import obtener_respuesta_gemini, get_data_pedido, preparar_turno, cerrar_turno, RESPUESTA_ERROR, ESQUEMA_RESPUESTA
+from productos.buscador import obtener_indice
+from .carrito import aplicar_acciones
+from .paginacion import pagina_por_cursor
+from nutrisur.llm import obtener_cliente, ExtractorTexto, evento_sse, respuesta_sse
+from asgiref.sync import sync_to_async
 import json
 
+PEDIDOS_POR_PAGINA = 10
+
 # Create your views here.
 
 @login_required
@@ -17,13 +25,20 @@ def lista_pedidos_view(request):
     pertenecientes al usuario logueado.
     """
     
-    # 1. Filtramos los pedidos para obtener SOLO los del usuario actual
-    # 2. Ordenamos del más reciente al más antiguo
-    pedidos = Pedido.objects.filter(usuario=request.user).order_by('-fecha_pedido')
+    # 1. Filtramos los pedidos para obtener SOLO los del usuario actual,
+    #    con las líneas y sus productos en una sola consulta extra
+    pedidos = Pedido.objects.filter(usuario=request.user).prefetch_related(
+        Prefetch('pedidoproducto_set', queryset=PedidoProducto.objects.select_related('producto'))
+    )
+    
+    # 2. Del más reciente al más antiguo, página a página (cursor en ?antes=)
+    pedidos, siguiente = pagina_por_cursor(pedidos, request.GET.get('antes'), PEDIDOS_POR_PAGINA)
     
     # 3. Pasamos los pedidos a la plantilla
     context = {
-        'pedidos': pedidos
+        'pedidos': pedidos,
+        'cursor_siguiente': siguiente,
+        'es_primera_pagina': not request.GET.get('antes'),
     }
     return render(request, 'pedidos/pedidos.html', context)
 
@@ -37,10 +52,13 @@ def chatbot_view(request):
         # Y lo redirigimos a la página de opciones de compra (o donde prefieras)
         return redirect('opciones_compra') 
     
-    pedido = Pedido.objects.get_or_create(
+    Pedido.objects.get_or_create(
         usuario = request.user,
         estado = 'B'
     )
+    pedido = Pedido.objects.prefetch_related(
+        Prefetch('pedidoproducto_set', queryset=PedidoProducto.objects.select_related('producto'))
+    ).get(usuario=request.user, estado='B')
 
     productos_recientes_ids = request.user.historial_productos
     productos_recientes = []
@@ -70,18 +88,11 @@ def actualizar_cantidad_view(request):
         pedido = Pedido.objects.get(usuario=request.user, estado='B')
         producto = get_object_or_404(Producto, id=id_producto)
         
-        # Buscamos la relación (item del pedido)
-        pp, created = PedidoProducto.objects.get_or_create(pedido=pedido, producto=producto)
-        
+        # Sumamos o restamos una unidad (si baja de 1, la línea se borra)
         if accion == 'incrementar':
-            pp.cantidad += 1
-            pp.save()
+            aplicar_acciones(pedido, [('agregar', producto.id, 1)])
         elif accion == 'decrementar':
-            if pp.cantidad > 1:
-                pp.cantidad -= 1
-                pp.save()
-            else:
-                pp.delete() # Si baja de 1, lo borramos
+            aplicar_acciones(pedido, [('eliminar', producto.id, 1)])
         
         # Devolvemos los datos actualizados usando nuestra función auxiliar
         response_data = get_data_pedido(pedido)
@@ -132,6 +143,50 @@ def modificar_pedido_view(request, pedido_id):
     messages.info(request, f"Estás editando el pedido #{pedido_a_modificar.id}.")
     return redirect('chatbot_pedidos')
 
+def aplicar_respuesta(usuario, pedido, respuesta_ai):
+    """
+    Aplica al pedido la respuesta del chatbot (venga de Gemini, de la caché o del atajo
+    local) y devuelve los datos que necesita la página: items, total, estado y texto.
+    """
+    texto_bot = respuesta_ai.get("texto_respuesta", "No te he entendido bien.")
+    acciones = respuesta_ai.get("acciones", [])
+    finalizar = respuesta_ai.get("finalizar_pedido", False)
+    
+    # --- RESOLVER PRODUCTOS ---
+    # El índice del catálogo vive en memoria: resolver los nombres no cuesta consultas
+    indice = obtener_indice()
+    resueltas = []
+    for accion in acciones:
+        coincidencia = indice.mejor(accion.get("producto_nombre"))
+        if coincidencia:
+            resueltas.append((accion.get("tipo"), coincidencia['id'], int(accion.get("cantidad", 1))))
+
+    # --- EJECUTAR ACCIONES ---
+    # Todas las acciones del mensaje se aplican juntas en una sola transacción
+    aplicar_acciones(pedido, resueltas)
+
+    # --- MANEJAR FINALIZACIÓN ---
+    status_respuesta = 'ok'
+    if finalizar:
+        if pedido.pedidoproducto_set.exists():
+            pedido.estado = 'P' # Pasamos a Pendiente
+            pedido.save()
+
+            #Actualizar historial del usuario
+            ids_pedidos = list(pedido.pedidoproducto_set.values_list('producto_id', flat=True))
+            usuario.registrar_compra(ids_pedidos)
+
+            status_respuesta = 'finalizado'
+            texto_bot = "¡Pedido confirmado! Gracias por tu compra en NutriSur. Para recibir su pedido, haga bizum al 123456789 con su nombre completo en el concepto."
+        else:
+            texto_bot = "No tienes productos en el carrito para confirmar."
+
+    response_data = get_data_pedido(pedido) # Obtenemos items y total actualizado
+    response_data['status'] = status_respuesta
+    response_data['respuesta_bot'] = texto_bot
+    return response_data
+
+
 @login_required
 @require_POST
 def procesar_mensaje_view(request):
@@ -147,58 +202,60 @@ def procesar_mensaje_view(request):
 
         # --- LLAMADA A GEMINI ---
         respuesta_ai = obtener_respuesta_gemini(mensaje_usuario, request)
-        
-        texto_bot = respuesta_ai.get("texto_respuesta", "No te he entendido bien.")
-        acciones = respuesta_ai.get("acciones", [])
-        finalizar = respuesta_ai.get("finalizar_pedido", False)
-        
-        # --- EJECUTAR ACCIONES ---
-        for accion in acciones:
-            tipo = accion.get("tipo")
-            nombre_prod = accion.get("producto_nombre") # Recibimos NOMBRE
-            cantidad = int(accion.get("cantidad", 1))
-            
-            if nombre_prod:
-                # --- CAMBIO: Búsqueda por nombre aproximado ---
-                # 'icontains' busca si el texto está contenido en el nombre (mayúsculas/minúsculas ignoradas)
-                producto = Producto.objects.filter(nombre__icontains=nombre_prod).first()
-                
-                if producto:
-                    if tipo == "agregar":
-                        pedido.agregar_producto(producto, cantidad)
-                    
-                    elif tipo == "eliminar":
-                        pp = PedidoProducto.objects.filter(pedido=pedido, producto=producto).first()
-                        if pp:
-                            # Si cantidad es 0 (orden de "borrar todo") o si la resta deja < 0
-                            if cantidad == 0 or (pp.cantidad - cantidad) <= 0:
-                                pp.delete()
-                            else:
-                                pp.cantidad -= cantidad
-                                pp.save()
-
-        # --- MANEJAR FINALIZACIÓN ---
-        status_respuesta = 'ok'
-        if finalizar:
-            if pedido.pedidoproducto_set.exists():
-                pedido.estado = 'P' # Pasamos a Pendiente
-                pedido.save()
-
-                #Actualizar historial del usuario
-                ids_pedidos = [p.producto.id for p in pedido.pedidoproducto_set.all()]
-                request.user.registrar_compra(ids_pedidos)
-
-                status_respuesta = 'finalizado'
-                texto_bot = "¡Pedido confirmado! Gracias por tu compra en NutriSur. Para recibir su pedido, haga bizum al 123456789 con su nombre completo en el concepto."
-            else:
-                texto_bot = "No tienes productos en el carrito para confirmar."
 
-        response_data = get_data_pedido(pedido) # Obtenemos items y total actualizado
-        response_data['status'] = status_respuesta
-        response_data['respuesta_bot'] = texto_bot
-
-        return JsonResponse(response_data)
+        return JsonResponse(aplicar_respuesta(request.user, pedido, respuesta_ai))
 
     except Exception as e:
         print(f"Error en vista: {e}")
         return JsonResponse({'status': 'error', 'respuesta_bot': 'Error interno del servidor.'}, status=500)
+
+
+@login_required
+@require_POST
+async def procesar_mensaje_stream_view(request):
+    """
+    Igual que procesar_mensaje_view pero con Server-Sent Events: envía 'texto_respuesta'
+    a trozos según lo escribe el modelo (eventos 'texto') y al final el estado del
+    carrito (evento 'fin', con los mismos datos que la vista JSON).
+    """
+    usuario = await request.auser()
+    try:
+        mensaje_usuario = json.loads(request.body).get('mensaje', '')
+    except ValueError:
+        mensaje_usuario = ''
+
+    async def eventos():
+        try:
+            pedido, _ = await Pedido.objects.aget_or_create(usuario=usuario, estado='B')
+            turno = await sync_to_async(preparar_turno)(mensaje_usuario, usuario)
+            respuesta_ai = turno['respuesta']
+
+            if respuesta_ai is None:
+                extractor = ExtractorTexto()
+                trozos = []
+                try:
+                    async for trozo in obtener_cliente().agenerar_stream(turno['prompt'], esquema=ESQUEMA_RESPUESTA):
+                        trozos.append(trozo)
+                        texto = extractor.alimentar(trozo)
+                        if texto:
+                            yield evento_sse('texto', {'texto': texto})
+                    respuesta_ai = await obtener_cliente().avalidar_o_repreguntar(
+                        ''.join(trozos), turno['prompt'], ESQUEMA_RESPUESTA
+                    )
+                except Exception as e:
+                    print(f"Error Gemini: {e}")
+                    respuesta_ai = dict(RESPUESTA_ERROR)
+                else:
+                    respuesta_ai = await sync_to_async(cerrar_turno)(turno, respuesta_ai)
+            else:
+                respuesta_ai = await sync_to_async(cerrar_turno)(turno, respuesta_ai)
+                yield evento_sse('texto', {'texto': respuesta_ai.get('texto_respuesta', '')})
+
+            datos = await sync_to_async(aplicar_respuesta)(usuario, pedido, respuesta_ai)
+            yield evento_sse('fin', datos)
+
+        except Exception as e:
+            print(f"Error en vista: {e}")
+            yield evento_sse('fin', {'status': 'error', 'respuesta_bot': 'Error interno del servidor.'})
+
+    return respuesta_sse(eventos())
@@ -0,0 +1,116 @@
+import re
+import unicodedata
+from collections import defaultdict
+from .catalogo import obtener_catalogo
+
+# Palabras que no ayudan a distinguir productos ("quiero un batido DE fresa")
+PALABRAS_VACIAS = {'de', 'del', 'la', 'el', 'los', 'las', 'con', 'y', 'un', 'una', 'unos', 'unas', 'al'}
+
+# Por debajo de esta puntuación consideramos que el producto no está en el catálogo
+PUNTUACION_MINIMA = 0.45
+
+
+def normalizar(texto):
+    """Minúsculas, sin tildes y sin signos: 'Té Verde!' -> 'te verde'."""
+    texto = unicodedata.normalize('NFKD', str(texto or ''))
+    texto = ''.join(c for c in texto if not unicodedata.combining(c)).lower()
+    return ' '.join(re.findall(r'[a-z0-9]+', texto))
+
+
+def tokens(texto_normalizado):
+    return [t for t in texto_normalizado.split() if t not in PALABRAS_VACIAS]
+
+
+def trigramas(texto_normalizado):
+    relleno = f"  {texto_normalizado} "
+    return {relleno[i:i + 3] for i in range(len(relleno) - 2)}
+
+
+def _tokens_coinciden(a, b):
+    # 'batidos' encaja con 'batido' y 'fres' con 'fresa'
+    return a == b or (min(len(a), len(b)) >= 3 and (a.startswith(b) or b.startswith(a)))
+
+
+class IndiceProductos:
+    """
+    Índice en memoria de los nombres del catálogo. Puntúa cada candidato por
+    cobertura de palabras y similitud de trigramas, y devuelve los resultados
+    ordenados de forma determinista (puntuación, nombre más corto, id).
+    """
+
+    def __init__(self, productos, version=None):
+        self.version = version
+        self.productos = list(productos)
+        self._nombres = []
+        self._tokens = []
+        self._trigramas = []
+        self._por_trigrama = defaultdict(set)
+
+        for posicion, producto in enumerate(self.productos):
+            nombre = normalizar(producto['nombre'])
+            self._nombres.append(nombre)
+            self._tokens.append(tokens(nombre))
+            grams = trigramas(nombre)
+            self._trigramas.append(grams)
+            for gram in grams:
+                self._por_trigrama[gram].add(posicion)
+
+    def _puntuar(self, posicion, consulta, tokens_consulta, grams_consulta):
+        nombre = self._nombres[posicion]
+        if nombre == consulta:
+            return 1.0
+
+        tokens_nombre = self._tokens[posicion]
+        if tokens_consulta:
+            cubiertos = sum(1 for t in tokens_consulta if any(_tokens_coinciden(t, n) for n in tokens_nombre))
+            cobertura = cubiertos / len(tokens_consulta)
+        else:
+            cobertura = 0.0
+
+        grams_nombre = self._trigramas[posicion]
+        similitud = 2 * len(grams_consulta & grams_nombre) / (len(grams_consulta) + len(grams_nombre))
+
+        puntuacion = 0.6 * cobertura + 0.4 * similitud
+        if consulta in nombre:
+            puntuacion += 0.1
+        return min(puntuacion, 0.99)
+
+    def buscar(self, texto, limite=5):
+        """Devuelve [(puntuacion, producto), ...] de mayor a menor coincidencia."""
+        consulta = normalizar(texto)
+        if not consulta:
+            return []
+
+        tokens_consulta = tokens(consulta)
+        grams_consulta = trigramas(consulta)
+        candidatos = set()
+        for gram in grams_consulta:
+            candidatos |= self._por_trigrama.get(gram, set())
+
+        resultados = []
+        for posicion in candidatos:
+            puntuacion = self._puntuar(posicion, consulta, tokens_consulta, grams_consulta)
+            producto = self.productos[posicion]
+            resultados.append((puntuacion, len(self._nombres[posicion]), producto['id'], producto))
+
+        resultados.sort(key=lambda r: (-r[0], r[1], r[2]))
+        return [(round(r[0], 4), r[3]) for r in resultados[:limite]]
+
+    def mejor(self, texto, minimo=PUNTUACION_MINIMA):
+        """El producto que mejor encaja con el texto, o None si ninguno supera el mínimo."""
+        resultados = self.buscar(texto, limite=1)
+        if resultados and resultados[0][0] >= minimo:
+            return resultados[0][1]
+        return None
+
+
+_indice = None
+
+
+def obtener_indice():
+    """Índice del catálogo vigente. Solo se reconstruye cuando cambia la versión del catálogo."""
+    global _indice
+    catalogo = obtener_catalogo()
+    if _indice is None or _indice.version != catalogo['version']:
+        _indice = IndiceProductos(catalogo['productos'], version=catalogo['version'])
+    return _indice
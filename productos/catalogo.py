@@ -0,0 +1,73 @@
+import uuid
+from django.conf import settings
+from django.core.cache import cache
+from .models import Producto
+
+CLAVE_VERSION = 'catalogo:version'
+CLAVE_INSTANTANEA = 'catalogo:instantanea:{version}'
+
+# Copia local de la última instantánea leída, para no ir ni siquiera a la caché
+# compartida mientras la versión no cambie.
+_ultima_instantanea = None
+
+
+def version_catalogo():
+    """
+    Devuelve la versión actual del catálogo. Si la caché no tiene ninguna
+    (arranque en frío o expulsión), se genera una nueva.
+    """
+    version = cache.get(CLAVE_VERSION)
+    if version is None:
+        version = uuid.uuid4().hex
+        # add() evita pisar la versión que otro worker haya creado a la vez
+        if not cache.add(CLAVE_VERSION, version, None):
+            version = cache.get(CLAVE_VERSION, version)
+    return version
+
+
+def invalidar_catalogo():
+    """
+    Marca el catálogo como modificado. Las instantáneas antiguas quedan
+    huérfanas en la caché y caducan solas.
+    """
+    global _ultima_instantanea
+    cache.set(CLAVE_VERSION, uuid.uuid4().hex, None)
+    _ultima_instantanea = None
+
+
+def construir_instantanea(version):
+    """Lee el catálogo de la base de datos y prepara el texto para el prompt."""
+    productos = [
+        {'id': p['id'], 'nombre': p['nombre'], 'precio': p['precio']}
+        for p in Producto.objects.order_by('id').values('id', 'nombre', 'precio')
+    ]
+    texto = "\n".join([f"- ID: {p['id']}, Nombre: {p['nombre']}, Precio: {p['precio']}€" for p in productos])
+    return {
+        'version': version,
+        'texto': texto,
+        'productos': productos,
+    }
+
+
+def obtener_catalogo():
+    """
+    Devuelve la instantánea vigente del catálogo:
+    {'version': ..., 'texto': ..., 'productos': [{'id', 'nombre', 'precio'}, ...]}
+
+    Solo se consulta la base de datos cuando la versión ha cambiado y ningún
+    otro proceso ha guardado todavía la instantánea en la caché.
+    """
+    global _ultima_instantanea
+    version = version_catalogo()
+
+    if _ultima_instantanea and _ultima_instantanea['version'] == version:
+        return _ultima_instantanea
+
+    clave = CLAVE_INSTANTANEA.format(version=version)
+    instantanea = cache.get(clave)
+    if instantanea is None:
+        instantanea = construir_instantanea(version)
+        cache.set(clave, instantanea, getattr(settings, 'CATALOGO_CACHE_TIMEOUT', 60 * 60 * 24))
+
+    _ultima_instantanea = instantanea
+    return instantanea
@@ -4,6 +4,7 @@ from decimal import Decimal
 from django.core.management.base import BaseCommand
 from django.conf import settings
 from productos.models import Producto
+from productos.catalogo import invalidar_catalogo
 
 class Command(BaseCommand):
     help = 'Importa productos desde un archivo CSV'
@@ -37,6 +38,9 @@ class Command(BaseCommand):
                     else:
                         self.stdout.write(self.style.WARNING(f"· Ya existe (omitido): {producto.nombre}"))
 
+            # Publicamos una versión nueva del catálogo para el chatbot
+            invalidar_catalogo()
+
             self.stdout.write(self.style.SUCCESS(f"\n¡Importación completada! Se crearon {count} nuevos productos."))
 
         except Exception as e:
@@ -0,0 +1,14 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import Producto
+from .catalogo import invalidar_catalogo
+
+
+@receiver(post_save, sender=Producto)
+@receiver(post_delete, sender=Producto)
+def invalidar_catalogo_producto(sender, instance, **kwargs):
+    # Cualquier alta, edición o borrado deja obsoleta la instantánea del catálogo.
+    # Al confirmar la transacción: antes, otra petición reconstruiría la instantánea
+    # con lo que aún no está confirmado y la guardaría con la versión nueva
+    transaction.on_commit(invalidar_catalogo)
@@ -4,10 +4,34 @@ from django.core.management import call_command
 from decimal import Decimal
 from unittest.mock import patch, mock_open
 from io import StringIO
+from django.core.cache import cache
 from .models import Producto
+from .catalogo import obtener_catalogo, version_catalogo
+from .buscador import IndiceProductos, obtener_indice, normalizar
 import os
 import builtins
 
+_open_real = builtins.open
+
+
+def open_simulado(csv_data):
+    """
+    Crea una función que simula open(). 
+    Si el archivo es 'productos.csv', devuelve el mock con nuestros datos.
+    Si es cualquier otro archivo, usa el open real.
+    """
+    def _side_effect(file, mode='r', *args, **kwargs):
+        filename = str(file)
+        
+        if 'productos.csv' in filename:
+            mock_file = mock_open(read_data=csv_data).return_value
+            return mock_file
+        
+        return _open_real(file, mode, *args, **kwargs)
+        
+    return _side_effect
+
+
 class ProductoModelTests(TestCase):
     """
     Tests enfocados en la integridad de los datos y validaciones del modelo Producto.
@@ -60,24 +84,6 @@ class CargaCSVCommandTests(TestCase):
 
     def setUp(self):
         self.out = StringIO()
-        self.original_open = builtins.open
-
-    def open_side_effect(self, csv_data):
-        """
-        Crea una función que simula open(). 
-        Si el archivo es 'productos.csv', devuelve el mock con nuestros datos.
-        Si es cualquier otro archivo, usa el open real.
-        """
-        def _side_effect(file, mode='r', *args, **kwargs):
-            filename = str(file)
-            
-            if 'productos.csv' in filename:
-                mock_file = mock_open(read_data=csv_data).return_value
-                return mock_file
-            
-            return self.original_open(file, mode, *args, **kwargs)
-            
-        return _side_effect
 
     @patch('os.path.exists')
     def test_comando_archivo_no_existe(self, mock_exists):
@@ -96,7 +102,7 @@ class CargaCSVCommandTests(TestCase):
         mock_exists.return_value = True
         csv_content = "titulo,precio,enlace\nProducto A,10.50,http://a.jpg\nProducto B,20.00,http://b.jpg"
         
-        with patch('builtins.open', side_effect=self.open_side_effect(csv_content)):
+        with patch('builtins.open', side_effect=open_simulado(csv_content)):
             call_command('cargar_productos_csv', stdout=self.out)
         
         salida = self.out.getvalue()
@@ -110,7 +116,7 @@ class CargaCSVCommandTests(TestCase):
         mock_exists.return_value = True
         csv_content = "titulo,precio,enlace\nProducto A,10.50,http://a.jpg\nProducto A,15.00,http://otra.jpg"
         
-        with patch('builtins.open', side_effect=self.open_side_effect(csv_content)):
+        with patch('builtins.open', side_effect=open_simulado(csv_content)):
             call_command('cargar_productos_csv', stdout=self.out)
         
         salida = self.out.getvalue()
@@ -124,7 +130,7 @@ class CargaCSVCommandTests(TestCase):
         mock_exists.return_value = True
         csv_content = "titulo,precio,enlace\nProducto Malo,GRATIS,http://a.jpg"
         
-        with patch('builtins.open', side_effect=self.open_side_effect(csv_content)):
+        with patch('builtins.open', side_effect=open_simulado(csv_content)):
             call_command('cargar_productos_csv', stdout=self.out)
         
         salida = self.out.getvalue()
@@ -137,8 +143,103 @@ class CargaCSVCommandTests(TestCase):
         mock_exists.return_value = True
         csv_content = "columna_inventada,otra\nDatos,MasDatos"
         
-        with patch('builtins.open', side_effect=self.open_side_effect(csv_content)):
+        with patch('builtins.open', side_effect=open_simulado(csv_content)):
             call_command('cargar_productos_csv', stdout=self.out)
         
         salida = self.out.getvalue()
-        self.assertIn("Ha ocurrido un error", salida)
\ No newline at end of file
+        self.assertIn("Ha ocurrido un error", salida)
+
+
+class CatalogoCacheTests(TestCase):
+    """
+    Tests para la instantánea del catálogo que usa el chatbot.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.prod = Producto.objects.create(nombre="Aloe Vera", precio=Decimal('10.00'))
+
+    def test_catalogo_sin_consultas_tras_primera_lectura(self):
+        """Caso Positivo: La segunda lectura del catálogo no toca la base de datos."""
+        catalogo = obtener_catalogo()
+        self.assertIn("Nombre: Aloe Vera, Precio: 10.00€", catalogo['texto'])
+
+        with self.assertNumQueries(0):
+            self.assertEqual(obtener_catalogo()['version'], catalogo['version'])
+
+    def test_catalogo_se_invalida_al_cambiar_producto(self):
+        """Caso Lógica: Editar o borrar un producto publica una versión nueva."""
+        version = obtener_catalogo()['version']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.prod.precio = Decimal('12.00')
+            self.prod.save()
+            # Hasta confirmar la transacción se sigue sirviendo la versión anterior
+            self.assertEqual(version_catalogo(), version)
+        catalogo = obtener_catalogo()
+        self.assertNotEqual(catalogo['version'], version)
+        self.assertIn("Precio: 12.00€", catalogo['texto'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.prod.delete()
+        self.assertEqual(obtener_catalogo()['productos'], [])
+
+    @patch('os.path.exists')
+    def test_comando_csv_invalida_catalogo(self, mock_exists):
+        """Caso Lógica: Tras importar el CSV el catálogo refleja los nuevos productos."""
+        mock_exists.return_value = True
+        version = version_catalogo()
+        csv_content = "titulo,precio,enlace\nProducto A,10.50,http://a.jpg"
+
+        with self.captureOnCommitCallbacks(execute=True):
+            with patch('builtins.open', side_effect=open_simulado(csv_content)):
+                call_command('cargar_productos_csv', stdout=StringIO())
+
+        self.assertNotEqual(version_catalogo(), version)
+        self.assertIn("Producto A", obtener_catalogo()['texto'])
+
+
+
+class BuscadorProductosTests(TestCase):
+    """
+    Tests para el índice de nombres que resuelve las acciones del chatbot.
+    """
+
+    def setUp(self):
+        self.indice = IndiceProductos([
+            {'id': 1, 'nombre': 'Batido Fresa', 'precio': Decimal('35.00')},
+            {'id': 2, 'nombre': 'Batido Fresa Premium', 'precio': Decimal('40.00')},
+            {'id': 3, 'nombre': 'Té Verde', 'precio': Decimal('20.00')},
+            {'id': 4, 'nombre': 'Aloe Vera', 'precio': Decimal('10.00')},
+        ])
+
+    def test_normalizacion_tildes_y_mayusculas(self):
+        """Caso Positivo: 'TE VERDE' encuentra 'Té Verde'."""
+        self.assertEqual(normalizar("¡Té  Verde!"), "te verde")
+        self.assertEqual(self.indice.mejor("TE VERDE")['id'], 3)
+
+    def test_resultados_ordenados_y_deterministas(self):
+        """Caso Lógica: Ante varias coincidencias gana la más parecida, no una cualquiera."""
+        resultados = self.indice.buscar("batidos de fresa")
+        self.assertEqual([p['id'] for _, p in resultados[:2]], [1, 2])
+        self.assertEqual(self.indice.mejor("batido fresa premium")['id'], 2)
+
+    def test_producto_inexistente(self):
+        """Caso Negativo: Un producto que no está en el catálogo no se resuelve."""
+        self.assertIsNone(self.indice.mejor("Coca Cola"))
+        self.assertIsNone(self.indice.mejor(""))
+
+    def test_indice_sin_consultas_y_reconstruido_al_cambiar_catalogo(self):
+        """Caso Lógica: El índice se reutiliza hasta que cambia el catálogo."""
+        cache.clear()
+        Producto.objects.create(nombre="Aloe Vera", precio=Decimal('10.00'))
+        indice = obtener_indice()
+
+        with self.assertNumQueries(0):
+            self.assertIs(obtener_indice(), indice)
+            self.assertEqual(indice.mejor("aloe")['nombre'], "Aloe Vera")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Producto.objects.create(nombre="Té Verde", precio=Decimal('20.00'))
+        self.assertIsNot(obtener_indice(), indice)
+        self.assertEqual(obtener_indice().mejor("te")['nombre'], "Té Verde")
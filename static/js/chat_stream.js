@@ -0,0 +1,53 @@
+// Envía un mensaje a un chatbot que responde con Server-Sent Events.
+// onTexto(trozo) recibe el texto del bot según llega (eventos 'texto');
+// la promesa se resuelve con los datos del evento final 'fin'.
+async function enviarMensajeStream(url, csrfToken, mensaje, onTexto) {
+    const response = await fetch(url, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+            'Accept': 'text/event-stream',
+            'X-CSRFToken': csrfToken
+        },
+        body: JSON.stringify({ mensaje: mensaje })
+    });
+
+    if (!response.ok || !response.body) {
+        throw new Error('Error en la respuesta del servidor');
+    }
+
+    const lector = response.body.getReader();
+    const decodificador = new TextDecoder();
+    let buffer = '';
+    let datosFinales = null;
+
+    while (true) {
+        const { value, done } = await lector.read();
+        if (done) break;
+        buffer += decodificador.decode(value, { stream: true });
+
+        // Cada evento termina con una línea en blanco
+        let separador;
+        while ((separador = buffer.indexOf('\n\n')) !== -1) {
+            const bloque = buffer.slice(0, separador);
+            buffer = buffer.slice(separador + 2);
+
+            let evento = 'message';
+            let datos = '';
+            bloque.split('\n').forEach(linea => {
+                if (linea.startsWith('event:')) evento = linea.slice(6).trim();
+                else if (linea.startsWith('data:')) datos += linea.slice(5).trim();
+            });
+            if (!datos) continue;
+
+            const payload = JSON.parse(datos);
+            if (evento === 'texto') onTexto(payload.texto);
+            else if (evento === 'fin') datosFinales = payload;
+        }
+    }
+
+    if (!datosFinales) {
+        throw new Error('La respuesta se cortó antes de terminar');
+    }
+    return datosFinales;
+}